@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask, render_template, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
@@ -11,9 +12,17 @@ app = Flask(__name__)
 
 # Configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "data", "nw.sqlite")}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "data", "nw.sqlite")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
+# Warm connections and query caches before serving the first request
+app.config['PRELOAD'] = os.environ.get('PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+# Record changes to customers, orders and order lines for /api/changes
+app.config['CHANGE_LOG'] = os.environ.get('CHANGE_LOG', 'true').lower() in ('1', 'true', 'yes')
+# Seconds between runs of the job deleting change log entries older than CHANGE_LOG_RETENTION_HOURS
+app.config['CHANGE_LOG_PRUNE_INTERVAL'] = float(os.environ.get('CHANGE_LOG_PRUNE_INTERVAL', 3600))
+# Resume background jobs interrupted by a previous shutdown
+app.config['JOBS_RESUME'] = os.environ.get('JOBS_RESUME', 'true').lower() in ('1', 'true', 'yes')
 
 # Initialize extensions
 db = SQLAlchemy(app)
@@ -25,6 +34,59 @@ from src.routes import main_routes, api_routes
 app.register_blueprint(main_routes.bp)
 app.register_blueprint(api_routes.bp, url_prefix='/api')
 
+# Profile requests on demand for admins (PROFILE_TOKEN) and a sampled fraction (PROFILE_SAMPLE_RATE)
+from src.routes.profiling import install_profiling
+install_profiling(app)
+
+if app.config['PRELOAD']:
+    from src.services.warmup import warm_up
+    warm_up()
+    # Compile templates up front as well
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
+@app.cli.command('init-db')
+def init_db():
+    """Create the indexes, change log, job table and search indexes the app relies on"""
+    from src.models.jobs import Job
+    from src.services.data_service import DATABASE_URL, DataService, ensure_indexes, get_engine
+    from src.services.search_service import CUSTOMER_INDEX, PRODUCT_INDEX
+
+    engine = get_engine(DATABASE_URL)
+    ensure_indexes(engine)
+    Job.__table__.create(engine, checkfirst=True)
+    data_service = DataService()
+    try:
+        # Installed now, changes are logged before the first feed read; CHANGE_LOG=false removes the triggers
+        capturing = data_service.change_service.ensure_log()
+        searchable = [index.name for index in (CUSTOMER_INDEX, PRODUCT_INDEX)
+                      if data_service.search_service.rebuild_index(index)]
+    finally:
+        data_service.session.close()
+    click.echo(f"Indexes and Job table ready; change capture {'on' if capturing else 'off'}; "
+               f"search indexes: {', '.join(searchable) or 'none (no FTS5)'}")
+
+def start_background_work():
+    """Start the threads the app runs beside its requests (never on import, which tools and tests do)"""
+    if app.config['CHANGE_LOG']:
+        # Keep the log bounded; consumers behind the pruned range re-read in full
+        from src.services.job_service import get_job_runner
+        get_job_runner().schedule('prune_change_log', app.config['CHANGE_LOG_PRUNE_INTERVAL'])
+
+    if app.config['JOBS_RESUME']:
+        from src.services.job_service import get_job_runner
+        get_job_runner().resume_interrupted()
+
+    if app.config['PRELOAD']:
+        # Build the approximate analytics sketches in the background, off the first ?approx=true request
+        from src.services.approx_service import get_approx_analytics
+        get_approx_analytics().start()
+
+def create_app() -> Flask:
+    """The app with its background work started, for servers: flask --app 'app:create_app()' run"""
+    start_background_work()
+    return app
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -39,5 +101,8 @@ def internal_error(error):
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
+    # The reloader runs this script twice; only its serving child starts background work
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_work()
     # Run the application
     app.run(debug=True, host='0.0.0.0', port=5002)
@@ -0,0 +1,152 @@
+"""
+Exact versus sketch-based analytics on a large synthetic order history
+
+Loads synthetic orders and Zipf-distributed order lines into a temporary
+SQLite database, then times the exact top-products, sales-by-category and
+sales-by-month queries against the ``?approx=true`` answers from
+``ApproxAnalytics``: the one-time sketch build, answers per request,
+applying newly inserted orders from the change log, and the observed
+error against the exact results next to the reported bounds.
+
+Usage:
+    python benchmarks/approx_benchmark.py [--lines 2000000] [--requests 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Category, Customer, Order, OrderDetail, Product, Supplier
+from src.services.approx_service import ApproxAnalytics
+from src.services.change_service import ChangeService
+from src.services.credit_cache import MemoryVersionStore
+from src.services.data_service import DataService
+from src.services.table_versions import TableVersions
+from src.utils.dialect import bulk_insert
+
+PRODUCTS = 2_000
+CATEGORIES = 8
+CUSTOMERS = 20_000
+LINES_PER_ORDER = 5
+
+
+def populate(connection, lines, rng):
+    """Load parents, orders and order lines with product popularity following Zipf's law"""
+    bulk_insert(connection, Supplier.__table__, [{'Id': 1, 'CompanyName': 'Supplier'}])
+    bulk_insert(connection, Category.__table__, [{'Id': i, 'CategoryName_ColumnName': f'Category {i}'}
+                                                 for i in range(1, CATEGORIES + 1)])
+    bulk_insert(connection, Product.__table__, [
+        {'Id': i, 'ProductName': f'Product {i}', 'SupplierId': 1, 'CategoryId': i % CATEGORIES + 1,
+         'UnitPrice': 10, 'UnitsInStock': 0, 'UnitsOnOrder': 0, 'ReorderLevel': 0, 'Discontinued': 0}
+        for i in range(1, PRODUCTS + 1)
+    ])
+    bulk_insert(connection, Customer.__table__, [{'Id': f'C{i:05d}', 'CompanyName': f'Customer {i}'}
+                                                 for i in range(CUSTOMERS)])
+    orders = lines // LINES_PER_ORDER
+    bulk_insert(connection, Order.__table__, (
+        {'Id': i, 'CustomerId': f'C{rng.randrange(CUSTOMERS):05d}', 'EmployeeId': 1,
+         'OrderDate': f'20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'}
+        for i in range(1, orders + 1)
+    ))
+    weights = [1 / rank ** 1.1 for rank in range(1, PRODUCTS + 1)]
+    products = rng.choices(range(1, PRODUCTS + 1), weights, k=orders * LINES_PER_ORDER)
+    bulk_insert(connection, OrderDetail.__table__, (
+        {'Id': i + 1, 'OrderId': i // LINES_PER_ORDER + 1, 'ProductId': products[i], 'UnitPrice': 10,
+         'Quantity': rng.randint(1, 20), 'Discount': 0, 'Amount': rng.randint(100, 50000) / 100}
+        for i in range(orders * LINES_PER_ORDER)
+    ))
+    connection.commit()
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=2_000_000, help='synthetic order lines')
+    parser.add_argument('--requests', type=int, default=20, help='requests timed per endpoint')
+    parser.add_argument('--new-orders', type=int, default=1_000, help='orders inserted after the build')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f'sqlite:///{os.path.join(directory, "approx.sqlite")}'
+        engine = create_engine(database_url)
+        Base.metadata.create_all(engine)
+        rng = random.Random(42)
+        started = time.perf_counter()
+        with engine.connect() as connection:
+            populate(connection, args.lines, rng)
+        print(f"loaded {args.lines:,} lines in {time.perf_counter() - started:.1f}s")
+
+        session = sessionmaker(bind=engine)()
+        ChangeService(session).ensure_log()
+        with patch('src.services.data_service.get_engine', return_value=engine), \
+                patch('src.services.approx_service.get_table_versions', return_value=TableVersions(MemoryVersionStore())):
+            data_service = DataService()
+            analytics = ApproxAnalytics(engine)
+
+            _, build_ms = timed(lambda: (analytics.start(), analytics._rebuild.join()), 1)
+            print(f"sketch build     {build_ms:10.1f} ms (once per process, in the background)")
+
+            exact_top, exact_ms = timed(lambda: data_service.get_top_products(10), args.requests)
+            approx_top, approx_ms = timed(lambda: analytics.top_products(10), args.requests)
+            print(f"top products     exact {exact_ms:8.1f} ms   approx {approx_ms:6.2f} ms")
+            exact_revenue = {row['product_name']: row['revenue'] for row in exact_top}
+            top_error = max(abs(row['revenue'] - exact_revenue.get(row['product_name'], 0))
+                            for row in approx_top['results'])
+            same = [row['product_name'] for row in approx_top['results']] == list(exact_revenue)
+            print(f"                 same top 10: {same}, max error {top_error:,.2f} "
+                  f"(bound {approx_top['revenue_error']:,.2f} at {approx_top['confidence']:.0%})")
+
+            exact_categories, exact_ms = timed(data_service.get_sales_by_category, args.requests)
+            approx_categories, approx_ms = timed(analytics.sales_by_category, args.requests)
+            print(f"sales/category   exact {exact_ms:8.1f} ms   approx {approx_ms:6.2f} ms")
+            exact_revenue = {row['category_name']: row['revenue'] for row in exact_categories}
+            outside = sum(abs(row['revenue'] - exact_revenue[row['category_name']]) > row['revenue_ci95']
+                          for row in approx_categories['results'])
+            worst = max(abs(row['revenue'] / exact_revenue[row['category_name']] - 1)
+                        for row in approx_categories['results'])
+            print(f"                 worst relative error {worst:.2%}, {outside}/{len(exact_revenue)} outside the 95% CI")
+
+            _, exact_ms = timed(data_service.get_sales_by_month, args.requests)
+            approx_months, approx_ms = timed(analytics.sales_by_month, args.requests)
+            print(f"sales/month      exact {exact_ms:8.1f} ms   approx {approx_ms:6.2f} ms (+ distinct customers)")
+            exact_customers = dict(session.execute(text(
+                "SELECT strftime('%Y-%m', OrderDate), COUNT(DISTINCT CustomerId) FROM \"Order\" GROUP BY 1"
+            )).all())
+            worst = max(abs(row['distinct_customers'] / exact_customers[row['month']] - 1)
+                        for row in approx_months['results'])
+            print(f"                 worst distinct customer error {worst:.2%} "
+                  f"(standard error {approx_months['distinct_customers_relative_error']:.2%})")
+
+            first_order = args.lines // LINES_PER_ORDER + 1
+            with engine.connect() as connection:
+                bulk_insert(connection, Order.__table__, [
+                    {'Id': i, 'CustomerId': 'C00001', 'EmployeeId': 1, 'OrderDate': '2024-12-31'}
+                    for i in range(first_order, first_order + args.new_orders)
+                ])
+                bulk_insert(connection, OrderDetail.__table__, [
+                    {'Id': args.lines + i + 1, 'OrderId': first_order + i // LINES_PER_ORDER, 'ProductId': 1,
+                     'UnitPrice': 10, 'Quantity': 1, 'Discount': 0, 'Amount': 10}
+                    for i in range(args.new_orders * LINES_PER_ORDER)
+                ])
+                connection.commit()
+            _, apply_ms = timed(analytics.refresh, 1)
+            print(f"incremental      {args.new_orders:,} new orders applied in {apply_ms:.1f} ms")
+        session.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
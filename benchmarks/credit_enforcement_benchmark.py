@@ -0,0 +1,93 @@
+"""
+Credit-enforced order placement under concurrent writers
+
+Builds a temporary database of customers and races writer threads placing
+small orders against their credit limits, for 1 to 32 writers. Reports
+orders decided per second and checks that no customer ended up over its
+limit and that every affordable order was accepted.
+
+Usage:
+    python benchmarks/credit_enforcement_benchmark.py [--customers 50] [--orders 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer, Order, Product
+from src.services.credit_service import CreditService
+
+ORDER_CENTS = 1000
+
+
+def populate(session, customers, orders_per_limit):
+    """One ten-dollar product and customers that can each afford orders_per_limit orders of it"""
+    session.add(Product(Id=1, ProductName='Chai', SupplierId=1, CategoryId=1, UnitPrice=10,
+                        UnitsInStock=0, UnitsOnOrder=0, ReorderLevel=0, Discontinued=0))
+    session.add_all([Customer(Id=f'C{i:04d}', CompanyName=f'Customer {i}', CreditLimit=10 * orders_per_limit)
+                     for i in range(customers)])
+    session.commit()
+
+
+def run(writers, customers, orders, orders_per_limit):
+    """Place orders from concurrent writers on a fresh database; return (seconds, accepted, over-limit customers)"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "orders.sqlite")}',
+                               pool_size=writers, max_overflow=0)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        session = Session()
+        populate(session, customers, orders_per_limit)
+
+        customer_ids = [f'C{i:04d}' for i in range(customers)]
+        accepted = []
+        start = threading.Barrier(writers + 1)
+
+        def writer(seed):
+            rng = random.Random(seed)
+            writer_session = Session()
+            credit_service = CreditService(writer_session)
+            start.wait()
+            for _ in range(orders // writers):
+                result = credit_service.place_order(rng.choice(customer_ids), 1, [{'product_id': 1, 'quantity': 1}])
+                accepted.append(result['accepted'])
+            writer_session.close()
+
+        threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(writers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        balances = session.execute(select(Order.CustomerId, func.count(Order.Id)).group_by(Order.CustomerId)).all()
+        over_limit = sum(1 for _, count in balances if count > orders_per_limit)
+        session.close()
+        engine.dispose()
+        return elapsed, len(accepted), sum(accepted), over_limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=50, help='customers orders are spread over')
+    parser.add_argument('--orders', type=int, default=2000, help='orders placed per run')
+    parser.add_argument('--orders-per-limit', type=int, default=20, help='orders each credit limit allows')
+    args = parser.parse_args()
+
+    for writers in (1, 2, 4, 8, 16, 32):
+        elapsed, decided, accepted, over_limit = run(writers, args.customers, args.orders, args.orders_per_limit)
+        print(f"{writers:>2} writers  {decided:,} orders in {elapsed:5.2f}s ({decided / elapsed:7,.0f} orders/s)  "
+              f"accepted {accepted:,}  customers over limit {over_limit}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Bulk export throughput and memory at scale
+
+Builds a temporary database with synthetic order lines and streams them
+through every available export format, reporting rows per second, output
+size and peak traced Python memory (which should stay flat as rows grow).
+Memory is traced in a second pass, so tracing does not slow the timed one.
+
+Usage:
+    python benchmarks/export_benchmark.py [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, OrderDetail
+from src.services.export_service import ExportService, available_formats
+
+
+def populate(session, rows, rng, batch_size=50_000):
+    """Insert synthetic order lines in batches"""
+    for start in range(0, rows, batch_size):
+        session.execute(insert(OrderDetail), [
+            {
+                'Id': i + 1,
+                'OrderId': 10248 + i // 4,
+                'ProductId': rng.randint(1, 77),
+                'UnitPrice': rng.randint(100, 20000) / 100,
+                'Quantity': rng.randint(1, 100),
+                'Discount': rng.choice((0, 0, 0.05, 0.1, 0.15)),
+                'ShippedDate': f'2013-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            }
+            for i in range(start, min(start + batch_size, rows))
+        ])
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='synthetic order lines')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "export.sqlite")}')
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        started = time.perf_counter()
+        populate(session, args.rows, random.Random(42))
+        print(f"inserted {args.rows:,} order lines in {time.perf_counter() - started:.1f}s")
+
+        for export_format in available_formats():
+            started = time.perf_counter()
+            manifest, chunks = ExportService(session).export('OrderDetail', export_format)
+            size = sum(len(chunk) for chunk in chunks)
+            elapsed = time.perf_counter() - started
+            session.rollback()
+
+            tracemalloc.start()
+            _, chunks = ExportService(session).export('OrderDetail', export_format)
+            for _ in chunks:
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            session.rollback()
+            print(f"{export_format:<8} {manifest['row_count']:,} rows in {elapsed:5.1f}s "
+                  f"({manifest['row_count'] / elapsed:,.0f} rows/s)  {size / 2**20:6.1f} MiB  "
+                  f"peak {peak / 2**20:5.1f} MiB")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
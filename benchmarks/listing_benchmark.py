@@ -0,0 +1,111 @@
+"""
+OFFSET versus keyset paging on the customer and order listings
+
+Loads synthetic customers and orders into a temporary SQLite database and
+times fetching a page at increasing depths, the old way (``OFFSET``, which
+reads and discards every row before the page) and through the keyset
+listings behind ``/customers`` and ``/orders``, plus the page's total row
+count computed per request versus served from the aggregate cache.
+
+Usage:
+    python benchmarks/listing_benchmark.py [--customers 200000] [--orders 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, create_engine, func, select
+from src.models.northwind import Base, Customer, Order
+from src.services.data_service import DataService
+from src.utils.dialect import bulk_insert
+from src.utils.paging import encode_cursor
+
+PER_PAGE = 50
+
+# The OFFSET pages the listings used before keyset paging
+CUSTOMERS_PAGE = select(Customer).order_by(Customer.Id).offset(bindparam('offset')).limit(PER_PAGE)
+
+RECENT_ORDERS_PAGE = (
+    select(Order, Customer.CompanyName)
+    .join(Customer, Order.CustomerId == Customer.Id)
+    .where(Order.OrderDate.isnot(None))
+    .order_by(Order.OrderDate.desc(), Order.Id.desc())
+    .offset(bindparam('offset'))
+    .limit(PER_PAGE)
+)
+
+
+def populate(connection, customers, orders, rng):
+    bulk_insert(connection, Customer.__table__, (
+        {'Id': f'C{i:07d}', 'CompanyName': f'Company {rng.randrange(customers)}', 'Country': f'Country {i % 40}'}
+        for i in range(customers)
+    ))
+    bulk_insert(connection, Order.__table__, (
+        {'Id': i, 'CustomerId': f'C{rng.randrange(customers):07d}', 'EmployeeId': 1,
+         'OrderDate': f'20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'}
+        for i in range(1, orders + 1)
+    ))
+    connection.commit()
+
+
+def timed(function, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=200_000, help='synthetic customers')
+    parser.add_argument('--orders', type=int, default=1_000_000, help='synthetic orders')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "listing.sqlite")}')
+        Base.metadata.create_all(engine)
+        with engine.connect() as connection:
+            populate(connection, args.customers, args.orders, random.Random(42))
+
+        with patch('src.services.data_service.get_engine', return_value=engine):
+            service = DataService()
+            # Totals are counted once per table version, then served from the aggregate cache
+            service.get_customer_listing(per_page=PER_PAGE)
+            service.get_order_listing(per_page=PER_PAGE)
+            print(f"{'page at row':>12}  {'customers OFFSET':>16}  {'keyset':>8}  {'orders OFFSET':>14}  {'keyset':>8}")
+            for depth in (0, 1_000, 10_000, 100_000, args.customers - PER_PAGE):
+                customer_offset = timed(lambda: service.session.execute(CUSTOMERS_PAGE, {'offset': depth}).all())
+                # The cursor a reader following next links would hold at this depth
+                after = None
+                if depth:
+                    after = encode_cursor([service.session.execute(
+                        select(Customer.Id).order_by(Customer.Id).offset(depth - 1).limit(1)).scalar()])
+                customer_keyset = timed(lambda: service.get_customer_listing(after=after, per_page=PER_PAGE))
+
+                order_offset = timed(lambda: service.session.execute(RECENT_ORDERS_PAGE, {'offset': depth}).all())
+                after = None
+                if depth:
+                    after = encode_cursor(service.session.execute(
+                        select(Order.OrderDate, Order.Id).where(Order.OrderDate.isnot(None))
+                        .order_by(Order.OrderDate.desc(), Order.Id.desc()).offset(depth - 1).limit(1)).one())
+                order_keyset = timed(lambda: service.get_order_listing(after=after, per_page=PER_PAGE))
+                print(f"{depth:>12,}  {customer_offset:>13.2f} ms  {customer_keyset:>5.2f} ms  "
+                      f"{order_offset:>11.2f} ms  {order_keyset:>5.2f} ms")
+
+            count = select(func.count()).select_from(Order).join(Customer, Order.CustomerId == Customer.Id)\
+                .where(Order.OrderDate.isnot(None))
+            uncached = timed(lambda: service.session.execute(count).scalar())
+            cached = timed(lambda: service.get_order_listing(per_page=PER_PAGE))
+            print(f"order total counted per request {uncached:.1f} ms; whole first page with the cached total {cached:.2f} ms")
+            service.session.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Cost of the profiling hooks
+
+Runs the app against a temporary copy of the Northwind database and times
+requests to a few routes not profiled, profiled with stack samples, and
+profiled with cProfile. It also times a traced service method called
+directly against the undecorated method, which is the cost every request
+pays when nothing is profiled.
+
+Usage:
+    python benchmarks/profiling_benchmark.py [--requests 50]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROUTES = ['/analytics', '/credit', '/api/customers/ALFKI/credit']
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='requests per route and mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'nw.sqlite')
+        shutil.copy(os.path.join(ROOT, 'data', 'nw.sqlite'), database)
+        os.environ.update(DATABASE_URL=f'sqlite:///{database}', CHANGE_LOG='false', JOBS_RESUME='false',
+                          PROFILE_TOKEN='benchmark', PROFILE_DIR=os.path.join(directory, 'profiles'),
+                          PROFILE_KEEP=str(args.requests))
+        from app import app
+        from src.services.data_service import DataService
+
+        client = app.test_client()
+        modes = [('off', {}), ('sample', {'X-Profile': 'sample', 'X-Profile-Token': 'benchmark'}),
+                 ('cprofile', {'X-Profile': 'cprofile', 'X-Profile-Token': 'benchmark'})]
+        print(f"{'route':<30}" + ''.join(f"{mode:>12}" for mode, _ in modes))
+        for route in ROUTES:
+            client.get(route)
+            timings = [timed(lambda: client.get(route, headers=headers), args.requests) for _, headers in modes]
+            print(f"{route:<30}" + ''.join(f"{timing:>9.2f} ms" for timing in timings))
+
+        service = DataService()
+        service.check_customer_credit('ALFKI')
+        calls = args.requests * 200
+        traced = timed(lambda: service.check_customer_credit('ALFKI'), calls)
+        untraced = timed(lambda: DataService.check_customer_credit.__wrapped__(service, 'ALFKI'), calls)
+        print(f"memoized credit check: traced {traced * 1000:.2f} us, undecorated {untraced * 1000:.2f} us")
+        service.session.close()
+
+
+if __name__ == '__main__':
+    main()
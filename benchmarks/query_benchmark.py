@@ -0,0 +1,102 @@
+"""
+Per-query Python overhead: query-chain construction vs prebuilt statements
+
+For each hot query, times the previous ``session.query(...).join(...).filter(...)``
+form against the service method that executes a module-level prebuilt
+statement. Both run against the same warm engine, so the difference is
+Python-side construction, cache-key and ORM hydration overhead.
+
+Usage:
+    python benchmarks/query_benchmark.py [--calls 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from src.models.northwind import Customer, Order, OrderDetail, Product
+from src.services import credit_service as credit_module
+from src.services.data_service import DataService
+from src.utils import money
+from src.utils.db import execute_read
+
+CUSTOMER_ID = 'ALFKI'
+
+
+def query_chains(session, order_id):
+    """Query-chain forms of the hot queries, as they were built on every call"""
+    line_micros = money.sql_line_micros(
+        OrderDetail.Quantity,
+        func.coalesce(func.nullif(OrderDetail.UnitPrice, 0), Product.UnitPrice),
+        OrderDetail.Discount
+    )
+    return {
+        'order total': lambda: session.query(func.coalesce(func.sum(line_micros), 0))
+            .select_from(OrderDetail)
+            .join(Product, OrderDetail.ProductId == Product.Id)
+            .filter(OrderDetail.OrderId == order_id)
+            .scalar(),
+        'unshipped balance': lambda: session.query(
+                func.count(Order.Id),
+                func.coalesce(func.sum(money.sql_cents(Order.AmountTotal)), 0)
+            ).filter(Order.CustomerId == CUSTOMER_ID)
+            .filter(Order.ShippedDate.is_(None))
+            .one(),
+        'unshipped orders': lambda: session.query(Order)
+            .filter(Order.CustomerId == CUSTOMER_ID)
+            .filter(Order.ShippedDate.is_(None))
+            .order_by(Order.OrderDate.desc())
+            .all(),
+        'customer by id': lambda: session.query(Customer).filter(Customer.Id == CUSTOMER_ID).first(),
+        'top products': lambda: session.query(
+                Product.ProductName,
+                func.sum(OrderDetail.Amount).label('revenue'),
+                func.sum(OrderDetail.Quantity).label('quantity_sold')
+            ).join(OrderDetail, Product.Id == OrderDetail.ProductId)
+            .group_by(Product.Id, Product.ProductName)
+            .order_by(func.sum(OrderDetail.Amount).desc())
+            .limit(10)
+            .all(),
+    }
+
+
+def prebuilt(data_service, order_id):
+    """The same queries through the prebuilt statements (``unshipped balance`` includes its commit)"""
+    credit_service = data_service.credit_service
+    return {
+        'order total': lambda: credit_service.calculate_order_amount_total(order_id),
+        'unshipped balance': lambda: credit_service._unshipped_balance_cents(CUSTOMER_ID),
+        'unshipped orders': lambda: execute_read(data_service.session, credit_module._UNSHIPPED_ORDERS,
+                                                 {'customer_id': CUSTOMER_ID}).all(),
+        'customer by id': lambda: data_service.get_customer_by_id(CUSTOMER_ID),
+        'top products': lambda: data_service.get_top_products(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000, help='calls per query')
+    args = parser.parse_args()
+
+    data_service = DataService()
+    session = data_service.session
+    order_id = session.query(Order.Id).filter(Order.CustomerId == CUSTOMER_ID).limit(1).scalar()
+
+    before = query_chains(session, order_id)
+    after = prebuilt(data_service, order_id)
+
+    print(f"{'query':<20} {'query chain':>14} {'prebuilt':>14} {'speedup':>8}")
+    for name in before:
+        # Warm both forms so only steady-state overhead is compared
+        before[name]()
+        after[name]()
+        before_us = timeit.timeit(before[name], number=args.calls) / args.calls * 1e6
+        after_us = timeit.timeit(after[name], number=args.calls) / args.calls * 1e6
+        print(f"{name:<20} {before_us:11.1f} us {after_us:11.1f} us {before_us / after_us:7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
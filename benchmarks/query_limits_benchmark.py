@@ -0,0 +1,151 @@
+"""
+Query budgets and route concurrency limits under an analytics flood
+
+Loads synthetic orders into a temporary SQLite database, then measures:
+
+- the cost of the budget progress handler on a whole-table aggregate, with
+  the handler removed, installed with no budget, and checking a budget
+- the latency of a cheap point lookup (standing in for a credit check)
+  while clients flood the aggregate, all served by a fixed pool of worker
+  threads, with the aggregate route unlimited versus in a limited pool
+  (whose rejected clients back off for Retry-After)
+
+Usage:
+    python benchmarks/query_limits_benchmark.py [--orders 500000] [--workers 8] [--flood 16] [--seconds 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+from src.models.northwind import Base, Order
+from src.routes import limits
+from src.routes.limits import limited
+from src.utils.db import BUDGET_CHECK_INSTRUCTIONS, _progress_handler, query_budget
+from src.utils.dialect import bulk_insert
+
+AGGREGATE = text("SELECT CustomerId, count(*), sum(Freight) FROM \"Order\" GROUP BY CustomerId ORDER BY 3 DESC LIMIT 10")
+LOOKUP = text("SELECT count(*), sum(Freight) FROM \"Order\" WHERE Id BETWEEN :id AND :id + 20")
+
+
+def populate(engine, orders, rng):
+    with engine.connect() as connection:
+        bulk_insert(connection, Order.__table__, (
+            {'Id': i, 'CustomerId': f'C{rng.randrange(5000):05d}', 'EmployeeId': 1, 'Freight': rng.randint(0, 500)}
+            for i in range(1, orders + 1)
+        ))
+        connection.commit()
+
+
+def timed(function, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def handler_overhead(engine):
+    with engine.connect() as connection:
+        aggregate = lambda: connection.execute(AGGREGATE).all()
+        aggregate()
+        raw = connection.connection.dbapi_connection
+        raw.set_progress_handler(None, 0)
+        bare = timed(aggregate)
+        raw.set_progress_handler(_progress_handler, BUDGET_CHECK_INSTRUCTIONS)
+        idle = timed(aggregate)
+        with query_budget(3600):
+            budgeted = timed(aggregate)
+    print(f"aggregate: no handler {bare:.1f} ms, handler without budget {idle:.1f} ms, "
+          f"handler checking a budget {budgeted:.1f} ms")
+
+
+def flood(engine, limited_pool, workers, flooders, seconds, rng):
+    """Serve every request from a fixed pool of workers, as a threaded server does"""
+    app = Flask(__name__)
+    server = ThreadPoolExecutor(max_workers=workers)
+
+    def analytics():
+        with engine.connect() as connection:
+            return jsonify(connection.execute(AGGREGATE).all()[0][1])
+
+    @app.route('/credit/<int:order_id>')
+    @limited('credit-check')
+    def credit(order_id):
+        with engine.connect() as connection:
+            return jsonify(connection.execute(LOOKUP, {'id': order_id}).one()[0])
+
+    app.add_url_rule('/analytics', view_func=limited('analytics')(analytics) if limited_pool else analytics)
+
+    def request(path):
+        return server.submit(lambda: app.test_client().get(path)).result()
+
+    statuses = []
+    stop = threading.Event()
+
+    def flooder():
+        while not stop.is_set():
+            response = request('/analytics')
+            statuses.append(response.status_code)
+            # Well-behaved clients back off as told
+            if response.status_code == 503:
+                stop.wait(int(response.headers['Retry-After']))
+
+    clients = [threading.Thread(target=flooder) for _ in range(flooders)]
+    for client in clients:
+        client.start()
+    time.sleep(0.5)
+
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        request(f'/credit/{rng.randrange(1, 100000)}')
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.01)
+    stop.set()
+    for client in clients:
+        client.join()
+    server.shutdown()
+
+    latencies.sort()
+    print(f"{'limited' if limited_pool else 'unlimited':>9} analytics: credit lookup p50 {statistics.median(latencies):7.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:7.2f} ms, max {latencies[-1]:7.2f} ms; "
+          f"analytics 200s {statuses.count(200)}, 503s {statuses.count(503)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=500_000, help='synthetic orders')
+    parser.add_argument('--workers', type=int, default=8, help='server worker threads')
+    parser.add_argument('--flood', type=int, default=16, help='clients flooding the aggregate route')
+    parser.add_argument('--seconds', type=float, default=5, help='seconds to measure each configuration')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "limits.sqlite")}',
+                               pool_size=args.workers, max_overflow=0)
+        Base.metadata.create_all(engine)
+        rng = random.Random(42)
+        populate(engine, args.orders, rng)
+
+        handler_overhead(engine)
+        with patch.object(limits, 'pools', {}):
+            flood(engine, False, args.workers, args.flood, args.seconds, rng)
+        with patch.object(limits, 'pools', {}):
+            flood(engine, True, args.workers, args.flood, args.seconds, rng)
+            print(f"analytics pool: {limits.limits_stats()['analytics']}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Customer search latency at scale
+
+Builds a temporary database with synthetic customers, creates the FTS5 index
+and reports p50/p99 latency of typeahead queries (1-4 character prefixes of
+one or two words; queries without a word of MIN_PREFIX_LENGTH characters
+return at once). The synthetic names use 16 syllables, so a three letter
+prefix matches about a third of all customers: far less selective than
+real names, and every match is ranked.
+
+Usage:
+    python benchmarks/search_benchmark.py [--rows 1000000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer
+from src.services.search_service import SearchService
+
+SYLLABLES = ['al', 'ber', 'ca', 'del', 'fu', 'gor', 'han', 'ki', 'lu', 'mar', 'no', 'pe', 'ra', 'sen', 'to', 'var']
+COUNTRIES = ['Germany', 'Sweden', 'France', 'Brazil', 'Mexico', 'Italy', 'Spain', 'Canada', 'Poland', 'Norway']
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def populate(session, rows, rng, batch_size=50_000):
+    """Insert synthetic customers in batches"""
+    for start in range(0, rows, batch_size):
+        session.execute(insert(Customer), [
+            {
+                'Id': f'C{i:07d}',
+                'CompanyName': f'{word(rng)} {word(rng)}',
+                'ContactName': f'{word(rng)} {word(rng)}',
+                'City': word(rng),
+                'Country': rng.choice(COUNTRIES),
+            }
+            for i in range(start, min(start + batch_size, rows))
+        ])
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='synthetic customers')
+    parser.add_argument('--queries', type=int, default=2000, help='queries to time')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "search.sqlite")}')
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        started = time.perf_counter()
+        populate(session, args.rows, rng)
+        print(f"inserted {args.rows:,} customers in {time.perf_counter() - started:.1f}s")
+
+        search_service = SearchService(session)
+        started = time.perf_counter()
+        search_service.rebuild_index()
+        print(f"built FTS5 index in {time.perf_counter() - started:.1f}s")
+
+        queries = []
+        for _ in range(args.queries):
+            terms = [word(rng).lower()[:rng.randint(1, 4)] for _ in range(rng.randint(1, 2))]
+            queries.append(' '.join(terms))
+
+        # Latencies grouped by the shortest word in the query, the main cost driver
+        latencies = {}
+        for query in queries:
+            started = time.perf_counter()
+            search_service.search_customers(query, limit=10)
+            shortest = min(len(term) for term in query.split())
+            latencies.setdefault(shortest, []).append((time.perf_counter() - started) * 1000)
+
+        latencies['all'] = [latency for group in latencies.values() for latency in group]
+        for key, group in latencies.items():
+            group.sort()
+            label = 'all queries' if key == 'all' else f'shortest word {key}'
+            print(f"{label:<17} n={len(group):<6} p50 {statistics.median(group):6.2f} ms  "
+                  f"p99 {group[max(int(len(group) * 0.99) - 1, 0)]:6.2f} ms  max {group[-1]:6.2f} ms")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
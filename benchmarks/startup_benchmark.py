@@ -0,0 +1,62 @@
+"""
+Startup benchmark: import time and first-request latency of a fresh worker
+
+Each run starts a new interpreter so imports and caches are cold, then
+times ``import app`` and the first and second request to a few routes,
+with and without the PRELOAD warm-up.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = ['/dashboard', '/analytics', '/api/customers/ALFKI/credit']
+
+WORKER = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+timings = {"import": (time.perf_counter() - started) * 1000}
+client = app.app.test_client()
+for route in %r:
+    for attempt in ("first", "second"):
+        started = time.perf_counter()
+        client.get(route)
+        timings[f"{attempt} {route}"] = (time.perf_counter() - started) * 1000
+timings["heavy modules loaded"] = sorted(m for m in ("pandas", "plotly", "numpy") if m in sys.modules)
+print(json.dumps(timings))
+''' % (ROUTES,)
+
+
+def run_worker(preload: bool) -> dict:
+    """Run one cold worker and return its timings"""
+    env = dict(os.environ, PRELOAD='true' if preload else 'false')
+    output = subprocess.run([sys.executable, '-c', WORKER], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold workers per configuration')
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        runs = [run_worker(preload) for _ in range(args.runs)]
+        print(f"\nPRELOAD={'true' if preload else 'false'} (median of {args.runs} runs)")
+        for key in runs[0]:
+            if key == 'heavy modules loaded':
+                print(f"  {key:<45} {', '.join(runs[0][key]) or 'none'}")
+            else:
+                print(f"  {key:<45} {statistics.median(run[key] for run in runs):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
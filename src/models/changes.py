@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String
+from src.models.northwind import Base
+
+class ChangeLog(Base):
+    """Append-only log of row changes, written by triggers on the captured tables"""
+    __tablename__ = 'ChangeLog'
+    # AUTOINCREMENT so sequence numbers are never reused, even after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    Seq = Column(Integer, primary_key=True, autoincrement=True)
+    TableName = Column(String(32), nullable=False)
+    Operation = Column(String(8), nullable=False)  # insert, update, delete
+    RowKey = Column(String(8000), nullable=False)
+    OrderId = Column(Integer)  # affected order, for Order and OrderDetail changes
+    CustomerId = Column(String(8000))  # affected customer, for credit invalidation
+    ChangedAt = Column(String(32))
+
+    def to_dict(self):
+        return {
+            'Seq': self.Seq,
+            'TableName': self.TableName,
+            'Operation': self.Operation,
+            'RowKey': self.RowKey,
+            'OrderId': self.OrderId,
+            'CustomerId': self.CustomerId,
+            'ChangedAt': self.ChangedAt
+        }
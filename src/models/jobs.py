@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, Text
+from src.models.northwind import Base
+import json
+
+class Job(Base):
+    """Background job, persisted so progress survives worker restarts"""
+    __tablename__ = 'Job'
+    
+    Id = Column(Integer, primary_key=True, autoincrement=True)
+    Kind = Column(String(50), nullable=False)
+    Status = Column(String(16), nullable=False, default='queued')  # queued, running, succeeded, failed
+    Params = Column(Text)  # JSON
+    Cursor = Column(Text)  # JSON position to resume from
+    Processed = Column(Integer, nullable=False, default=0)
+    Total = Column(Integer)
+    Result = Column(Text)  # JSON counters
+    Error = Column(Text)
+    CreatedAt = Column(String(32))
+    StartedAt = Column(String(32))
+    UpdatedAt = Column(String(32))  # heartbeat while running
+    FinishedAt = Column(String(32))
+    
+    def to_dict(self):
+        return {
+            'Id': self.Id,
+            'Kind': self.Kind,
+            'Status': self.Status,
+            'Params': json.loads(self.Params) if self.Params else {},
+            'Cursor': json.loads(self.Cursor) if self.Cursor else None,
+            'Processed': self.Processed,
+            'Total': self.Total,
+            'Progress': round(self.Processed / self.Total * 100, 1) if self.Total else None,
+            'Result': json.loads(self.Result) if self.Result else {},
+            'Error': self.Error,
+            'CreatedAt': self.CreatedAt,
+            'StartedAt': self.StartedAt,
+            'UpdatedAt': self.UpdatedAt,
+            'FinishedAt': self.FinishedAt
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, Numeric
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -224,6 +224,14 @@ class Order(Base):
     OrderDetailCount = Column(Integer, default=0)
     CloneFromOrder = Column(Integer, ForeignKey('Order.Id'))
     
+    __table_args__ = (
+        # Partial index over the few unshipped orders that every credit check reads
+        Index('Order_Unshipped_CustomerId_index', CustomerId,
+              sqlite_where=ShippedDate.is_(None), postgresql_where=ShippedDate.is_(None)),
+        # Serves the order listing's default newest-first keyset pages
+        Index('Order_OrderDate_Id_index', OrderDate, Id),
+    )
+    
     # Relationships
     customer = relationship("Customer", back_populates="orders")
     employee = relationship("Employee", back_populates="orders")
@@ -265,6 +273,10 @@ class OrderDetail(Base):
     Amount = Column(Numeric)
     ShippedDate = Column(String(8000))
     
+    __table_args__ = (
+        Index('OrderDetail_OrderId_index', OrderId),
+    )
+    
     # Relationships
     order = relationship("Order", back_populates="order_details")
     product = relationship("Product", back_populates="order_details")
@@ -1,15 +1,46 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, url_for
+from src.routes.caching import cached_response
+from src.routes.limits import limited, limits_stats
+from src.services.approx_service import SketchesNotReadyError, get_approx_analytics
+from src.services.credit_cache import get_credit_cache
+from src.services.credit_state import get_credit_state
 from src.services.data_service import DataService
+from src.services.export_service import EXPORT_FORMATS, EXPORT_TABLES, available_formats
+from src.services.inventory_service import LEAD_TIME_DAYS, REORDER_WINDOW, TARGET_COVER_DAYS, get_inventory_state
+from src.services.job_service import JOB_HANDLERS, get_job_runner
+from src.utils.db import DatabaseBusyError
+import json
+import os
+import threading
+import time
 
 bp = Blueprint('api', __name__)
 
+# Longest a change feed request waits for a change before answering (or sending a keep-alive)
+CHANGES_MAX_WAIT = 25
+
+# Change feed event streams allowed at once per process, and seconds before each is closed (EventSource
+# clients reconnect on their own and resume from Last-Event-ID)
+CHANGES_MAX_STREAMS = int(os.environ.get('CHANGES_STREAM_MAX_CLIENTS', 20))
+CHANGES_STREAM_LIFETIME = float(os.environ.get('CHANGES_STREAM_LIFETIME', 600))
+_change_streams = threading.BoundedSemaphore(CHANGES_MAX_STREAMS)
+
 @bp.route('/customers')
+@cached_response(('Customer',), max_age=60)
 def api_customers():
     """API endpoint for customers data"""
     data_service = DataService()
     customers = data_service.get_customers()
     return jsonify([customer.to_dict() for customer in customers])
 
+@bp.route('/customers/search')
+def api_customer_search():
+    """API endpoint for customer typeahead search"""
+    data_service = DataService()
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(data_service.search_customers(query, limit=limit))
+
 @bp.route('/customers/<customer_id>')
 def api_customer_detail(customer_id):
     """API endpoint for specific customer"""
@@ -20,12 +51,21 @@ def api_customer_detail(customer_id):
     return jsonify({'error': 'Customer not found'}), 404
 
 @bp.route('/products')
+@cached_response(('Product',), max_age=300)
 def api_products():
     """API endpoint for products data"""
     data_service = DataService()
     products = data_service.get_products()
     return jsonify([product.to_dict() for product in products])
 
+@bp.route('/products/search')
+def api_product_search():
+    """API endpoint for product typeahead search"""
+    data_service = DataService()
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(data_service.search_products(query, limit=limit))
+
 @bp.route('/orders')
 def api_orders():
     """API endpoint for orders data"""
@@ -34,28 +74,68 @@ def api_orders():
     orders = data_service.get_orders(limit=limit)
     return jsonify([order.to_dict() for order in orders])
 
+def _approx_requested() -> bool:
+    """Whether an analytics request opted into sketch-based approximate results"""
+    return request.args.get('approx', 'false').lower() in ('1', 'true', 'yes')
+
+def _approx_response(query, *args):
+    """Approximate results as JSON, or 503 with Retry-After while the sketches are first built"""
+    try:
+        return jsonify(query(*args))
+    except SketchesNotReadyError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
 @bp.route('/analytics/sales-by-month')
+@limited('analytics')
 def api_sales_by_month():
-    """API endpoint for monthly sales data"""
+    """API endpoint for monthly sales data (?approx=true adds estimated distinct customers)"""
+    if _approx_requested():
+        return _approx_response(get_approx_analytics().sales_by_month)
     data_service = DataService()
     sales_data = data_service.get_sales_by_month()
     return jsonify(sales_data)
 
 @bp.route('/analytics/top-products')
+@limited('analytics')
 def api_top_products():
-    """API endpoint for top-selling products"""
-    data_service = DataService()
+    """API endpoint for top-selling products (?approx=true for Count-Min estimates)"""
     limit = request.args.get('limit', 10, type=int)
+    if _approx_requested():
+        try:
+            return _approx_response(get_approx_analytics().top_products, limit)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    data_service = DataService()
     top_products = data_service.get_top_products(limit=limit)
     return jsonify(top_products)
 
 @bp.route('/analytics/sales-by-category')
+@limited('analytics')
 def api_sales_by_category():
-    """API endpoint for sales by category"""
+    """API endpoint for sales by category (?approx=true for estimates from a line sample)"""
+    if _approx_requested():
+        return _approx_response(get_approx_analytics().sales_by_category)
     data_service = DataService()
     sales_data = data_service.get_sales_by_category()
     return jsonify(sales_data)
 
+@bp.route('/analytics/employee-sales')
+@limited('analytics')
+def api_employee_sales():
+    """API endpoint for sales by employee"""
+    data_service = DataService()
+    return jsonify(data_service.get_employee_sales())
+
+@bp.route('/analytics/employee-sales/rollup')
+@limited('analytics')
+def api_employee_sales_rollup():
+    """API endpoint for employee sales with team totals over everyone reporting to each employee"""
+    data_service = DataService()
+    return jsonify(data_service.get_employee_sales_rollup())
+
 @bp.route('/analytics/customer-orders/<customer_id>')
 def api_customer_orders(customer_id):
     """API endpoint for customer order history"""
@@ -63,8 +143,30 @@ def api_customer_orders(customer_id):
     orders = data_service.get_customer_orders(customer_id)
     return jsonify([order.to_dict() for order in orders])
 
+# Inventory endpoints
+@bp.route('/inventory/velocity')
+def api_inventory_velocity():
+    """API endpoint for units sold per product over rolling windows"""
+    window = request.args.get('window', REORDER_WINDOW, type=int)
+    try:
+        return jsonify(get_inventory_state().velocity(window))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@bp.route('/inventory/reorder')
+def api_inventory_reorder():
+    """API endpoint for products to reorder, with days of cover and suggested quantities"""
+    window = request.args.get('window', REORDER_WINDOW, type=int)
+    lead_time = request.args.get('lead_time', LEAD_TIME_DAYS, type=int)
+    target_cover = request.args.get('target_cover', TARGET_COVER_DAYS, type=int)
+    try:
+        return jsonify(get_inventory_state().reorder(window, lead_time, target_cover))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
 # Credit checking endpoints
 @bp.route('/customers/<customer_id>/credit')
+@limited('credit-check')
 def api_customer_credit(customer_id):
     """API endpoint for customer credit check"""
     data_service = DataService()
@@ -72,13 +174,118 @@ def api_customer_credit(customer_id):
     return jsonify(credit_status)
 
 @bp.route('/customers/<customer_id>/credit/summary')
+@limited('credit-summary')
 def api_customer_credit_summary(customer_id):
     """API endpoint for detailed customer credit summary"""
     data_service = DataService()
     credit_summary = data_service.get_customer_credit_summary(customer_id)
     return jsonify(credit_summary)
 
+@bp.route('/customers/<customer_id>/credit/simulate', methods=['POST'])
+@limited('credit-summary')
+def api_customer_credit_simulate(customer_id):
+    """
+    API endpoint to check proposed orders against a customer's credit limit
+    
+    Accepts one order as {"lines": [{"product_id", "quantity", "discount"}, ...]}
+    or a batch as {"proposals": [{"lines": [...]}, ...]}.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or ('lines' in body) == ('proposals' in body):
+        return jsonify({'success': False, 'error': 'Expected a "lines" or a "proposals" list'}), 400
+    if 'lines' in body:
+        proposals = [body['lines']]
+    elif isinstance(body['proposals'], list):
+        proposals = [proposal.get('lines') if isinstance(proposal, dict) else proposal
+                     for proposal in body['proposals']]
+    else:
+        return jsonify({'success': False, 'error': '"proposals" must be a list'}), 400
+    
+    data_service = DataService()
+    try:
+        result = data_service.simulate_customer_credit(customer_id, proposals)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not result['success']:
+        return jsonify(result), 404
+    return jsonify(result)
+
+@bp.route('/customers/<customer_id>/orders', methods=['POST'])
+def api_place_order(customer_id):
+    """
+    API endpoint to place an order, enforcing the customer's credit limit
+    
+    Accepts {"employee_id": ..., "lines": [{"product_id", "quantity", "discount"}, ...],
+    "required_date": ...}. Answers 201 when the order is placed and 409 when
+    it would exceed the credit limit.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    
+    data_service = DataService()
+    try:
+        result = data_service.place_customer_order(customer_id, body.get('employee_id'), body.get('lines'),
+                                                   body.get('required_date'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except DatabaseBusyError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    if not result['success']:
+        return jsonify(result), 404
+    return jsonify(result), 201 if result['accepted'] else 409
+
+@bp.route('/credit/cache')
+def api_credit_cache():
+    """API endpoint for credit check cache statistics"""
+    return jsonify(get_credit_cache().stats())
+
+@bp.route('/limits')
+def api_limits():
+    """API endpoint for per-pool time budgets, queue depths, rejections and cancellations"""
+    return jsonify(limits_stats())
+
+@bp.route('/credit/stream')
+def api_credit_stream():
+    """
+    API endpoint streaming credit changes as Server-Sent Events
+
+    Sends a ``snapshot`` event with every credit-limited customer, then
+    ``credit`` events listing only customers whose balance, limit or
+    unshipped orders changed (``removed`` for customers that lost their limit).
+    """
+    state = get_credit_state()
+    subscriber = state.subscribe()
+    if subscriber is None:
+        response = jsonify({'error': 'Too many credit stream connections'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    return Response(_credit_events(state, subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _credit_events(state, subscriber):
+    """Stream a credit snapshot, then coalesced credit changes, with comment keep-alives while idle"""
+    try:
+        needs_snapshot = True
+        while True:
+            if needs_snapshot:
+                yield f"event: snapshot\ndata: {json.dumps(state.snapshot())}\n\n"
+            needs_snapshot, changes = subscriber.next(timeout=CHANGES_MAX_WAIT)
+            if changes:
+                updates = [check if check is not None else {'customer_id': customer_id, 'removed': True}
+                           for customer_id, check in changes.items()]
+                yield f"event: credit\ndata: {json.dumps(updates)}\n\n"
+            elif not needs_snapshot:
+                yield ": keep-alive\n\n"
+    finally:
+        state.unsubscribe(subscriber)
+
 @bp.route('/orders/<int:order_id>/recalculate', methods=['POST'])
+@limited('recalculate')
 def api_recalculate_order_total(order_id):
     """API endpoint to recalculate order total"""
     data_service = DataService()
@@ -87,7 +294,138 @@ def api_recalculate_order_total(order_id):
 
 @bp.route('/orders/recalculate-all', methods=['POST'])
 def api_recalculate_all_orders():
-    """API endpoint to recalculate all order totals"""
+    """API endpoint to recalculate all order totals as a background job"""
+    return _start_job('recalculate_orders')
+
+# Background job endpoints
+@bp.route('/jobs', methods=['POST'])
+def api_start_job():
+    """API endpoint to start a background job: {"kind": ..., "params": {...}}"""
+    body = request.get_json(silent=True) or {}
+    kind = body.get('kind')
+    if kind not in JOB_HANDLERS:
+        return jsonify({'success': False, 'error': f'Unknown job kind: {kind}',
+                        'kinds': sorted(JOB_HANDLERS)}), 400
+    return _start_job(kind, body.get('params'))
+
+@bp.route('/jobs')
+def api_jobs():
+    """API endpoint for recent background jobs"""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(get_job_runner().recent(limit=limit))
+
+@bp.route('/jobs/<int:job_id>')
+def api_job_status(job_id):
+    """API endpoint for background job status and progress"""
+    job = get_job_runner().get(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({'error': 'Job not found'}), 404
+
+def _start_job(kind, params=None):
+    """Queue a job and point the client at its status URL"""
+    try:
+        job_id = get_job_runner().submit(kind, params)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('api.api_job_status', job_id=job_id)
+    }), 202
+
+# Change feed endpoints
+@bp.route('/changes')
+def api_changes():
+    """
+    API endpoint for the change feed: ?since=<seq>&limit=&wait=<seconds>
+
+    Returns immediately by default, long-polls with ``wait``, and streams
+    Server-Sent Events when the client accepts text/event-stream.
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        # EventSource reconnects resume from the last event it received
+        since = request.headers.get('Last-Event-ID', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 1000))
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        if not _change_streams.acquire(blocking=False):
+            response = jsonify({'error': 'Too many change stream connections'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            return response
+        response = Response(_change_events(since, limit, time.monotonic() + CHANGES_STREAM_LIFETIME),
+                            mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # Released when the response closes, even if the stream was never started
+        response.call_on_close(_change_streams.release)
+        return response
+
+    wait = min(request.args.get('wait', 0, type=float), CHANGES_MAX_WAIT)
     data_service = DataService()
-    result = data_service.update_order_totals()
-    return jsonify(result)
+    return jsonify(data_service.get_changes(since, limit=limit, wait=wait))
+
+def _change_events(since, limit, deadline):
+    """Stream changes as Server-Sent Events, with comment keep-alives while idle, until the deadline"""
+    data_service = DataService()
+    try:
+        while time.monotonic() < deadline:
+            wait = min(CHANGES_MAX_WAIT, max(deadline - time.monotonic(), 0))
+            feed = data_service.get_changes(since, limit=limit, wait=wait)
+            if feed['resync']:
+                yield f"event: resync\ndata: {json.dumps({'latest_seq': feed['latest_seq']})}\n\n"
+            for change in feed['changes']:
+                yield f"id: {change['Seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+            if not feed['changes']:
+                yield ": keep-alive\n\n"
+            since = feed['last_seq']
+    finally:
+        data_service.session.close()
+
+# Bulk export endpoints
+@bp.route('/export')
+def api_exports():
+    """API endpoint listing exportable tables, their joins and the available formats"""
+    return jsonify({
+        'tables': {name: {'joins': sorted(table.joins), 'date_filter': table.date_column is not None}
+                   for name, table in EXPORT_TABLES.items()},
+        'formats': available_formats()
+    })
+
+@bp.route('/export/<table>')
+def api_export(table):
+    """
+    API endpoint streaming a table export: ?format=csv|parquet|arrow&join=a,b&from=YYYY-MM-DD&to=YYYY-MM-DD
+
+    The manifest (row count and columns) is returned in the X-Export-Manifest
+    header; ``manifest=true`` returns only the manifest.
+    """
+    data_service = DataService()
+    joins = [name for name in request.args.get('join', '').split(',') if name]
+    try:
+        manifest, chunks = data_service.export_table(table, request.args.get('format', 'csv'), joins,
+                                                     request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'formats': available_formats()}), 400
+
+    if request.args.get('manifest', 'false').lower() in ('1', 'true', 'yes'):
+        chunks.close()
+        data_service.session.close()
+        return jsonify(manifest)
+
+    def stream():
+        try:
+            yield from chunks
+        finally:
+            data_service.session.close()
+
+    export_format = manifest['format']
+    response = Response(stream(), mimetype=EXPORT_FORMATS[export_format].media_type, headers={
+        'Content-Disposition': f'attachment; filename="{manifest["filename"]}"',
+        'X-Row-Count': str(manifest['row_count']),
+        'X-Export-Manifest': json.dumps(manifest)
+    })
+    # A stream the client abandons before it starts never reaches the generator's cleanup
+    response.call_on_close(data_service.session.close)
+    return response
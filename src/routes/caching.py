@@ -0,0 +1,159 @@
+"""
+HTTP caching for endpoints built from rarely changing tables
+
+``cached_response`` gives a view a strong ETag derived from the version
+counters of the tables it reads (see ``src.services.table_versions``), so:
+
+- ``If-None-Match`` is answered with 304 before the view runs, without
+  touching the database
+- a changed table changes the ETag, so a stale body is never validated
+- the body is built once per table version and kept, with its gzip or
+  brotli variant compressed once, in a small in-process LRU
+
+``Cache-Control: max-age`` is set per route, overridable with
+``HTTP_CACHE_MAX_AGE`` (e.g. ``api.api_products=300,main.products=60``); a
+max-age of 0 sends ``no-cache``, so clients revalidate on every use.
+Views that swallow their errors and still answer 200 (the HTML pages) call
+``skip_cache`` so the fallback page is neither kept nor validated.
+Brotli is used when the optional ``brotli`` package is installed.
+"""
+from collections import OrderedDict
+from flask import Response, g, make_response, request
+from functools import wraps
+from src.services.table_versions import get_table_versions
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+import gzip
+import importlib
+import importlib.util
+import os
+import threading
+import zlib
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Response variants kept per worker process
+CACHE_ENTRIES = int(os.environ.get('HTTP_CACHE_ENTRIES', 256))
+
+def _parse_max_age(setting: str) -> Dict[str, int]:
+    """Parse ``endpoint=seconds,...`` overrides"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in setting.split(','))):
+        endpoint, _, seconds = item.partition('=')
+        overrides[endpoint.strip()] = int(seconds)
+    return overrides
+
+MAX_AGE_OVERRIDES = _parse_max_age(os.environ.get('HTTP_CACHE_MAX_AGE', ''))
+
+_brotli = importlib.import_module('brotli') if importlib.util.find_spec('brotli') is not None else None
+
+class CachedVariant(NamedTuple):
+    etag: str
+    body: bytes
+    mimetype: str
+    encoding: Optional[str]
+
+class ResponseCache:
+    """LRU of encoded response bodies keyed by URL and content encoding"""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Tuple[str, Optional[str]], CachedVariant]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Tuple[str, Optional[str]], etag: str) -> Optional[CachedVariant]:
+        """The cached variant if it was built under the current ETag"""
+        with self.lock:
+            variant = self.entries.get(key)
+            if variant is None or variant.etag != etag:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return variant
+
+    def put(self, key: Tuple[str, Optional[str]], variant: CachedVariant):
+        with self.lock:
+            self.entries[key] = variant
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
+
+response_cache = ResponseCache()
+
+def _negotiate_encoding() -> Optional[str]:
+    """Best content encoding the client accepts: br, then gzip"""
+    accepted = request.accept_encodings
+    if _brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return _brotli.compress(body, quality=9)
+    return gzip.compress(body, compresslevel=6)
+
+def skip_cache():
+    """Keep the current request's response out of the cache, e.g. a page rendered empty after an error"""
+    g.skip_response_cache = True
+
+def cached_response(tables: Sequence[str], max_age: int = 0):
+    """
+    Cache a GET view's response by the versions of the tables it reads
+
+    Args:
+        tables: Names of every table the response is built from
+        max_age: Seconds clients may reuse the response without revalidating
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            age = MAX_AGE_OVERRIDES.get(request.endpoint, max_age)
+            encoding = _negotiate_encoding()
+            url = request.full_path
+            # Versions are read before the view runs, so a write committed meanwhile can only make the
+            # tag older than the body, never newer. URL and encoding make each representation's tag unique
+            etag = f"{get_table_versions().validator(tables)}-{zlib.crc32(url.encode('utf-8')):08x}"
+            if encoding:
+                etag = f'{etag}-{encoding}'
+
+            if request.if_none_match.contains_weak(etag):
+                with response_cache.lock:
+                    response_cache.not_modified += 1
+                return _with_cache_headers(Response(status=304), etag, age)
+
+            variant = response_cache.get((url, encoding), etag)
+            if variant is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed or g.pop('skip_response_cache', False):
+                    response.headers['Cache-Control'] = 'no-store'
+                    return response
+                body = response.get_data()
+                variant_encoding = encoding if encoding and len(body) >= MIN_COMPRESS_SIZE else None
+                if variant_encoding:
+                    body = _compress(body, variant_encoding)
+                variant = CachedVariant(etag, body, response.mimetype, variant_encoding)
+                response_cache.put((url, encoding), variant)
+
+            response = Response(variant.body, mimetype=variant.mimetype)
+            if variant.encoding:
+                response.headers['Content-Encoding'] = variant.encoding
+            return _with_cache_headers(response, etag, age)
+        return wrapper
+    return decorator
+
+def _with_cache_headers(response: Response, etag: str, max_age: int) -> Response:
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}' if max_age > 0 else 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,198 @@
+"""
+Time budgets and concurrency limits for expensive endpoints
+
+``limited`` puts a view in one of the named ``POOLS``. Each pool has:
+
+- a time budget: the view's statements run under ``query_budget`` (see
+  ``src.utils.db``), so a query still running when it expires is cancelled
+  at the database and the request answers 503 instead of pinning a worker
+  and the SQLite write lock
+- a concurrency limit: at most ``concurrency`` requests of the pool run at
+  once, up to ``queue`` more wait up to ``queue_timeout`` seconds for a
+  slot, and the rest are turned away at once with 503
+
+Rejections carry ``Retry-After``. Pools are per worker process, so one
+client hammering the analytics endpoints fills only the analytics pool
+while credit checks keep their own slots.
+
+Defaults are overridable with ``ROUTE_LIMITS``, e.g.
+``analytics=10:2:4,credit-check=1:16:32`` (pool=budget seconds:concurrency:queue).
+Pool counters are served at ``/api/limits``.
+"""
+from flask import Response, jsonify
+from functools import wraps
+from src.utils.db import QueryTimeoutError, query_budget
+from typing import Any, Dict, NamedTuple, Optional
+import math
+import os
+import threading
+import time
+
+class PoolSettings(NamedTuple):
+    budget: float
+    concurrency: int
+    queue: int
+
+# Default pools: (budget seconds, concurrency, queue)
+POOLS: Dict[str, PoolSettings] = {
+    # Memoized single-customer checks; kept apart so heavy routes cannot crowd them out
+    'credit-check': PoolSettings(1.0, 16, 32),
+    'credit-summary': PoolSettings(3.0, 4, 8),
+    'credit-page': PoolSettings(5.0, 2, 4),
+    # Whole-table aggregates
+    'analytics': PoolSettings(10.0, 2, 4),
+    # Order total writes, which hold the SQLite write lock
+    'recalculate': PoolSettings(5.0, 1, 2),
+}
+
+# Seconds a queued request waits for a slot before it is turned away
+QUEUE_TIMEOUT = float(os.environ.get('ROUTE_QUEUE_TIMEOUT', 2.0))
+
+def _parse_limits(setting: str) -> Dict[str, PoolSettings]:
+    """Parse ``pool=budget:concurrency[:queue],...`` overrides"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in setting.split(','))):
+        pool, _, values = item.partition('=')
+        budget, concurrency, *queue = values.split(':')
+        overrides[pool.strip()] = PoolSettings(float(budget), int(concurrency), int(queue[0]) if queue else 0)
+    return overrides
+
+LIMIT_OVERRIDES = _parse_limits(os.environ.get('ROUTE_LIMITS', ''))
+
+class RoutePool:
+    """Admits at most ``concurrency`` requests at a time, queueing a bounded number more"""
+
+    def __init__(self, name: str, settings: PoolSettings, queue_timeout: float = QUEUE_TIMEOUT):
+        self.name = name
+        self.settings = settings
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        # Counters for /api/limits
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.cancelled = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if there is room; False if turned away"""
+        with self.condition:
+            if self.active < self.settings.concurrency:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.settings.queue:
+                self.rejected_full += 1
+                return False
+
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            started = time.monotonic()
+            try:
+                admitted = self.condition.wait_for(lambda: self.active < self.settings.concurrency,
+                                                   timeout=self.queue_timeout)
+                self.wait_seconds += time.monotonic() - started
+                if not admitted:
+                    self.rejected_timeout += 1
+                    return False
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, seconds: float, cancelled: bool):
+        with self.condition:
+            self.active -= 1
+            self.run_seconds += seconds
+            self.cancelled += int(cancelled)
+            self.condition.notify()
+
+    def retry_after(self) -> int:
+        """Seconds a turned-away client should wait: about one request's time per queued request ahead"""
+        with self.condition:
+            average = self.run_seconds / self.admitted if self.admitted else self.settings.budget
+            ahead = (self.active + self.waiting) / max(self.settings.concurrency, 1)
+        return max(1, math.ceil(min(average * ahead, self.settings.budget * 2)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'budget_seconds': self.settings.budget,
+                'concurrency': self.settings.concurrency,
+                'queue': self.settings.queue,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'max_queue_depth': self.max_waiting,
+                'admitted': self.admitted,
+                'rejected_full': self.rejected_full,
+                'rejected_timeout': self.rejected_timeout,
+                'cancelled': self.cancelled,
+                'average_wait_ms': round(self.wait_seconds / self.admitted * 1000, 2) if self.admitted else 0.0,
+                'average_run_ms': round(self.run_seconds / self.admitted * 1000, 2) if self.admitted else 0.0
+            }
+
+pools: Dict[str, RoutePool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(name: str) -> RoutePool:
+    """Get a pool by name, created with its settings (or their ROUTE_LIMITS override) on first use"""
+    with _pools_lock:
+        pool = pools.get(name)
+        if pool is None:
+            pool = pools[name] = RoutePool(name, LIMIT_OVERRIDES.get(name, POOLS[name]))
+        return pool
+
+def limited(pool: str):
+    """
+    Run a view in a pool under the pool's time budget and concurrency limit
+
+    Args:
+        pool: Name of one of the POOLS; views in the same pool share its slots
+    """
+    if pool not in POOLS:
+        raise ValueError(f"Unknown route pool: {pool}")
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            route_pool = get_pool(pool)
+            if not route_pool.acquire():
+                return _unavailable(f"Too many concurrent {pool} requests", route_pool.retry_after())
+
+            started = time.monotonic()
+            cancelled = False
+            try:
+                with query_budget(route_pool.settings.budget) as active_budget:
+                    try:
+                        response = view(*args, **kwargs)
+                    except QueryTimeoutError as e:
+                        response = None
+                        error = str(e)
+                # Views that catch every error (the HTML pages) must not turn a cancelled query into a 200
+                if active_budget.interrupted:
+                    cancelled = True
+                    return _unavailable(error if response is None else
+                                        f"Request cancelled after exceeding its {active_budget.seconds:g}s time budget",
+                                        route_pool.retry_after())
+                return response
+            finally:
+                route_pool.release(time.monotonic() - started, cancelled)
+        return wrapper
+    return decorator
+
+def _unavailable(message: str, retry_after: int) -> Response:
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def limits_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters of every pool used so far in this process"""
+    with _pools_lock:
+        current = dict(pools)
+    return {name: pool.stats() for name, pool in sorted(current.items())}
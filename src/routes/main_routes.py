@@ -1,8 +1,22 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request
+from typing import Dict
+from src.routes.caching import cached_response, skip_cache
+from src.routes.limits import limited
+from src.services.credit_state import get_credit_state
 from src.services.data_service import DataService
 
 bp = Blueprint('main', __name__)
 
+# Rows per page on the customer, product and order listings
+PER_PAGE = 50
+
+def _listing_args(*filters: str) -> Dict[str, str]:
+    """Sort and filter arguments of a listing page, carried over by its page and sort links"""
+    return {name: request.args[name] for name in ('sort', 'order') + filters if request.args.get(name)}
+
+def _cursors() -> Dict[str, str]:
+    return {'after': request.args.get('after'), 'before': request.args.get('before'), 'per_page': PER_PAGE}
+
 @bp.route('/dashboard')
 def dashboard():
     """Main dashboard with key metrics"""
@@ -30,91 +44,86 @@ def dashboard():
 
 @bp.route('/customers')
 def customers():
-    """Customer list and analysis"""
+    """Customer list and analysis, one keyset page at a time"""
+    args = _listing_args('country')
     try:
         data_service = DataService()
-        customers = data_service.get_customers()
+        listing = data_service.get_customer_listing(**args, **_cursors())
         
-        # Process customers for template
-        customers_list = [customer.to_dict() for customer in customers]
+        # Totals and country breakdown are aggregated by the database once per change to the table
+        stats = data_service.cached_aggregate(('Customer',), data_service.get_customer_stats)
+        countries = data_service.cached_aggregate(('Customer',), data_service.get_customer_countries)
         
-        # Group by country for display
-        countries = {}
-        for customer in customers_list:
-            country = customer.get('Country') or 'Unknown'
-            if country not in countries:
-                countries[country] = 0
-            countries[country] += 1
-        
-        return render_template('customers.html', customers=customers_list, countries=countries)
+        return render_template('customers.html', customers=listing['rows'], listing=listing, args=args,
+                               countries=countries, stats=stats)
+    except ValueError as e:
+        return render_template('customers.html', customers=[], listing=None, args={}, countries={},
+                               stats={}, error=str(e)), 400
     except Exception as e:
         print(f"Error in customers route: {e}")  # Debug print
-        return render_template('customers.html', customers=[], countries={})
+        return render_template('customers.html', customers=[], listing=None, args={}, countries={}, stats={})
 
 @bp.route('/customers/<customer_id>')
 def customer_detail(customer_id):
     """Customer detail page with orders"""
     try:
         data_service = DataService()
-        customer = data_service.get_customer_by_id(customer_id)
+        detail = data_service.get_customer_detail(customer_id)
         
-        if not customer:
+        if not detail:
             return render_template('404.html'), 404
-            
-        orders = data_service.get_customer_orders(customer_id)
-        
-        # Calculate customer statistics
-        total_orders = len(orders)
-        total_spent = sum(float(order.AmountTotal or 0) for order in orders)
-        
-        # Get credit information
-        credit_status = data_service.check_customer_credit(customer_id)
         
-        return render_template('customer_detail.html', 
-                             customer=customer, 
-                             orders=orders,
-                             total_orders=total_orders,
-                             total_spent=total_spent,
-                             credit_status=credit_status)
+        return render_template('customer_detail.html', **detail)
     except Exception as e:
         print(f"Error in customer detail route: {e}")
         return render_template('404.html'), 404
 
 @bp.route('/products')
+@cached_response(('Product', 'CategoryTableNameTest', 'Supplier'), max_age=60)
 def products():
-    """Product catalog and analysis"""
+    """Product catalog and analysis, one keyset page at a time"""
+    args = _listing_args('category', 'status')
     try:
         data_service = DataService()
-        products = data_service.get_products_with_details()
+        listing = data_service.get_product_listing(sort=args.get('sort', 'id'), order=args.get('order', 'asc'),
+                                                   category=request.args.get('category', type=int),
+                                                   status=args.get('status'), **_cursors())
+        stats = data_service.cached_aggregate(('Product',), data_service.get_product_stats)
         categories = data_service.get_categories()
-        return render_template('products.html', products=products, categories=categories)
+        return render_template('products.html', products=listing['rows'], listing=listing, args=args,
+                               stats=stats, categories=categories)
+    except ValueError as e:
+        return render_template('products.html', products=[], listing=None, args={}, stats={},
+                               categories=[], error=str(e)), 400
     except Exception as e:
-        return render_template('products.html', products=[], categories=[])
+        print(f"Error in products route: {e}")  # Debug print
+        # A transient failure must not be cached as the catalog until the products change
+        skip_cache()
+        return render_template('products.html', products=[], listing=None, args={}, stats={}, categories=[])
 
 @bp.route('/orders')
 def orders():
-    """Order history and analysis"""
+    """Order history and analysis, one keyset page at a time"""
+    args = _listing_args('country')
     try:
         data_service = DataService()
-        orders = data_service.get_recent_orders()
+        listing = data_service.get_order_listing(**args, **_cursors())
         
-        # Process orders for template
-        orders_list = [order for order in orders]
+        # Totals and country breakdown cover all orders, not just this page
+        stats = data_service.cached_aggregate(('Order',), data_service.get_order_stats)
+        countries = data_service.cached_aggregate(('Order',), data_service.get_order_countries)
         
-        # Group by country for display
-        countries = {}
-        for order in orders_list:
-            country = order.get('ShipCountry') or 'Unknown'
-            if country not in countries:
-                countries[country] = 0
-            countries[country] += 1
-        
-        return render_template('orders.html', orders=orders_list, countries=countries)
+        return render_template('orders.html', orders=listing['rows'], listing=listing, args=args,
+                               countries=countries, stats=stats)
+    except ValueError as e:
+        return render_template('orders.html', orders=[], listing=None, args={}, countries={},
+                               stats={}, error=str(e)), 400
     except Exception as e:
         print(f"Error in orders route: {e}")  # Debug print
-        return render_template('orders.html', orders=[], countries={})
+        return render_template('orders.html', orders=[], listing=None, args={}, countries={}, stats={})
 
 @bp.route('/analytics')
+@limited('analytics')
 def analytics():
     """Advanced analytics and charts"""
     try:
@@ -136,23 +145,12 @@ def analytics():
                              sales_by_category=[])
 
 @bp.route('/credit')
+@limited('credit-page')
 def credit_management():
     """Credit management page"""
     try:
-        data_service = DataService()
-        
-        # Get customers with credit limits
-        customers = data_service.get_customers()
-        customers_with_credit = []
-        
-        for customer in customers:
-            if customer.CreditLimit and customer.CreditLimit > 0:
-                credit_check = data_service.check_customer_credit(customer.Id)
-                if credit_check['success']:
-                    customers_with_credit.append(credit_check)
-        
-        # Sort by balance percentage (highest risk first)
-        customers_with_credit.sort(key=lambda x: x['balance_percentage'], reverse=True)
+        # Customers with credit limits from the shared live state, highest risk first
+        customers_with_credit = get_credit_state().snapshot()
         
         return render_template('credit_management.html', customers=customers_with_credit)
     except Exception as e:
@@ -0,0 +1,155 @@
+"""
+On-demand request profiling
+
+A request is profiled when an admin asks for it, with ``X-Profile: sample``
+or ``X-Profile: cprofile`` (or ``?profile=...``) plus the shared secret from
+``PROFILE_TOKEN`` in ``X-Profile-Token`` (or ``?profile_token=...``), and
+at random for a ``PROFILE_SAMPLE_RATE`` fraction of all requests. Profiling
+on demand is off while ``PROFILE_TOKEN`` is unset.
+
+Each profiled request writes to ``PROFILE_DIR``:
+
+- ``<id>.collapsed``: stack samples in collapsed-stack format, e.g.
+  ``flamegraph.pl <id>.collapsed > <id>.svg`` or drop it on speedscope.app
+- ``<id>.json``: the request, its duration and its spans (service methods,
+  SQL statements, template rendering)
+- ``<id>.prof``: cProfile statistics (``cprofile`` mode only), for
+  ``python -m pstats`` or snakeviz
+
+Requests carrying the admin token are answered with ``X-Profile-Id: <id>``
+and a ``Server-Timing`` header of the span totals, which browser developer
+tools show per request; randomly sampled requests only leave their files,
+so clients never learn internal span names and timings. Only the newest
+``PROFILE_KEEP`` profiles are kept.
+"""
+from contextlib import ExitStack
+from datetime import datetime
+from flask import Flask, Response, before_render_template, g, jsonify, request, template_rendered
+from src.utils.profiling import RequestProfile, begin_span, end_span, profiling
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Shared secret admins send to profile a request; without it only sampled requests are profiled
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# Fraction of all requests profiled (with stack samples only) without being asked
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))
+# Milliseconds between stack samples
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+# Where profiles are written, and how many requests' profiles are kept there
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'northwind-profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+MODES = ('sample', 'cprofile')
+
+def install_profiling(app: Flask):
+    """Profile the app's requests on demand, and render templates inside spans"""
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+    before_render_template.connect(_begin_render, app)
+    template_rendered.connect(_end_render, app)
+
+def _is_admin() -> bool:
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile_token') or ''
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def _start_profile():
+    mode = (request.headers.get('X-Profile') or request.args.get('profile') or '').lower() or None
+    if mode is None:
+        if not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            return None
+        mode = 'sample'
+    elif not _is_admin():
+        return jsonify({'success': False, 'error': 'Profiling requires a valid profile token'}), 403
+    elif mode not in MODES:
+        return jsonify({'success': False, 'error': f"Unknown profile mode: {mode} (use {' or '.join(MODES)})"}), 400
+
+    profile = RequestProfile(f"{request.method} {request.path}", PROFILE_INTERVAL_MS / 1000,
+                             deterministic=mode == 'cprofile')
+    g.profile_stack = ExitStack()
+    g.profile_stack.enter_context(profiling(profile))
+    g.profile = profile
+    return None
+
+def _finish_profile(response: Response) -> Response:
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    g.pop('profile_stack').close()
+
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.method}-" \
+                 f"{re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'}-{uuid.uuid4().hex[:6]}"
+    try:
+        save_profile(profile, profile_id, response.status_code)
+    except OSError:
+        logger.exception("Could not save profile %s", profile_id)
+        return response
+    if not _is_admin():
+        return response
+    response.headers['X-Profile-Id'] = profile_id
+    response.headers['Server-Timing'] = _server_timing(profile)
+    return response
+
+def _discard_profile(error):
+    """Stop a profile whose request never reached after_request"""
+    stack = g.pop('profile_stack', None)
+    if stack is not None:
+        stack.close()
+
+def _render_span(template) -> str:
+    return f"render {template.name or '<string>'}"
+
+def _begin_render(sender, template, context, **extra):
+    begin_span(_render_span(template))
+
+def _end_render(sender, template, context, **extra):
+    end_span(_render_span(template))
+
+def save_profile(profile: RequestProfile, profile_id: str, status: int, directory: str = None, keep: int = None):
+    """
+    Write a finished profile's files and prune the oldest profiles
+
+    Args:
+        profile: Stopped profile
+        profile_id: File name stem of the profile
+        status: Response status code, kept in the summary
+        directory: Target directory (PROFILE_DIR by default)
+        keep: Profiles to keep (PROFILE_KEEP by default)
+    """
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile_id)
+    with open(f"{base}.collapsed", 'w') as collapsed:
+        collapsed.write(profile.collapsed())
+    with open(f"{base}.json", 'w') as summary:
+        json.dump(dict(profile.summary(), status=status), summary, indent=2)
+    if profile.profiler is not None:
+        profile.profiler.dump_stats(f"{base}.prof")
+    _prune(directory, keep if keep is not None else PROFILE_KEEP)
+
+def _prune(directory: str, keep: int):
+    # Profile ids start with their timestamp, so they sort oldest first
+    ids = sorted({name.rsplit('.', 1)[0] for name in os.listdir(directory) if name.endswith('.json')})
+    for profile_id in ids[:max(len(ids) - keep, 0)]:
+        for suffix in ('.collapsed', '.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+def _server_timing(profile: RequestProfile) -> str:
+    """Span totals as a Server-Timing header, slowest first"""
+    metrics = [f'total;dur={profile.seconds * 1000:.2f}']
+    totals = sorted(profile.span_totals().items(), key=lambda item: -item[1][1])
+    for index, (name, (calls, seconds)) in enumerate(totals):
+        description = name.replace('\\', '\\\\').replace('"', '\\"')
+        metrics.append(f'span{index};dur={seconds * 1000:.2f};desc="{description} x{calls}"')
+    return ', '.join(metrics)
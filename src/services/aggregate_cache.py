@@ -0,0 +1,82 @@
+"""
+Cached whole-table aggregates for the listing pages
+
+Row counts, per-country breakdowns and summary statistics scan the whole
+table, so computing them on every page view would make each render as
+expensive as the table, however small the page. Results are kept per
+worker process together with the versions of the tables they were computed
+from (see ``src.services.table_versions``) and reused until one of those
+tables changes.
+
+Writes that bypass the ORM session are not seen by the version counters,
+so entries also expire after ``AGGREGATE_CACHE_MAX_AGE`` seconds.
+"""
+from collections import OrderedDict
+from src.services.table_versions import get_table_versions
+from typing import Any, Callable, Hashable, Optional, Sequence, Tuple
+import os
+import threading
+import time
+
+# Aggregates kept per worker process
+MAX_ENTRIES = int(os.environ.get('AGGREGATE_CACHE_SIZE', 1024))
+
+# Seconds an entry is trusted without a version change, for writes the version counters miss
+MAX_AGE = float(os.environ.get('AGGREGATE_CACHE_MAX_AGE', 300))
+
+class AggregateCache:
+    """LRU of aggregate results, valid while the versions of their tables are unchanged"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_age: float = MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries: 'OrderedDict[Hashable, Tuple[Sequence[int], float, Any]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tables: Sequence[str], key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Get an aggregate, computing it on a miss
+
+        Args:
+            tables: Tables the aggregate is computed from
+            key: Identifies the aggregate and its arguments
+            compute: Computes the aggregate
+
+        Returns:
+            The cached or freshly computed result
+        """
+        versions = tuple(get_table_versions().versions(tables))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == versions and now - entry[1] < self.max_age:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # Versions read before computing, so a write committed meanwhile invalidates the entry
+        result = compute()
+        with self.lock:
+            self.entries[key] = (versions, now, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_cache: Optional[AggregateCache] = None
+_cache_lock = threading.Lock()
+
+def get_aggregate_cache() -> AggregateCache:
+    """Get the process-wide aggregate cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AggregateCache()
+        return _cache
@@ -0,0 +1,398 @@
+"""
+Approximate sales analytics from maintained sketches
+
+For order line tables too large to aggregate per request, one
+``ApproxAnalytics`` per process keeps fixed-size summaries of every line:
+
+- Count-Min sketches of revenue and quantity per product, plus the
+  heaviest products seen, for top products
+- exact revenue and a HyperLogLog of distinct customers per month
+- a uniform reservoir sample of lines, for revenue by category
+
+They are built in one streaming pass on a background thread, started by
+``start()`` (at startup with ``PRELOAD``) or by the first approximate
+request; until the first build finishes queries raise
+``SketchesNotReadyError``. After that they are kept current from the
+change log: inserted lines and orders are added as they arrive. Sketches
+cannot take back what they counted, so updates and deletes of existing
+orders and lines are only counted, reported with every result as
+``stale_changes``; once they exceed ``REBUILD_FRACTION`` of the lines
+seen, the sketches are rebuilt in the background while the current ones
+keep answering. Without change capture (non-SQLite backends) the
+sketches are rebuilt when the Order or OrderDetail table versions change.
+
+Every result carries its error bounds: Count-Min estimates are never
+below the true value and exceed it by at most ``revenue_error`` with the
+stated confidence; distinct counts have a relative standard error; sample
+estimates have 95% confidence intervals.
+"""
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Category, Order, OrderDetail, Product
+from src.services.change_service import ORDER_TABLES, ChangeService
+from src.services.data_service import DATABASE_URL, get_engine
+from src.services.table_versions import get_table_versions
+from src.utils import money
+from src.utils.db import execute_read, query_budget
+from src.utils.dialect import month_bucket
+from src.utils.sketches import CountMinSketch, HyperLogLog, Reservoir, estimate_group_sums
+from typing import Dict, Any, List, Optional, Sequence, Set
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+class SketchesNotReadyError(Exception):
+    """Raised while the first build of the sketches is still running"""
+
+# Count-Min error as a fraction of total revenue or quantity, and the chance of exceeding it
+CM_EPSILON = float(os.environ.get('APPROX_EPSILON', 0.0005))
+CM_DELTA = 0.01
+
+# Heaviest products tracked for top-products queries
+HEAVY_HITTERS = int(os.environ.get('APPROX_HEAVY_HITTERS', 100))
+
+# HyperLogLog registers per month are 2 ** HLL_PRECISION bytes
+HLL_PRECISION = 12
+
+# Order lines kept in the uniform sample
+SAMPLE_SIZE = int(os.environ.get('APPROX_SAMPLE_SIZE', 20000))
+
+# Share of lines changed or deleted after the build that triggers a rebuild
+REBUILD_FRACTION = float(os.environ.get('APPROX_REBUILD_FRACTION', 0.01))
+
+# Lines read per batch while building
+LOAD_CHUNK = 50000
+
+# Changes read from the log per refresh query
+CHANGE_BATCH = 1000
+
+_MONTH = month_bucket(Order.OrderDate)
+
+_LINE_COLUMNS = (
+    OrderDetail.Id,
+    func.coalesce(OrderDetail.ProductId, 0),
+    func.coalesce(OrderDetail.Quantity, 0),
+    func.coalesce(money.sql_cents(OrderDetail.Amount), 0),
+    _MONTH
+)
+
+_ALL_LINES = select(*_LINE_COLUMNS).outerjoin(Order, Order.Id == OrderDetail.OrderId)
+
+_LINES_BY_ID = _ALL_LINES.where(OrderDetail.Id.in_(bindparam('line_ids', expanding=True)))
+
+_CUSTOMER_MONTHS = select(_MONTH, Order.CustomerId)\
+    .where(Order.OrderDate.isnot(None), Order.CustomerId.isnot(None))\
+    .distinct()
+
+_CUSTOMER_MONTHS_BY_ORDER = _CUSTOMER_MONTHS.where(Order.Id.in_(bindparam('order_ids', expanding=True)))
+
+_PRODUCTS = select(Product.Id, Product.ProductName, Product.CategoryId)
+
+_CATEGORIES = select(Category.Id, Category.CategoryName_ColumnName)
+
+class SalesSketches:
+    """Sketches of every order line counted so far"""
+
+    def __init__(self, seq: int = 0):
+        self.seq = seq
+        self.lines = 0
+        self.max_line_id = 0
+        self.stale_changes = 0
+        self.revenue = CountMinSketch(CM_EPSILON, CM_DELTA, seed=1)
+        self.quantity = CountMinSketch(CM_EPSILON, CM_DELTA, seed=1)
+        self.heavy_hitters: Dict[int, int] = {}
+        self.month_revenue_cents: Dict[str, int] = {}
+        self.month_customers: Dict[str, HyperLogLog] = {}
+        # (product ID, revenue in cents) per sampled line
+        self.sample = Reservoir(SAMPLE_SIZE, 2, seed=1)
+
+    def add_lines(self, rows: Sequence[tuple]):
+        """Count (line ID, product ID, quantity, revenue cents, month) rows"""
+        import numpy as np
+
+        if not rows:
+            return
+        columns = np.array([row[1:4] for row in rows], dtype=np.int64).reshape(-1, 3)
+        products, quantities, cents = columns[:, 0], columns[:, 1], columns[:, 2]
+        self.lines += len(rows)
+        self.max_line_id = max(self.max_line_id, max(row[0] for row in rows))
+
+        product_ids, inverse = np.unique(products, return_inverse=True)
+        product_cents = np.bincount(inverse, weights=cents).astype(np.int64)
+        self.revenue.add(product_ids, product_cents)
+        self.quantity.add(product_ids, np.bincount(inverse, weights=quantities).astype(np.int64))
+        self._track_heavy_hitters(product_ids)
+
+        for month, month_cents in zip(*self._sum_by_month(rows, cents)):
+            self.month_revenue_cents[month] = self.month_revenue_cents.get(month, 0) + month_cents
+        self.sample.add(np.column_stack((products, cents)))
+
+    def add_customer_months(self, rows: Sequence[tuple]):
+        """Count (month, customer ID) pairs"""
+        by_month: Dict[str, List[str]] = {}
+        for month, customer_id in rows:
+            if month:
+                by_month.setdefault(month, []).append(customer_id)
+        for month, customer_ids in by_month.items():
+            sketch = self.month_customers.get(month)
+            if sketch is None:
+                sketch = self.month_customers[month] = HyperLogLog(HLL_PRECISION)
+            sketch.add_hashes(HyperLogLog.hash_values(customer_ids))
+
+    def _track_heavy_hitters(self, product_ids):
+        """Keep the HEAVY_HITTERS products with the largest estimated revenue"""
+        for product_id, estimate in zip(product_ids.tolist(), self.revenue.estimate(product_ids).tolist()):
+            self.heavy_hitters[product_id] = estimate
+        if len(self.heavy_hitters) > HEAVY_HITTERS:
+            kept = sorted(self.heavy_hitters.items(), key=lambda item: item[1], reverse=True)[:HEAVY_HITTERS]
+            self.heavy_hitters = dict(kept)
+
+    @staticmethod
+    def _sum_by_month(rows: Sequence[tuple], cents):
+        import numpy as np
+
+        months = np.array([row[4] or '' for row in rows])
+        month_keys, inverse = np.unique(months, return_inverse=True)
+        sums = np.bincount(inverse, weights=cents).astype(np.int64)
+        keep = month_keys != ''
+        return month_keys[keep].tolist(), sums[keep].tolist()
+
+class ApproxAnalytics:
+    """Sketch-backed top products, monthly sales and category sales with error bounds"""
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine: Engine of the application database
+        """
+        self.Session = sessionmaker(bind=engine)
+        self.sketches: Optional[SalesSketches] = None
+        self.order_versions: Optional[Sequence[int]] = None
+        self._lock = threading.Lock()
+        self._rebuild: Optional[threading.Thread] = None
+
+    def start(self):
+        """Build the sketches on a background thread unless they exist or are being built"""
+        with self._lock:
+            if self.sketches is None:
+                self._start_rebuild()
+
+    def refresh(self) -> SalesSketches:
+        """
+        Bring the sketches up to date
+
+        Returns:
+            The current sketches
+
+        Raises:
+            SketchesNotReadyError: If the sketches are not built yet; the build is started if it is not running
+        """
+        # The shared state outlives the request that happens to refresh it, so its budget does not apply
+        with self._lock, query_budget(None):
+            if self.sketches is None:
+                # The full scan would hold every request on the lock, so it never runs on a request thread
+                self._start_rebuild()
+                raise SketchesNotReadyError("Approximate analytics are being built, retry shortly")
+            session = self.Session()
+            try:
+                change_service = ChangeService(session)
+                if change_service.ensure_log():
+                    if change_service.missed_changes(self.sketches.seq):
+                        # Changes were pruned before being counted; only a rebuild recovers them
+                        self.sketches.stale_changes += 1
+                        self._start_rebuild()
+                        return self.sketches
+                    self._apply_changes(session, change_service, self.sketches)
+                    if self.sketches.stale_changes > REBUILD_FRACTION * max(self.sketches.lines, 1):
+                        self._start_rebuild()
+                else:
+                    order_versions = get_table_versions().versions(ORDER_TABLES)
+                    if order_versions != self.order_versions:
+                        self.order_versions = order_versions
+                        self.sketches.stale_changes += 1
+                        self._start_rebuild()
+                return self.sketches
+            finally:
+                session.close()
+
+    def top_products(self, limit: int = 10) -> Dict[str, Any]:
+        """
+        Estimated top products by revenue
+
+        Args:
+            limit: Number of products, at most HEAVY_HITTERS
+
+        Returns:
+            Dictionary with the products, largest revenue first, and their error bounds
+
+        Raises:
+            ValueError: If limit is out of range
+        """
+        import numpy as np
+
+        if not 1 <= limit <= HEAVY_HITTERS:
+            raise ValueError(f"Approximate top products are limited to {HEAVY_HITTERS}")
+        sketches = self.refresh()
+        with self._lock:
+            product_ids = np.array(list(sketches.heavy_hitters), dtype=np.int64)
+            revenue = sketches.revenue.estimate(product_ids) if product_ids.size else product_ids
+            quantity = sketches.quantity.estimate(product_ids) if product_ids.size else product_ids
+            revenue_error, quantity_error = sketches.revenue.error_bound(), sketches.quantity.error_bound()
+            meta = self._meta(sketches)
+        names = self._names(_PRODUCTS)
+
+        top = sorted(range(len(product_ids)), key=lambda i: (-revenue[i], product_ids[i]))
+        results = [{
+            'product_name': names.get(int(product_ids[i])),
+            'revenue': float(money.cents_to_decimal(revenue[i])),
+            'quantity_sold': int(quantity[i])
+        } for i in top if int(product_ids[i]) in names][:limit]
+        return dict(meta, method='count-min', confidence=1 - CM_DELTA,
+                    revenue_error=float(money.cents_to_decimal(round(revenue_error))),
+                    quantity_error=round(quantity_error, 1), results=results)
+
+    def sales_by_month(self) -> Dict[str, Any]:
+        """
+        Revenue and estimated distinct customers per month
+
+        Returns:
+            Dictionary with the months in order and the distinct count error
+        """
+        sketches = self.refresh()
+        with self._lock:
+            months = sorted(sketches.month_revenue_cents.keys() | sketches.month_customers.keys())
+            results = []
+            for month in months:
+                customers = sketches.month_customers.get(month)
+                results.append({
+                    'month': month,
+                    'revenue': float(money.cents_to_decimal(sketches.month_revenue_cents.get(month, 0))),
+                    'distinct_customers': round(customers.estimate()) if customers is not None else 0
+                })
+            meta = self._meta(sketches)
+        return dict(meta, method='hyperloglog',
+                    distinct_customers_relative_error=round(1.04 / math.sqrt(1 << HLL_PRECISION), 4), results=results)
+
+    def sales_by_category(self) -> Dict[str, Any]:
+        """
+        Revenue per category estimated from the line sample
+
+        Returns:
+            Dictionary with the categories, largest revenue first, each with a 95% confidence interval
+        """
+        import numpy as np
+
+        sketches = self.refresh()
+        with self._lock:
+            sample = sketches.sample.rows.copy()
+            seen = sketches.sample.seen
+            meta = self._meta(sketches)
+        session = self.Session()
+        try:
+            product_categories = {product_id: category_id
+                                  for product_id, _, category_id in execute_read(session, _PRODUCTS)}
+        finally:
+            session.close()
+        names = self._names(_CATEGORIES)
+
+        # Lines of products without a known category count as zero revenue for every category
+        categories = np.array([product_categories.get(product_id, -1) for product_id in sample[:, 0].tolist()],
+                              dtype=np.int64)
+        estimates = estimate_group_sums(categories, sample[:, 1], seen)
+        results = [{
+            'category_name': names[category_id],
+            'revenue': float(money.cents_to_decimal(round(revenue))),
+            'revenue_ci95': float(money.cents_to_decimal(round(error)))
+        } for category_id, (revenue, error) in estimates.items() if category_id in names]
+        results.sort(key=lambda row: row['revenue'], reverse=True)
+        return dict(meta, method='reservoir-sample', sample_size=len(sample), results=results)
+
+    def _meta(self, sketches: SalesSketches) -> Dict[str, Any]:
+        return {
+            'approximate': True,
+            'lines_counted': sketches.lines,
+            'stale_changes': sketches.stale_changes,
+            'rebuilding': self._rebuild is not None and self._rebuild.is_alive()
+        }
+
+    def _names(self, statement) -> Dict[int, str]:
+        session = self.Session()
+        try:
+            return {row[0]: row[1] for row in execute_read(session, statement)}
+        finally:
+            session.close()
+
+    def _build(self, session) -> SalesSketches:
+        """Sketch every line and order in one streaming pass"""
+        # Take the position first: lines inserted during the pass and already read are skipped by line ID
+        sketches = SalesSketches(ChangeService(session).latest_seq())
+        for rows in execute_read(session, _ALL_LINES.execution_options(yield_per=LOAD_CHUNK)).partitions():
+            sketches.add_lines(rows)
+        sketches.add_customer_months(execute_read(session, _CUSTOMER_MONTHS).all())
+        session.rollback()
+        return sketches
+
+    def _apply_changes(self, session, change_service: ChangeService, sketches: SalesSketches):
+        """Count inserted lines and orders; count updates and deletes as stale"""
+        while True:
+            changes = change_service.get_changes(sketches.seq, CHANGE_BATCH)
+            line_ids: Set[int] = set()
+            order_ids: Set[int] = set()
+            for change in changes['changes']:
+                if change['TableName'] not in ORDER_TABLES:
+                    continue
+                if change['Operation'] != 'insert':
+                    sketches.stale_changes += 1
+                elif change['TableName'] == 'OrderDetail':
+                    line_id = int(change['RowKey'])
+                    if line_id > sketches.max_line_id:
+                        line_ids.add(line_id)
+                    else:
+                        # Already read by the build this change raced with, or reusing an old line ID
+                        sketches.stale_changes += 1
+                else:
+                    order_ids.add(change['OrderId'])
+            if line_ids:
+                sketches.add_lines(execute_read(session, _LINES_BY_ID, {'line_ids': sorted(line_ids)}).all())
+            if order_ids:
+                sketches.add_customer_months(
+                    execute_read(session, _CUSTOMER_MONTHS_BY_ORDER, {'order_ids': sorted(order_ids)}).all()
+                )
+            sketches.seq = changes['last_seq']
+            if not changes['has_more']:
+                break
+
+    def _start_rebuild(self):
+        """Rebuild the sketches on a background thread unless a rebuild is running"""
+        if self._rebuild is not None and self._rebuild.is_alive():
+            return
+        self._rebuild = threading.Thread(target=self._run_rebuild, name='approx-rebuild', daemon=True)
+        self._rebuild.start()
+
+    def _run_rebuild(self):
+        session = self.Session()
+        try:
+            order_versions = get_table_versions().versions(ORDER_TABLES)
+            sketches = self._build(session)
+            with self._lock:
+                self.sketches = sketches
+                self.order_versions = order_versions
+        except Exception:
+            logger.exception("Approximate analytics rebuild failed")
+        finally:
+            session.close()
+
+_analytics: Optional[ApproxAnalytics] = None
+_analytics_lock = threading.Lock()
+
+def get_approx_analytics() -> ApproxAnalytics:
+    """Get the process-wide approximate analytics for the application database"""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = ApproxAnalytics(get_engine(DATABASE_URL))
+        return _analytics
@@ -0,0 +1,309 @@
+"""
+Change-data capture for orders and customers
+
+Inserts, updates and deletes on ``Customer``, ``Order`` and ``OrderDetail``
+are appended to the ``ChangeLog`` table by SQLite triggers, so bulk Core
+updates are captured as well as ORM flushes, in the same transaction as
+the change itself. Consumers read the log by sequence number to sync
+incrementally instead of re-reading whole tables. Entries older than
+``CHANGE_LOG_RETENTION_HOURS`` are deleted by the ``prune_change_log`` job;
+a consumer whose position falls into the pruned range re-reads in full
+(``missed_changes``) instead of syncing. ``CHANGE_LOG=false``
+turns capture off: the triggers are dropped and consumers fall back to
+their non-incremental paths.
+"""
+from datetime import datetime, timedelta
+from itertools import takewhile
+from sqlalchemy import bindparam, delete, func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from src.models.changes import ChangeLog
+from src.utils.db import execute_read
+from typing import Dict, Any, NamedTuple, Optional, Set, Tuple
+import logging
+import os
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+class CapturedTable(NamedTuple):
+    """A table whose row changes are logged; expressions use {row} for new/old"""
+    name: str
+    row_key: str
+    order_id: str
+    customer_id: str
+
+CAPTURED_TABLES = (
+    CapturedTable('Customer', '{row}.Id', 'NULL', '{row}.Id'),
+    CapturedTable('Order', '{row}.Id', '{row}.Id', '{row}.CustomerId'),
+    CapturedTable('OrderDetail', '{row}.Id', '{row}.OrderId',
+                  '(SELECT CustomerId FROM "Order" WHERE Id = {row}.OrderId)'),
+)
+
+# Tables whose changes affect a customer's balance and order counts
+ORDER_TABLES = ('Order', 'OrderDetail')
+
+# Whether changes are captured at all
+CHANGE_LOG = os.environ.get('CHANGE_LOG', 'true').lower() in ('1', 'true', 'yes')
+
+# Hours changes are kept before the prune_change_log job deletes them
+RETENTION_HOURS = float(os.environ.get('CHANGE_LOG_RETENTION_HOURS', 168))
+
+# Engines with the change log installed, so the schema is checked once per process
+_ready_logs: 'weakref.WeakKeyDictionary[Any, bool]' = weakref.WeakKeyDictionary()
+
+# Seconds between checks while a long-poll waits for changes
+POLL_INTERVAL = 0.25
+
+_CHANGES_AFTER = (
+    select(ChangeLog.Seq, ChangeLog.TableName, ChangeLog.Operation, ChangeLog.RowKey,
+           ChangeLog.OrderId, ChangeLog.CustomerId, ChangeLog.ChangedAt)
+    .where(ChangeLog.Seq > bindparam('since'))
+    .order_by(ChangeLog.Seq)
+    .limit(bindparam('limit'))
+)
+
+_CUSTOMER_CHANGES_AFTER = (
+    select(ChangeLog.Seq, ChangeLog.CustomerId)
+    .where(ChangeLog.Seq > bindparam('since'), ChangeLog.TableName.in_(bindparam('tables', expanding=True)))
+    .order_by(ChangeLog.Seq)
+    .limit(bindparam('limit'))
+)
+
+_ORDER_CHANGES_AFTER = (
+    select(ChangeLog.Seq, ChangeLog.OrderId)
+    .where(ChangeLog.Seq > bindparam('since'), ChangeLog.TableName.in_(ORDER_TABLES))
+    .order_by(ChangeLog.Seq)
+    .limit(bindparam('limit'))
+)
+
+_OLDEST_SEQ = select(func.min(ChangeLog.Seq))
+
+# Entries are scanned oldest first by sequence number, so ChangedAt needs no index
+_EXPIRED_SEQS = (
+    select(ChangeLog.Seq, ChangeLog.ChangedAt)
+    .order_by(ChangeLog.Seq)
+    .limit(bindparam('limit'))
+)
+
+_LATEST_SEQ = text("SELECT seq FROM sqlite_sequence WHERE name = 'ChangeLog'")
+
+class ChangeService:
+    """Service class for reading the change log"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def ensure_log(self) -> bool:
+        """
+        Create the change log table and its capture triggers if missing
+
+        Returns:
+            True if changes are being captured
+        """
+        engine = self.session.get_bind()
+        if engine in _ready_logs:
+            return _ready_logs[engine]
+
+        if not CHANGE_LOG:
+            self._drop_triggers(engine)
+            _ready_logs[engine] = False
+            return False
+
+        if engine.dialect.name != 'sqlite':
+            logger.warning("Change capture is only available on SQLite")
+            _ready_logs[engine] = False
+            return False
+
+        try:
+            ChangeLog.__table__.create(self.session.connection(), checkfirst=True)
+            for table in CAPTURED_TABLES:
+                for event, row, operation in (('INSERT', 'new', 'insert'),
+                                              ('UPDATE', 'new', 'update'),
+                                              ('DELETE', 'old', 'delete')):
+                    self.session.execute(text(
+                        f"CREATE TRIGGER IF NOT EXISTS ChangeLog_{table.name}_{operation} "
+                        f"AFTER {event} ON \"{table.name}\" BEGIN "
+                        f"INSERT INTO ChangeLog (TableName, Operation, RowKey, OrderId, CustomerId, ChangedAt) "
+                        f"VALUES ('{table.name}', '{operation}', {table.row_key.format(row=row)}, "
+                        f"{table.order_id.format(row=row)}, {table.customer_id.format(row=row)}, "
+                        f"strftime('%Y-%m-%dT%H:%M:%f', 'now')); END"
+                    ))
+            self.session.commit()
+            _ready_logs[engine] = True
+        except OperationalError as e:
+            logger.warning("Change capture unavailable: %s", e)
+            self.session.rollback()
+            _ready_logs[engine] = False
+        return _ready_logs[engine]
+
+    def _drop_triggers(self, engine):
+        """Remove capture triggers left by an earlier run, so disabled capture stops logging"""
+        if engine.dialect.name != 'sqlite':
+            return
+        try:
+            for table in CAPTURED_TABLES:
+                for operation in ('insert', 'update', 'delete'):
+                    self.session.execute(text(f"DROP TRIGGER IF EXISTS ChangeLog_{table.name}_{operation}"))
+            self.session.commit()
+        except OperationalError as e:
+            logger.warning("Could not drop change capture triggers: %s", e)
+            self.session.rollback()
+
+    def latest_seq(self) -> int:
+        """Sequence number of the most recent change (0 if none were ever logged)"""
+        if not self.ensure_log():
+            return 0
+        return self.session.execute(_LATEST_SEQ).scalar() or 0
+
+    def get_changes(self, since: int = 0, limit: int = 500) -> Dict[str, Any]:
+        """
+        Get changes logged after a sequence number
+
+        Args:
+            since: Sequence number the consumer has already seen (0 for everything)
+            limit: Maximum number of changes to return
+
+        Returns:
+            Dictionary with the changes in sequence order, the sequence number to
+            pass as ``since`` next, whether more changes are waiting, and ``resync``
+            when entries after ``since`` were pruned and the consumer must re-read
+        """
+        if not self.ensure_log():
+            return {'changes': [], 'last_seq': since, 'latest_seq': 0, 'has_more': False, 'resync': False}
+
+        changes = [dict(row) for row in
+                   execute_read(self.session, _CHANGES_AFTER, {'since': since, 'limit': limit}).mappings()]
+        latest = self.latest_seq()
+        last_seq = changes[-1]['Seq'] if changes else since
+
+        return {
+            'changes': changes,
+            'last_seq': last_seq,
+            'latest_seq': latest,
+            'has_more': last_seq < latest,
+            'resync': self._pruned_after(since, latest)
+        }
+
+    def missed_changes(self, since: int) -> bool:
+        """
+        Whether changes after a sequence number were pruned before being read
+
+        Args:
+            since: Sequence number the consumer has already seen
+
+        Returns:
+            True if the consumer must re-read in full instead of syncing from the log
+        """
+        if not self.ensure_log():
+            return False
+        return self._pruned_after(since, self.latest_seq())
+
+    def _pruned_after(self, since: int, latest: int) -> bool:
+        if since >= latest:
+            return False
+        oldest = execute_read(self.session, _OLDEST_SEQ).scalar()
+        # Sequence numbers have no gaps, so a first entry past since + 1 means pruned entries
+        return oldest is None or oldest > since + 1
+
+    def wait_for_changes(self, since: int = 0, timeout: float = 25.0, limit: int = 500) -> Dict[str, Any]:
+        """
+        Long-poll: like ``get_changes`` but waits up to ``timeout`` seconds for the first change
+
+        Args:
+            since: Sequence number the consumer has already seen
+            timeout: Seconds to wait before returning an empty result
+            limit: Maximum number of changes to return
+
+        Returns:
+            Same as ``get_changes``
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.latest_seq() > since or time.monotonic() >= deadline:
+                return self.get_changes(since, limit)
+            # End the read transaction so the next check sees newly committed changes
+            self.session.rollback()
+            time.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    def changed_customers(self, since: int = 0, limit: int = 1000,
+                          tables: Tuple[str, ...] = ORDER_TABLES) -> Tuple[Set[str], int, int]:
+        """
+        Customers whose orders or order lines changed after a sequence number
+
+        By default Customer row changes are not included, so rollups written
+        back to Customer do not feed themselves.
+
+        Args:
+            since: Sequence number already processed
+            limit: Maximum number of changes to read
+            tables: Captured tables whose changes count
+
+        Returns:
+            Tuple of (customer IDs, last sequence number read, changes read)
+        """
+        if not self.ensure_log():
+            return set(), since, 0
+
+        rows = execute_read(self.session, _CUSTOMER_CHANGES_AFTER,
+                            {'since': since, 'limit': limit, 'tables': list(tables)}).all()
+        customer_ids = {customer_id for _, customer_id in rows if customer_id is not None}
+        return customer_ids, (rows[-1][0] if rows else since), len(rows)
+
+    def changed_orders(self, since: int = 0, limit: int = 1000) -> Tuple[Set[int], int, int]:
+        """
+        Orders that were written, or had order lines written, after a sequence number
+
+        Args:
+            since: Sequence number already processed
+            limit: Maximum number of changes to read
+
+        Returns:
+            Tuple of (order IDs, last sequence number read, changes read)
+        """
+        if not self.ensure_log():
+            return set(), since, 0
+
+        rows = execute_read(self.session, _ORDER_CHANGES_AFTER, {'since': since, 'limit': limit}).all()
+        order_ids = {order_id for _, order_id in rows if order_id is not None}
+        return order_ids, (rows[-1][0] if rows else since), len(rows)
+
+    def prune(self, through_seq: int) -> int:
+        """
+        Delete changes up to and including a sequence number that every consumer has seen
+
+        Args:
+            through_seq: Last sequence number to delete
+
+        Returns:
+            Number of changes deleted
+        """
+        if not self.ensure_log():
+            return 0
+        deleted = self.session.execute(delete(ChangeLog).where(ChangeLog.Seq <= through_seq)).rowcount
+        self.session.commit()
+        return deleted
+
+    def prune_expired(self, retention_hours: Optional[float] = None, limit: int = 5000) -> Tuple[int, bool]:
+        """
+        Delete the oldest changes logged more than a retention period ago, without committing
+
+        Args:
+            retention_hours: Hours to keep changes (RETENTION_HOURS by default)
+            limit: Maximum number of changes to delete
+
+        Returns:
+            Tuple of (changes deleted, whether more expired changes may remain)
+        """
+        if not self.ensure_log():
+            return 0, False
+        hours = RETENTION_HOURS if retention_hours is None else retention_hours
+        cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat(timespec='milliseconds')
+        rows = self.session.execute(_EXPIRED_SEQS, {'limit': limit}).all()
+        # Changes are logged in time order, so the expired ones are a prefix of the log
+        expired = [seq for seq, _ in takewhile(lambda row: row[1] is not None and row[1] < cutoff, rows)]
+        if not expired:
+            return 0, False
+        self.session.execute(delete(ChangeLog).where(ChangeLog.Seq <= expired[-1]))
+        return len(expired), len(expired) == limit
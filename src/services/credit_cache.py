@@ -0,0 +1,314 @@
+"""
+Memoized credit checks
+
+A credit check only changes when the customer's orders, order lines or
+customer row change. Every customer has a version counter that ORM session
+events bump when such a write commits; a memoized result is served only
+while its customer's version is unchanged, so a hit can never be stale with
+respect to committed writes made through SQLAlchemy sessions.
+
+Versions are shared between worker processes through a small
+memory-mapped SQLite database, so a write committed by one worker
+invalidates the results memoized by all of them. The file is
+``CREDIT_CACHE_STORE``, by default one per application database in the
+temporary directory, so all workers must run on one host (or point
+``CREDIT_CACHE_STORE`` at a shared path). ``CREDIT_CACHE_STORE=memory``
+keeps versions in process memory, which is only correct with a single
+worker process. Results themselves stay in a per-process LRU.
+
+Writes that bypass the ORM (raw SQL, other applications) are not seen.
+"""
+from collections import OrderedDict
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from src.models.northwind import Customer, Order, OrderDetail
+from typing import Callable, Dict, Any, Iterable, Optional, Sequence, Set, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Results memoized per worker process
+MAX_ENTRIES = int(os.environ.get('CREDIT_CACHE_SIZE', 10_000))
+
+# Version key bumped by writes that cannot be attributed to customers
+ALL_CUSTOMERS = '*'
+
+# Customer attributes that feed a credit check
+_CUSTOMER_FIELDS = ('CreditLimit', 'CompanyName')
+
+Version = Tuple[int, int]
+
+class MemoryVersionStore:
+    """Per-customer version counters in process memory"""
+
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get(self, customer_id: str) -> Version:
+        """Current (all-customers, customer) version pair"""
+        return self.read((ALL_CUSTOMERS, customer_id))
+
+    def read(self, keys: Sequence[str]) -> Tuple[int, ...]:
+        """Current versions of any keys, 0 for keys never bumped"""
+        return tuple(self.versions.get(key, 0) for key in keys)
+
+    def bump(self, keys: Iterable[str]):
+        """Increment the versions of customers (or ALL_CUSTOMERS)"""
+        with self.lock:
+            for key in keys:
+                self.versions[key] = self.versions.get(key, 0) + 1
+
+class SQLiteVersionStore:
+    """Per-customer version counters in a memory-mapped SQLite file shared by worker processes"""
+
+    def __init__(self, path: str, mmap_size: int = 16 * 2**20):
+        """
+        Args:
+            path: Database file, created if missing
+            mmap_size: Bytes of the file SQLite may memory-map
+        """
+        self.path = path
+        self.mmap_size = mmap_size
+        # A version lookup runs on every credit check, so each thread keeps a plain
+        # sqlite3 connection instead of checking one out of an SQLAlchemy pool
+        self.local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS CreditVersion (Key TEXT PRIMARY KEY, Version INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            # WAL lets readers proceed while another worker bumps; mmap skips read syscalls
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self.local.connection = connection
+        return connection
+
+    def get(self, customer_id: str) -> Version:
+        """Current (all-customers, customer) version pair"""
+        return self.read((ALL_CUSTOMERS, customer_id))
+
+    def read(self, keys: Sequence[str]) -> Tuple[int, ...]:
+        """Current versions of any keys, 0 for keys never bumped"""
+        versions = dict(self._connection().execute(
+            f"SELECT Key, Version FROM CreditVersion WHERE Key IN ({', '.join('?' * len(keys))})", tuple(keys)
+        ).fetchall())
+        return tuple(versions.get(key, 0) for key in keys)
+
+    def bump(self, keys: Iterable[str]):
+        """Increment the versions of customers (or ALL_CUSTOMERS)"""
+        params = [(key,) for key in keys]
+        if not params:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                "INSERT INTO CreditVersion (Key, Version) VALUES (?, 1) "
+                "ON CONFLICT (Key) DO UPDATE SET Version = Version + 1", params
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+_memory_warned = False
+
+def configured_version_store():
+    """
+    Version store named by ``CREDIT_CACHE_STORE`` for the process-wide caches
+
+    Returns:
+        A SQLiteVersionStore shared by the workers of this host, or a
+        MemoryVersionStore for ``CREDIT_CACHE_STORE=memory``
+    """
+    global _memory_warned
+    path = os.environ.get('CREDIT_CACHE_STORE')
+    if path == 'memory':
+        if not _memory_warned:
+            _memory_warned = True
+            logger.warning("CREDIT_CACHE_STORE=memory: cached credit checks, aggregates and ETags are only "
+                           "invalidated by this process's writes; run a single worker process")
+        return MemoryVersionStore()
+    if not path:
+        from src.services.data_service import DATABASE_URL
+
+        digest = hashlib.sha1(DATABASE_URL.encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(tempfile.gettempdir(), f'northwind-versions-{digest}.sqlite')
+    return SQLiteVersionStore(path)
+
+# Stores bumped by the session events below
+_tracked_stores: 'weakref.WeakSet' = weakref.WeakSet()
+_events_lock = threading.Lock()
+
+def _pending(session: Session) -> Set[str]:
+    return session.info.setdefault('credit_versions', set())
+
+def _customers_of_orders(session: Session, order_ids: Iterable[int]) -> Set[str]:
+    order_ids = list(order_ids)
+    if not order_ids:
+        return set()
+    return set(session.connection().execute(select(Order.CustomerId).where(Order.Id.in_(order_ids))).scalars())
+
+def _after_flush(session: Session, flush_context):
+    """Record customers affected by the flushed customers, orders and order lines"""
+    pending = _pending(session)
+    order_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        attributes = inspect(instance).attrs
+        if isinstance(instance, Customer):
+            if instance in session.dirty and not any(attributes[field].history.has_changes()
+                                                     for field in _CUSTOMER_FIELDS):
+                continue
+            pending.add(instance.Id)
+        elif isinstance(instance, Order):
+            previous = attributes['CustomerId'].history.deleted
+            pending.update(customer_id for customer_id in (instance.CustomerId, *previous) if customer_id)
+        elif isinstance(instance, OrderDetail) and instance.OrderId is not None:
+            order_ids.add(instance.OrderId)
+    pending.update(_customers_of_orders(session, order_ids))
+
+def _do_orm_execute(state):
+    """Record customers affected by bulk ORM insert, update and delete statements"""
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    mapper = state.bind_mapper
+    entity = mapper.class_ if mapper is not None else None
+    if entity not in (Customer, Order, OrderDetail):
+        return
+
+    pending = _pending(state.session)
+    rows = state.parameters if isinstance(state.parameters, list) else None
+    if rows and entity is Customer and all('Id' in row for row in rows):
+        pending.update(row['Id'] for row in rows)
+    elif rows and entity is Order and all('Id' in row for row in rows):
+        # Bulk updates by primary key: the orders' customers before and after the write
+        pending.update(row['CustomerId'] for row in rows if row.get('CustomerId'))
+        pending.update(_customers_of_orders(state.session, (row['Id'] for row in rows)))
+    elif rows and entity is Order and state.is_insert and all(row.get('CustomerId') for row in rows):
+        pending.update(row['CustomerId'] for row in rows)
+    else:
+        pending.add(ALL_CUSTOMERS)
+
+def _after_commit(session: Session):
+    """Bump the versions of the customers written in the committed transaction"""
+    pending = session.info.pop('credit_versions', None)
+    if pending:
+        for store in list(_tracked_stores):
+            store.bump(pending)
+
+def _after_rollback(session: Session):
+    session.info.pop('credit_versions', None)
+
+def track_versions(store):
+    """Have committed ORM writes bump the versions in a store"""
+    with _events_lock:
+        if not event.contains(Session, 'after_flush', _after_flush):
+            event.listen(Session, 'after_flush', _after_flush)
+            event.listen(Session, 'do_orm_execute', _do_orm_execute)
+            event.listen(Session, 'after_commit', _after_commit)
+            event.listen(Session, 'after_rollback', _after_rollback)
+        _tracked_stores.add(store)
+
+class CreditCheckCache:
+    """LRU memo of credit check results, valid while the customer's version is unchanged"""
+
+    def __init__(self, store=None, max_entries: int = MAX_ENTRIES):
+        """
+        Args:
+            store: Version store, a new MemoryVersionStore by default
+            max_entries: Results kept before the least recently used is evicted
+        """
+        self.store = store if store is not None else MemoryVersionStore()
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, Tuple[Version, Dict[str, Any]]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        track_versions(self.store)
+
+    def check(self, customer_id: str, compute: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Get a customer's credit check, computing it on a miss
+
+        Args:
+            customer_id: Customer to check
+            compute: Uncached credit check, e.g. CreditService.check_credit_limit
+
+        Returns:
+            Credit check result (a copy the caller may modify)
+        """
+        # Read the version before computing: a write committed meanwhile bumps it past this entry
+        version = self.store.get(customer_id)
+        cached = self._current(customer_id, version)
+        if cached is not None:
+            return cached
+        with self.lock:
+            self.misses += 1
+
+        result = compute(customer_id)
+        with self.lock:
+            self.entries[customer_id] = (version, dict(result))
+            self.entries.move_to_end(customer_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def peek(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a customer's credit check only if a current one is memoized
+
+        Args:
+            customer_id: Customer to look up
+
+        Returns:
+            Credit check result (a copy), or None without computing anything
+        """
+        return self._current(customer_id, self.store.get(customer_id))
+
+    def _current(self, customer_id: str, version: Version) -> Optional[Dict[str, Any]]:
+        """Memoized result computed under the given version, counted as a hit"""
+        with self.lock:
+            entry = self.entries.get(customer_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(customer_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counts and the hit ratio"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'shared': isinstance(self.store, SQLiteVersionStore)
+            }
+
+_cache: Optional[CreditCheckCache] = None
+_cache_lock = threading.Lock()
+
+def get_credit_cache() -> CreditCheckCache:
+    """Get the process-wide credit check cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CreditCheckCache(configured_version_store())
+        return _cache
@@ -1,9 +1,118 @@
-from sqlalchemy import func
+from sqlalchemy import and_, bindparam, case, func, select, update
 from sqlalchemy.orm import Session
 from src.models.northwind import Customer, Order, OrderDetail, Product
-from typing import Dict, Any, Optional
+from src.utils import money
+from src.utils.db import LockStripes, execute_read, run_write_transaction
+from src.utils.profiling import traced
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date
 from decimal import Decimal
+import os
 
+# In-process locks serializing order placement per customer (customers hash onto a fixed set)
+_CUSTOMER_LOCKS = LockStripes(int(os.environ.get('CREDIT_LOCK_STRIPES', 64)))
+
+# Line unit price: the order detail's price, falling back to the product's current price
+_LINE_UNIT_PRICE = func.coalesce(func.nullif(OrderDetail.UnitPrice, 0), Product.UnitPrice)
+
+# Exact line amount in micros (see src.utils.money), computed by the database
+_LINE_MICROS = money.sql_line_micros(OrderDetail.Quantity, _LINE_UNIT_PRICE, OrderDetail.Discount)
+
+# Prebuilt statements: constructed once at import and executed with bound
+# parameters, so each call skips query construction and hits the compiled cache
+_UNSHIPPED = and_(Order.CustomerId == bindparam('customer_id'), Order.ShippedDate.is_(None))
+
+_CUSTOMER_CREDIT = select(Customer.CompanyName, Customer.CreditLimit)\
+    .where(Customer.Id == bindparam('customer_id'))
+
+# Row-locks the customer on databases that support it; SQLite relies on BEGIN IMMEDIATE instead
+_CUSTOMER_CREDIT_FOR_UPDATE = _CUSTOMER_CREDIT.with_for_update()
+
+_ORDER_TOTAL = select(func.coalesce(func.sum(_LINE_MICROS), 0))\
+    .select_from(OrderDetail)\
+    .join(Product, OrderDetail.ProductId == Product.Id)\
+    .where(OrderDetail.OrderId == bindparam('order_id'))
+
+_ORDER_TOTALS = select(OrderDetail.OrderId, func.sum(_LINE_MICROS))\
+    .join(Product, OrderDetail.ProductId == Product.Id)\
+    .where(OrderDetail.OrderId.in_(bindparam('order_ids', expanding=True)))\
+    .group_by(OrderDetail.OrderId)
+
+_UNSHIPPED_MISSING_TOTALS = select(Order.Id)\
+    .where(_UNSHIPPED, Order.AmountTotal.is_(None))
+
+_UNSHIPPED_BALANCE = select(func.count(Order.Id), func.coalesce(func.sum(money.sql_cents(Order.AmountTotal)), 0))\
+    .where(_UNSHIPPED)
+
+_UNSHIPPED_ORDERS = select(Order.Id, Order.OrderDate, Order.RequiredDate, Order.Freight,
+                           Order.ShipName, Order.OrderDetailCount)\
+    .where(_UNSHIPPED)\
+    .order_by(Order.OrderDate.desc())
+
+_ORDER_CENTS = select(Order.Id, money.sql_cents(Order.AmountTotal))\
+    .order_by(Order.Id)
+
+_ORDER_LINES = select(
+    OrderDetail.OrderId,
+    func.coalesce(OrderDetail.Quantity, 0),
+    money.sql_cents(_LINE_UNIT_PRICE),
+    money.sql_cents(func.coalesce(OrderDetail.Discount, 0))
+).join(Product, OrderDetail.ProductId == Product.Id)\
+ .order_by(OrderDetail.OrderId)
+
+_ONE_ORDER_CENTS = _ORDER_CENTS.where(Order.Id == bindparam('order_id'))
+
+_ONE_ORDER_LINES = _ORDER_LINES.where(OrderDetail.OrderId == bindparam('order_id'))
+
+_ORDER_CENTS_AFTER = _ORDER_CENTS.where(Order.Id > bindparam('after_id')).limit(bindparam('limit'))
+
+_ORDER_LINES_BETWEEN = _ORDER_LINES.where(OrderDetail.OrderId.between(bindparam('first_id'), bindparam('last_id')))
+
+_CUSTOMER_IDS_AFTER = select(Customer.Id)\
+    .where(Customer.Id > bindparam('after_id'))\
+    .order_by(Customer.Id)\
+    .limit(bindparam('limit'))
+
+_UNSHIPPED_FLAG = case((Order.ShippedDate.is_(None), 1), else_=0)
+
+_CUSTOMER_ROLLUPS = select(
+    Order.CustomerId,
+    func.count(Order.Id),
+    func.sum(_UNSHIPPED_FLAG),
+    func.coalesce(func.sum(_UNSHIPPED_FLAG * money.sql_cents(func.coalesce(Order.AmountTotal, 0))), 0)
+).where(Order.CustomerId.in_(bindparam('customer_ids', expanding=True)))\
+ .group_by(Order.CustomerId)
+
+_CREDIT_ROWS = select(
+    Customer.Id,
+    Customer.CompanyName,
+    Customer.CreditLimit,
+    func.count(Order.Id),
+    func.coalesce(func.sum(money.sql_cents(Order.AmountTotal)), 0)
+).outerjoin(Order, and_(Order.CustomerId == Customer.Id, Order.ShippedDate.is_(None)))\
+ .group_by(Customer.Id)
+
+_CREDIT_ROWS_WITH_LIMIT = _CREDIT_ROWS.where(Customer.CreditLimit > 0)
+
+_CREDIT_ROWS_BY_ID = _CREDIT_ROWS.where(Customer.Id.in_(bindparam('customer_ids', expanding=True)))
+
+_MISSING_TOTALS_WITH_LIMIT = select(Order.Id)\
+    .join(Customer, Order.CustomerId == Customer.Id)\
+    .where(Customer.CreditLimit > 0, Order.ShippedDate.is_(None), Order.AmountTotal.is_(None))
+
+_MISSING_TOTALS_BY_CUSTOMER = select(Order.Id)\
+    .where(Order.CustomerId.in_(bindparam('customer_ids', expanding=True)),
+           Order.ShippedDate.is_(None), Order.AmountTotal.is_(None))
+
+# One customer's credit row plus the number of unshipped orders still lacking a total
+_CREDIT_ROW_WITH_MISSING = _CREDIT_ROWS\
+    .add_columns(func.count(case((Order.AmountTotal.is_(None), Order.Id))))\
+    .where(Customer.Id == bindparam('customer_id'))
+
+_PRODUCT_PRICES = select(Product.Id, money.sql_cents(Product.UnitPrice), Product.Discontinued)\
+    .where(Product.Id.in_(bindparam('product_ids', expanding=True)))
+
+@traced
 class CreditService:
     """Service class for credit checking business logic"""
     
@@ -35,61 +144,73 @@ class CreditService:
         Returns:
             Total amount for the order
         """
-        order_details = self.session.query(OrderDetail, Product)\
-            .join(Product, OrderDetail.ProductId == Product.Id)\
-            .filter(OrderDetail.OrderId == order_id)\
-            .all()
+        total_micros = execute_read(self.session, _ORDER_TOTAL, {'order_id': order_id}).scalar()
         
-        total = Decimal('0.00')
-        for order_detail, product in order_details:
-            # Use product's current unit price if order detail doesn't have one
-            unit_price = order_detail.UnitPrice or product.UnitPrice
-            quantity = order_detail.Quantity or 0
-            
-            item_amount = self.calculate_item_amount(quantity, unit_price)
-            
-            # Apply discount if any
-            if order_detail.Discount:
-                discount_factor = Decimal('1.00') - (Decimal(str(order_detail.Discount)) / Decimal('100'))
-                item_amount *= discount_factor
+        return money.micros_to_decimal(total_micros)
+    
+    def calculate_order_totals_micros(self, order_ids: List[int]) -> Dict[int, int]:
+        """
+        Calculate exact totals for several orders in one grouped query
+        
+        Args:
+            order_ids: Order IDs to calculate totals for
             
-            total += item_amount
+        Returns:
+            Mapping of order ID to total in micros (orders without lines map to 0)
+        """
+        if not order_ids:
+            return {}
+        
+        rows = execute_read(self.session, _ORDER_TOTALS, {'order_ids': list(order_ids)})
         
-        return total
+        totals = dict.fromkeys(order_ids, 0)
+        totals.update((order_id, int(total_micros)) for order_id, total_micros in rows)
+        return totals
     
-    def calculate_customer_balance(self, customer_id: str) -> Decimal:
+    def _unshipped_balance_cents(self, customer_id: str) -> Tuple[int, int]:
         """
-        Calculate customer balance as sum of Order amount_total where date_shipped is null
+        Sum unshipped order totals in cents, backfilling missing order totals first
         
         Args:
             customer_id: Customer ID to calculate balance for
             
         Returns:
-            Current outstanding balance for the customer
+            Tuple of (unshipped order count, balance in cents)
         """
-        # Get all unshipped orders for the customer
-        unshipped_orders = self.session.query(Order)\
-            .filter(Order.CustomerId == customer_id)\
-            .filter(Order.ShippedDate.is_(None))\
-            .all()
-        
-        total_balance = Decimal('0.00')
+        # Calculate the order total for unshipped orders that don't have one yet
+        missing_ids = execute_read(self.session, _UNSHIPPED_MISSING_TOTALS, {'customer_id': customer_id})\
+            .scalars().all()
+        self._store_missing_totals(missing_ids)
         
-        for order in unshipped_orders:
-            # Calculate the order total if not already calculated
-            if order.AmountTotal is not None:
-                order_total = Decimal(str(order.AmountTotal))
-            else:
-                order_total = self.calculate_order_amount_total(order.Id)
-                # Update the order with calculated total
-                order.AmountTotal = float(order_total)
-            
-            total_balance += order_total
+        order_count, balance_cents = execute_read(self.session, _UNSHIPPED_BALANCE,
+                                                  {'customer_id': customer_id}).one()
         
         # Commit any updates to order totals
         self.session.commit()
         
-        return total_balance
+        return int(order_count), int(balance_cents)
+    
+    def _store_missing_totals(self, order_ids: List[int]):
+        """Calculate and store AmountTotal for orders that don't have one yet, leaving the commit to the caller"""
+        if order_ids:
+            totals = self.calculate_order_totals_micros(order_ids)
+            self.session.execute(update(Order), [
+                {'Id': order_id, 'AmountTotal': money.cents_to_decimal(money.micros_to_cents(total_micros))}
+                for order_id, total_micros in totals.items()
+            ])
+    
+    def calculate_customer_balance(self, customer_id: str) -> Decimal:
+        """
+        Calculate customer balance as sum of Order amount_total where date_shipped is null
+        
+        Args:
+            customer_id: Customer ID to calculate balance for
+            
+        Returns:
+            Current outstanding balance for the customer
+        """
+        _, balance_cents = self._unshipped_balance_cents(customer_id)
+        return money.cents_to_decimal(balance_cents)
     
     def check_credit_limit(self, customer_id: str) -> Dict[str, Any]:
         """
@@ -99,9 +220,10 @@ class CreditService:
             customer_id: Customer ID to check credit for
             
         Returns:
-            Dictionary containing credit check results
+            Dictionary containing credit check results; money values are
+            returned both as floats and as exact integer cents
         """
-        customer = self.session.query(Customer).filter(Customer.Id == customer_id).first()
+        customer = execute_read(self.session, _CUSTOMER_CREDIT, {'customer_id': customer_id}).first()
         
         if not customer:
             return {
@@ -111,28 +233,316 @@ class CreditService:
             }
         
         # Calculate current balance
-        current_balance = self.calculate_customer_balance(customer_id)
+        unshipped_order_count, balance_cents = self._unshipped_balance_cents(customer_id)
+        
+        return self._credit_result(customer_id, customer.CompanyName, money.to_cents(customer.CreditLimit),
+                                   balance_cents, unshipped_order_count)
+    
+    def check_credit_limits(self, customer_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Check credit for many customers in one grouped query
+        
+        Args:
+            customer_ids: Customers to check, or None for every customer with a credit limit
+            
+        Returns:
+            Mapping of customer ID to the same result as ``check_credit_limit``;
+            unknown customers are left out
+        """
+        if customer_ids is None:
+            missing_ids = execute_read(self.session, _MISSING_TOTALS_WITH_LIMIT).scalars().all()
+            statement, params = _CREDIT_ROWS_WITH_LIMIT, {}
+        else:
+            if not customer_ids:
+                return {}
+            params = {'customer_ids': list(customer_ids)}
+            missing_ids = execute_read(self.session, _MISSING_TOTALS_BY_CUSTOMER, params).scalars().all()
+            statement = _CREDIT_ROWS_BY_ID
+        self._store_missing_totals(missing_ids)
+        
+        results = {
+            customer_id: self._credit_result(customer_id, company_name, money.to_cents(credit_limit),
+                                             int(balance_cents), int(order_count))
+            for customer_id, company_name, credit_limit, order_count, balance_cents
+            in execute_read(self.session, statement, params)
+        }
+        
+        # Commit any updates to order totals
+        self.session.commit()
+        
+        return results
+    
+    def order_totals_cents(self, orders: List[Order]) -> Dict[int, int]:
+        """
+        Get totals of already-loaded orders in cents
+        
+        Stored totals are used as they are; orders without one are calculated
+        together in one grouped query, without storing the result.
+        
+        Args:
+            orders: Loaded orders
+            
+        Returns:
+            Mapping of order ID to total in cents
+        """
+        totals = {order.Id: money.to_cents(order.AmountTotal) for order in orders if order.AmountTotal is not None}
+        missing = self.calculate_order_totals_micros([order.Id for order in orders if order.AmountTotal is None])
+        totals.update((order_id, money.micros_to_cents(micros)) for order_id, micros in missing.items())
+        return totals
+    
+    def check_credit_from_orders(self, customer: Customer, orders: List[Order],
+                                 totals_cents: Dict[int, int]) -> Dict[str, Any]:
+        """
+        Check credit from a customer and orders that are already loaded
+        
+        Args:
+            customer: Loaded customer
+            orders: All of the customer's orders
+            totals_cents: Order totals in cents (see ``order_totals_cents``)
+            
+        Returns:
+            The same result as ``check_credit_limit``, without running a query
+        """
+        unshipped = [order.Id for order in orders if order.ShippedDate is None]
+        return self._credit_result(customer.Id, customer.CompanyName, money.to_cents(customer.CreditLimit),
+                                   sum(totals_cents[order_id] for order_id in unshipped), len(unshipped))
+    
+    def simulate_orders(self, customer_id: str, proposals: List[List[Dict[str, Any]]],
+                        current: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Decide whether proposed orders fit within a customer's credit limit
+        
+        Lines are priced at the products' current unit prices with one lookup
+        for all proposals. Each proposal is decided on its own against the
+        current balance (``approved``) and cumulatively, as if the approved
+        proposals before it had been placed (``approved_cumulative``).
+        
+        Args:
+            customer_id: Customer ID to simulate for
+            proposals: Proposed orders, each a list of lines with
+                ``product_id``, ``quantity`` and an optional ``discount`` percentage
+            current: A current credit check for the customer (e.g. a cache hit),
+                or None to read the balance from the database; a failed check
+                (unknown customer) is read again like None
+            
+        Returns:
+            Dictionary with the current credit check, the balance source
+            ('cache', 'query' or 'recalculated') and one decision per proposal
+            
+        Raises:
+            ValueError: For empty proposals or malformed lines
+        """
+        parsed = [self._parse_proposal(lines) for lines in proposals]
+        if not parsed:
+            raise ValueError("At least one proposal is required")
+        
+        if current is not None and current.get('success'):
+            source = 'cache'
+        else:
+            row = execute_read(self.session, _CREDIT_ROW_WITH_MISSING, {'customer_id': customer_id}).first()
+            if row is None:
+                return {'success': False, 'error': 'Customer not found', 'customer_id': customer_id}
+            _, company_name, credit_limit, order_count, balance_cents, missing_count = row
+            if missing_count:
+                # Some unshipped order has no stored total yet: the full check backfills it
+                current, source = self.check_credit_limit(customer_id), 'recalculated'
+            else:
+                current = self._credit_result(customer_id, company_name, money.to_cents(credit_limit),
+                                              int(balance_cents), int(order_count))
+                source = 'query'
+        
+        product_ids = sorted({line[0] for lines in parsed for line in lines})
+        prices = {product_id: (price_cents, bool(discontinued)) for product_id, price_cents, discontinued
+                  in execute_read(self.session, _PRODUCT_PRICES, {'product_ids': product_ids})}
+        
+        balance_cents = current['current_balance_cents']
+        limit_cents = current['credit_limit_cents']
+        cumulative_cents = balance_cents
+        decisions = []
+        for lines in parsed:
+            unknown = sorted({product_id for product_id, _, _ in lines if product_id not in prices})
+            if unknown:
+                decisions.append({
+                    'approved': False,
+                    'approved_cumulative': False,
+                    'error': f"Unknown product: {', '.join(str(product_id) for product_id in unknown)}"
+                })
+                continue
+            
+            priced = []
+            total_micros = 0
+            for product_id, quantity, discount in lines:
+                price_cents, discontinued = prices[product_id]
+                line_micros = money.line_amount_micros(quantity, price_cents, discount)
+                total_micros += line_micros
+                priced.append({
+                    'product_id': product_id,
+                    'quantity': quantity,
+                    'unit_price': float(money.cents_to_decimal(price_cents)),
+                    'discount': float(money.cents_to_decimal(discount)),
+                    'amount': float(money.micros_to_decimal(line_micros)),
+                    'discontinued': discontinued
+                })
+            total_cents = money.micros_to_cents(total_micros)
+            approved = balance_cents + total_cents <= limit_cents
+            approved_cumulative = cumulative_cents + total_cents <= limit_cents
+            if approved_cumulative:
+                cumulative_cents += total_cents
+            decisions.append({
+                'total': float(money.cents_to_decimal(total_cents)),
+                'total_cents': total_cents,
+                'new_balance': float(money.cents_to_decimal(balance_cents + total_cents)),
+                'new_balance_cents': balance_cents + total_cents,
+                'credit_available_after': float(money.cents_to_decimal(limit_cents - balance_cents - total_cents)),
+                'credit_available_after_cents': limit_cents - balance_cents - total_cents,
+                'approved': approved,
+                'approved_cumulative': approved_cumulative,
+                'lines': priced
+            })
+        
+        return {
+            'success': True,
+            'customer_id': customer_id,
+            'source': source,
+            'credit': current,
+            'proposals': decisions,
+            'approved_count': sum(1 for decision in decisions if decision['approved_cumulative']),
+            'balance_after_approved_cents': cumulative_cents
+        }
+    
+    def place_order(self, customer_id: str, employee_id: int, lines: List[Dict[str, Any]],
+                    required_date: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Place an order only if it keeps the customer within their credit limit
         
-        # Get credit limit
-        credit_limit = Decimal(str(customer.CreditLimit)) if customer.CreditLimit else Decimal('0.00')
+        The balance check and the insert happen in one write transaction
+        (see ``run_write_transaction``), so concurrent orders for the same
+        customer cannot both pass the check against the same balance. Orders
+        for one customer are also queued on an in-process lock, so they wait
+        for each other here instead of contending for the database lock.
         
+        Args:
+            customer_id: Customer placing the order
+            employee_id: Employee taking the order
+            lines: Lines with ``product_id``, ``quantity`` and an optional ``discount`` percentage
+            required_date: Optional required date (YYYY-MM-DD)
+            
+        Returns:
+            Dictionary with whether the order was accepted, its ID and total,
+            and the credit check after the decision
+            
+        Raises:
+            ValueError: For malformed lines or unknown products
+            DatabaseBusyError: If the database stayed locked through every retry
+        """
+        parsed = self._parse_proposal(lines)
+        if isinstance(employee_id, bool) or not isinstance(employee_id, int):
+            raise ValueError(f"Invalid employee_id: {employee_id!r}")
+        
+        with _CUSTOMER_LOCKS.lock_for(customer_id):
+            return run_write_transaction(
+                self.session, lambda: self._place_order(customer_id, employee_id, parsed, required_date)
+            )
+    
+    def _place_order(self, customer_id: str, employee_id: int, lines: List[Tuple[int, int, int]],
+                     required_date: Optional[str]) -> Dict[str, Any]:
+        """Check and insert an order inside the caller's write transaction"""
+        customer = execute_read(self.session, _CUSTOMER_CREDIT_FOR_UPDATE, {'customer_id': customer_id}).first()
+        if not customer:
+            return {'success': False, 'error': 'Customer not found', 'customer_id': customer_id}
+        
+        missing_ids = execute_read(self.session, _UNSHIPPED_MISSING_TOTALS, {'customer_id': customer_id})\
+            .scalars().all()
+        self._store_missing_totals(missing_ids)
+        order_count, balance_cents = execute_read(self.session, _UNSHIPPED_BALANCE,
+                                                  {'customer_id': customer_id}).one()
+        order_count, balance_cents = int(order_count), int(balance_cents)
+        
+        product_ids = sorted({product_id for product_id, _, _ in lines})
+        prices = {product_id: price_cents for product_id, price_cents, _
+                  in execute_read(self.session, _PRODUCT_PRICES, {'product_ids': product_ids})}
+        unknown = [product_id for product_id in product_ids if product_id not in prices]
+        if unknown:
+            raise ValueError(f"Unknown product: {', '.join(str(product_id) for product_id in unknown)}")
+        
+        line_micros = [money.line_amount_micros(quantity, prices[product_id], discount)
+                       for product_id, quantity, discount in lines]
+        total_cents = money.micros_to_cents(sum(line_micros))
+        credit_limit_cents = money.to_cents(customer.CreditLimit)
+        if balance_cents + total_cents > credit_limit_cents:
+            return {
+                'success': True,
+                'accepted': False,
+                'customer_id': customer_id,
+                'total': float(money.cents_to_decimal(total_cents)),
+                'total_cents': total_cents,
+                'error': 'Order would exceed the credit limit',
+                'credit': self._credit_result(customer_id, customer.CompanyName, credit_limit_cents,
+                                              balance_cents, order_count)
+            }
+        
+        order = Order(CustomerId=customer_id, EmployeeId=employee_id, OrderDate=date.today().isoformat(),
+                      RequiredDate=required_date, AmountTotal=money.cents_to_decimal(total_cents),
+                      OrderDetailCount=len(lines))
+        self.session.add(order)
+        self.session.flush()
+        self.session.add_all([
+            OrderDetail(OrderId=order.Id, ProductId=product_id, UnitPrice=money.cents_to_decimal(prices[product_id]),
+                        Quantity=quantity, Discount=money.cents_to_decimal(discount),
+                        Amount=money.micros_to_decimal(amount_micros))
+            for (product_id, quantity, discount), amount_micros in zip(lines, line_micros)
+        ])
+        return {
+            'success': True,
+            'accepted': True,
+            'customer_id': customer_id,
+            'order_id': order.Id,
+            'total': float(money.cents_to_decimal(total_cents)),
+            'total_cents': total_cents,
+            'credit': self._credit_result(customer_id, customer.CompanyName, credit_limit_cents,
+                                          balance_cents + total_cents, order_count + 1)
+        }
+    
+    @staticmethod
+    def _parse_proposal(lines: Any) -> List[Tuple[int, int, int]]:
+        """Validate a proposal's lines as (product ID, quantity, discount units) tuples"""
+        if not isinstance(lines, list) or not lines:
+            raise ValueError("Each proposal needs a non-empty list of lines")
+        parsed = []
+        for line in lines:
+            if not isinstance(line, dict):
+                raise ValueError("Each line must be an object with product_id and quantity")
+            product_id, quantity, discount = line.get('product_id'), line.get('quantity'), line.get('discount') or 0
+            if isinstance(product_id, bool) or not isinstance(product_id, int):
+                raise ValueError(f"Invalid product_id: {product_id!r}")
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+                raise ValueError(f"Invalid quantity for product {product_id}: {quantity!r}")
+            if isinstance(discount, bool) or not isinstance(discount, (int, float)) or not 0 <= discount <= 100:
+                raise ValueError(f"Invalid discount for product {product_id}: {discount!r}")
+            parsed.append((product_id, quantity, money.discount_units(discount)))
+        return parsed
+    
+    @staticmethod
+    def _credit_result(customer_id: str, customer_name: str, credit_limit_cents: int,
+                       balance_cents: int, unshipped_order_count: int) -> Dict[str, Any]:
+        """Build a credit check result from exact cent amounts"""
         # Check if balance is within credit limit
-        credit_available = credit_limit - current_balance
-        within_limit = current_balance <= credit_limit
+        available_cents = credit_limit_cents - balance_cents
+        within_limit = balance_cents <= credit_limit_cents
         
         return {
             'success': True,
             'customer_id': customer_id,
-            'customer_name': customer.CompanyName,
-            'current_balance': float(current_balance),
-            'credit_limit': float(credit_limit),
-            'credit_available': float(credit_available),
+            'customer_name': customer_name,
+            'current_balance': float(money.cents_to_decimal(balance_cents)),
+            'credit_limit': float(money.cents_to_decimal(credit_limit_cents)),
+            'credit_available': float(money.cents_to_decimal(available_cents)),
+            'current_balance_cents': balance_cents,
+            'credit_limit_cents': credit_limit_cents,
+            'credit_available_cents': available_cents,
             'within_credit_limit': within_limit,
-            'balance_percentage': float((current_balance / credit_limit * 100) if credit_limit > 0 else 0),
-            'unshipped_order_count': self.session.query(Order)
-                                                .filter(Order.CustomerId == customer_id)
-                                                .filter(Order.ShippedDate.is_(None))
-                                                .count()
+            'balance_percentage': balance_cents / credit_limit_cents * 100 if credit_limit_cents > 0 else 0.0,
+            'unshipped_order_count': unshipped_order_count
         }
     
     def get_credit_status_summary(self, customer_id: str) -> Dict[str, Any]:
@@ -151,20 +561,17 @@ class CreditService:
             return credit_check
         
         # Get unshipped orders with details
-        unshipped_orders = self.session.query(Order)\
-            .filter(Order.CustomerId == customer_id)\
-            .filter(Order.ShippedDate.is_(None))\
-            .order_by(Order.OrderDate.desc())\
-            .all()
+        unshipped_orders = execute_read(self.session, _UNSHIPPED_ORDERS, {'customer_id': customer_id}).all()
+        
+        order_totals = self.calculate_order_totals_micros([order.Id for order in unshipped_orders])
         
         orders_details = []
         for order in unshipped_orders:
-            order_total = self.calculate_order_amount_total(order.Id)
             orders_details.append({
                 'order_id': order.Id,
                 'order_date': order.OrderDate,
                 'required_date': order.RequiredDate,
-                'amount_total': float(order_total),
+                'amount_total': float(money.micros_to_decimal(order_totals[order.Id])),
                 'freight': float(order.Freight) if order.Freight else 0,
                 'ship_name': order.ShipName,
                 'order_detail_count': order.OrderDetailCount or 0
@@ -184,16 +591,14 @@ class CreditService:
             Update results
         """
         if order_id:
-            orders = self.session.query(Order).filter(Order.Id == order_id).all()
+            params = {'order_id': order_id}
+            orders = execute_read(self.session, _ONE_ORDER_CENTS, params).all()
+            lines = execute_read(self.session, _ONE_ORDER_LINES, params).all()
         else:
-            orders = self.session.query(Order).all()
+            orders = execute_read(self.session, _ORDER_CENTS).all()
+            lines = execute_read(self.session, _ORDER_LINES).all()
         
-        updated_count = 0
-        for order in orders:
-            new_total = self.calculate_order_amount_total(order.Id)
-            if order.AmountTotal != float(new_total):
-                order.AmountTotal = float(new_total)
-                updated_count += 1
+        updated_count = self._store_order_totals(orders, lines)
         
         self.session.commit()
         
@@ -202,3 +607,117 @@ class CreditService:
             'updated_orders': updated_count,
             'total_orders_processed': len(orders)
         }
+    
+    def update_order_amounts_chunk(self, after_order_id: int, limit: int) -> Dict[str, Any]:
+        """
+        Update the totals of the next orders by ID, leaving the commit to the caller
+        
+        Args:
+            after_order_id: Last order ID of the previous chunk (0 to start)
+            limit: Maximum number of orders in this chunk
+            
+        Returns:
+            Update results, with the last order ID processed (None when no orders were left)
+        """
+        orders = execute_read(self.session, _ORDER_CENTS_AFTER, {'after_id': after_order_id, 'limit': limit}).all()
+        if not orders:
+            return {'last_order_id': None, 'updated_orders': 0, 'total_orders_processed': 0}
+        
+        lines = execute_read(self.session, _ORDER_LINES_BETWEEN,
+                             {'first_id': orders[0][0], 'last_id': orders[-1][0]}).all()
+        
+        return {
+            'last_order_id': orders[-1][0],
+            'updated_orders': self._store_order_totals(orders, lines),
+            'total_orders_processed': len(orders)
+        }
+    
+    def _store_order_totals(self, orders: List[Tuple[int, Optional[int]]], lines: List[Tuple[int, int, int, int]]) -> int:
+        """
+        Recalculate order totals from their lines and write back the ones that changed
+        
+        Line amounts are computed as int64 arrays in one pass over the order
+        details and compared against the stored totals in cents.
+        
+        Args:
+            orders: (order ID, stored total in cents) rows, sorted by order ID
+            lines: (order ID, quantity, unit price in cents, discount units) rows, sorted by order ID
+            
+        Returns:
+            Number of orders updated
+        """
+        import numpy as np
+        
+        order_ids = np.fromiter((row[0] for row in orders), dtype=np.int64, count=len(orders))
+        stored_cents = np.fromiter((row[1] or 0 for row in orders), dtype=np.int64, count=len(orders))
+        missing = np.fromiter((row[1] is None for row in orders), dtype=bool, count=len(orders))
+        
+        line_columns = np.array(lines, dtype=np.int64).reshape(-1, 4)
+        line_micros = money.line_amounts_micros(line_columns[:, 1], line_columns[:, 2], line_columns[:, 3])
+        line_order_ids, order_micros = money.sum_by_key(line_columns[:, 0], line_micros)
+        
+        # Orders without lines total 0
+        new_cents = np.zeros(len(order_ids), dtype=np.int64)
+        positions = np.searchsorted(order_ids, line_order_ids)
+        found = (positions < len(order_ids)) & (order_ids[np.minimum(positions, len(order_ids) - 1)] == line_order_ids)
+        new_cents[positions[found]] = money.micros_to_cents_array(order_micros[found])
+        
+        changed = np.flatnonzero((new_cents != stored_cents) | missing)
+        if changed.size:
+            self.session.execute(update(Order), [
+                {'Id': int(order_ids[i]), 'AmountTotal': money.cents_to_decimal(new_cents[i])}
+                for i in changed
+            ])
+        return int(changed.size)
+    
+    def update_customer_rollups_chunk(self, after_customer_id: str, limit: int) -> Dict[str, Any]:
+        """
+        Backfill Customer.Balance, OrderCount and UnpaidOrderCount for the next customers by ID,
+        leaving the commit to the caller
+        
+        Args:
+            after_customer_id: Last customer ID of the previous chunk ('' to start)
+            limit: Maximum number of customers in this chunk
+            
+        Returns:
+            Update results, with the last customer ID processed (None when no customers were left)
+        """
+        customer_ids = execute_read(self.session, _CUSTOMER_IDS_AFTER,
+                                    {'after_id': after_customer_id, 'limit': limit}).scalars().all()
+        if not customer_ids:
+            return {'last_customer_id': None, 'updated_customers': 0}
+        
+        self.update_customer_rollups(customer_ids)
+        
+        return {'last_customer_id': customer_ids[-1], 'updated_customers': len(customer_ids)}
+    
+    def update_customer_rollups(self, customer_ids: List[str]) -> int:
+        """
+        Recompute Customer.Balance, OrderCount and UnpaidOrderCount for the given customers,
+        leaving the commit to the caller
+        
+        Args:
+            customer_ids: Customers to update
+            
+        Returns:
+            Number of customers updated
+        """
+        if not customer_ids:
+            return 0
+        
+        rollups = {
+            customer_id: (order_count, unpaid_count, balance_cents)
+            for customer_id, order_count, unpaid_count, balance_cents
+            in execute_read(self.session, _CUSTOMER_ROLLUPS, {'customer_ids': customer_ids})
+        }
+        updates = []
+        for customer_id in customer_ids:
+            order_count, unpaid_count, balance_cents = rollups.get(customer_id, (0, 0, 0))
+            updates.append({
+                'Id': customer_id,
+                'OrderCount': order_count,
+                'UnpaidOrderCount': unpaid_count,
+                'Balance': money.cents_to_decimal(balance_cents)
+            })
+        self.session.execute(update(Customer), updates)
+        return len(updates)
@@ -0,0 +1,276 @@
+"""
+Live credit state for dashboards
+
+One ``CreditState`` per process holds every credit-limited customer's
+credit check in memory. It is loaded once with a grouped query and then
+kept current from the change log: only customers whose orders, order
+lines or customer row changed are recomputed. A single pump thread does
+that work for all connected dashboards and fans out the differences, so
+the cost does not grow with the number of clients. Where change capture
+is unavailable (other backends, ``CHANGE_LOG=false``) the state is reloaded
+whenever the captured tables' versions change, and at least every
+``CREDIT_STATE_RELOAD`` seconds for writes the versions cannot see.
+
+Each subscriber buffers pending updates keyed by customer, so a slow
+client only ever receives the latest value per customer. A client that
+falls too far behind is sent a fresh snapshot instead of a backlog.
+"""
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from src.services.change_service import CAPTURED_TABLES, ChangeService
+from src.services.credit_service import CreditService
+from src.services.data_service import DATABASE_URL, get_engine
+from src.services.table_versions import get_table_versions
+from src.utils.db import query_budget
+from typing import Dict, Any, List, Optional, Sequence, Set, Tuple
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Concurrent stream clients per worker process
+MAX_SUBSCRIBERS = int(os.environ.get('CREDIT_STREAM_MAX_CLIENTS', 20))
+
+# Pending customer updates a subscriber may buffer before it is reset to a snapshot
+MAX_PENDING = 500
+
+# Changes read from the log per refresh query
+CHANGE_BATCH = 1000
+
+# Without change capture: seconds between full reloads, and between the pump's version checks
+RELOAD_AFTER = float(os.environ.get('CREDIT_STATE_RELOAD', 60))
+VERSION_POLL = 1.0
+
+# Seconds the pump waits after a failure before retrying, doubling up to PUMP_RETRY_MAX
+PUMP_RETRY = 1.0
+PUMP_RETRY_MAX = 30.0
+
+# Fields whose change is pushed to subscribers
+_TRACKED_FIELDS = ('current_balance_cents', 'credit_limit_cents', 'unshipped_order_count', 'customer_name')
+
+class CreditSubscriber:
+    """A stream client's pending updates"""
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.needs_snapshot = False
+        self.condition = threading.Condition()
+
+    def publish(self, changes: Dict[str, Optional[Dict[str, Any]]]):
+        """Queue changed credit checks (None for customers that left the credit list)"""
+        with self.condition:
+            if self.needs_snapshot:
+                return
+            # Later values replace earlier ones, so the backlog is bounded by customers, not events
+            self.pending.update(changes)
+            if len(self.pending) > self.max_pending:
+                self.pending.clear()
+                self.needs_snapshot = True
+            self.condition.notify()
+
+    def reset(self):
+        """Drop pending updates and have the client reload a snapshot"""
+        with self.condition:
+            self.pending.clear()
+            self.needs_snapshot = True
+            self.condition.notify()
+
+    def next(self, timeout: float) -> Tuple[bool, Dict[str, Optional[Dict[str, Any]]]]:
+        """
+        Wait for pending updates
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            Tuple of (whether the client must reload a snapshot, pending updates), empty on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or self.needs_snapshot, timeout=timeout)
+            needs_snapshot, pending = self.needs_snapshot, self.pending
+            self.needs_snapshot, self.pending = False, {}
+            return needs_snapshot, pending
+
+class CreditState:
+    """In-memory credit checks of credit-limited customers, kept current from the change log"""
+
+    def __init__(self, engine: Engine, max_subscribers: int = MAX_SUBSCRIBERS, poll_timeout: float = 25.0):
+        """
+        Args:
+            engine: Engine of the application database
+            max_subscribers: Stream clients allowed at once
+            poll_timeout: Seconds the pump waits on the change log per poll
+        """
+        self.Session = sessionmaker(bind=engine)
+        self.max_subscribers = max_subscribers
+        self.poll_timeout = poll_timeout
+        self.credits: Dict[str, Dict[str, Any]] = {}
+        self.seq: Optional[int] = None
+        # Table versions and time of the last full reload, when change capture is unavailable
+        self.table_versions: Optional[Sequence[int]] = None
+        self.loaded_at = 0.0
+        self.subscribers: Set[CreditSubscriber] = set()
+        self._refresh_lock = threading.Lock()
+        self._subscribers_lock = threading.Lock()
+        self._pump: Optional[threading.Thread] = None
+
+    def refresh(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Bring the state up to date with the change log (or reload it, without one)
+
+        Returns:
+            Credit checks that changed (None for customers that no longer have a credit limit)
+        """
+        # The position advances before the checks are recomputed, so a cancelled refresh would lose changes
+        with self._refresh_lock, query_budget(None):
+            session = self.Session()
+            try:
+                change_service = ChangeService(session)
+                credit_service = CreditService(session)
+                tables = tuple(table.name for table in CAPTURED_TABLES)
+                if not change_service.ensure_log():
+                    return self._reload(credit_service, tables)
+                if self.seq is None or change_service.missed_changes(self.seq):
+                    # Take the position first: changes made during the load are recomputed next time
+                    first = self.seq is None
+                    self.seq = change_service.latest_seq()
+                    checks = credit_service.check_credit_limits()
+                    if first:
+                        self.credits = checks
+                        return {}
+                    # Changes after the last position were pruned unread, so compare every check
+                    return self._apply(set(self.credits) | set(checks), checks)
+
+                customer_ids: Set[str] = set()
+                while True:
+                    changed, self.seq, count = change_service.changed_customers(self.seq, CHANGE_BATCH, tables)
+                    customer_ids |= changed
+                    if count < CHANGE_BATCH:
+                        break
+                if not customer_ids:
+                    return {}
+
+                return self._apply(customer_ids, credit_service.check_credit_limits(sorted(customer_ids)))
+            finally:
+                session.close()
+
+    def _reload(self, credit_service: CreditService, tables: Tuple[str, ...]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Reload every check if a table changed or the last load is too old; caller holds the refresh lock"""
+        versions = get_table_versions().versions(tables)
+        first = self.table_versions is None
+        if not first and versions == self.table_versions and time.monotonic() - self.loaded_at < RELOAD_AFTER:
+            return {}
+        # Versions are read first: a write committed during the load is reloaded next time
+        self.table_versions, self.loaded_at = versions, time.monotonic()
+        checks = credit_service.check_credit_limits()
+        if first:
+            self.credits = checks
+            return {}
+        return self._apply(set(self.credits) | set(checks), checks)
+
+    def _apply(self, customer_ids: Set[str], checks: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Store recomputed checks of customers and return those that changed"""
+        changes = {}
+        for customer_id in customer_ids:
+            check = checks.get(customer_id)
+            if check is None or check['credit_limit_cents'] <= 0:
+                if self.credits.pop(customer_id, None) is not None:
+                    changes[customer_id] = None
+                continue
+            previous = self.credits.get(customer_id)
+            if previous is None or any(previous[field] != check[field] for field in _TRACKED_FIELDS):
+                changes[customer_id] = check
+            self.credits[customer_id] = check
+        return changes
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current credit checks, highest usage first"""
+        changes = self.refresh()
+        if changes:
+            # Whoever refreshes first publishes, so subscribers never miss a change
+            self.publish(changes)
+        with self._refresh_lock:
+            credits = list(self.credits.values())
+        return sorted(credits, key=lambda check: check['balance_percentage'], reverse=True)
+
+    def subscribe(self) -> Optional[CreditSubscriber]:
+        """
+        Register a stream client
+
+        Returns:
+            The subscriber, or None if the connection limit is reached
+        """
+        with self._subscribers_lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = CreditSubscriber()
+            self.subscribers.add(subscriber)
+            if self._pump is None or not self._pump.is_alive():
+                self._pump = threading.Thread(target=self._run_pump, name='credit-state', daemon=True)
+                self._pump.start()
+            return subscriber
+
+    def unsubscribe(self, subscriber: CreditSubscriber):
+        """Remove a stream client"""
+        with self._subscribers_lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, changes: Dict[str, Optional[Dict[str, Any]]]):
+        """Fan changes out to every subscriber"""
+        with self._subscribers_lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.publish(changes)
+
+    def _run_pump(self):
+        """
+        Wait for logged changes and publish the resulting credit changes while anyone is subscribed
+
+        A failed refresh may have skipped changes, so after a failure the
+        state is reloaded in full, every subscriber is sent a snapshot and
+        the pump retries with a growing delay instead of stopping.
+        """
+        failures = 0
+        while True:
+            with self._subscribers_lock:
+                if not self.subscribers:
+                    self._pump = None
+                    return
+            session = self.Session()
+            try:
+                if self.table_versions is not None:
+                    time.sleep(min(VERSION_POLL, self.poll_timeout))
+                elif self.seq is not None:
+                    ChangeService(session).wait_for_changes(self.seq, timeout=self.poll_timeout, limit=1)
+                    session.rollback()
+                changes = self.refresh()
+                if changes:
+                    self.publish(changes)
+                failures = 0
+            except Exception:
+                failures += 1
+                delay = min(PUMP_RETRY * 2 ** (failures - 1), PUMP_RETRY_MAX)
+                logger.exception("Credit state pump failed; reloading in %.0fs", delay)
+                with self._refresh_lock:
+                    self.seq = self.table_versions = None
+                with self._subscribers_lock:
+                    subscribers = list(self.subscribers)
+                for subscriber in subscribers:
+                    subscriber.reset()
+                time.sleep(delay)
+            finally:
+                session.close()
+
+_state: Optional[CreditState] = None
+_state_lock = threading.Lock()
+
+def get_credit_state() -> CreditState:
+    """Get the process-wide credit state for the application database"""
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = CreditState(get_engine(DATABASE_URL))
+        return _state
@@ -0,0 +1,394 @@
+"""
+Inventory analytics: sales velocity, days of cover and reorder candidates
+
+One ``InventoryState`` per process keeps the units sold per product on
+each of the last ``max(WINDOWS)`` days as an int64 matrix. It is loaded
+once with a single query over that span and then kept current from the
+change log: only orders whose rows or lines changed are re-read, their
+previous lines are subtracted and their current lines added, so rolling
+window totals never rescan order history.
+
+Windows end at the latest order date, the data's own clock, rather than
+the wall clock, so a database without recent orders still reports
+meaningful velocity. The clock only moves forward; when it does, the
+matrix shifts and days leaving the span drop out.
+
+Stock columns are read from ``Product`` and re-read when its table
+version changes (see ``src.services.table_versions``). Velocity for every
+window, days of cover and reorder quantities are computed for all
+products in one vectorized pass and cached until the next change. Without
+change capture (non-SQLite backends) the sales matrix is reloaded when
+the Order or OrderDetail table versions change.
+"""
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Order, OrderDetail, Product
+from src.services.change_service import ORDER_TABLES, ChangeService
+from src.services.data_service import DATABASE_URL, get_engine
+from src.services.table_versions import get_table_versions
+from src.utils.db import execute_read, query_budget
+from src.utils.dialect import day_bucket
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+import os
+import threading
+
+if TYPE_CHECKING:
+    import numpy as np
+
+def _parse_windows(setting: str) -> Tuple[int, ...]:
+    """Parse a comma-separated list of window lengths in days"""
+    windows = tuple(sorted({int(part) for part in setting.split(',') if part.strip()}))
+    if not windows or windows[0] <= 0:
+        raise ValueError(f"Invalid inventory windows: {setting!r}")
+    return windows
+
+# Rolling windows, in days, over which sales velocity is reported
+WINDOWS = _parse_windows(os.environ.get('INVENTORY_WINDOWS', '7,30,90'))
+
+# Window whose velocity drives days of cover and reorder suggestions
+REORDER_WINDOW = int(os.environ.get('INVENTORY_REORDER_WINDOW', 30))
+
+# Days between placing a supplier order and receiving the goods
+LEAD_TIME_DAYS = int(os.environ.get('INVENTORY_LEAD_TIME_DAYS', 14))
+
+# Days of demand a reorder should cover once it arrives
+TARGET_COVER_DAYS = int(os.environ.get('INVENTORY_TARGET_COVER_DAYS', 30))
+
+# Changes read from the log per refresh query
+CHANGE_BATCH = 1000
+
+_DAY = day_bucket(Order.OrderDate)
+
+_LATEST_ORDER_DAY = select(func.max(_DAY))
+
+_LINES_SINCE = select(OrderDetail.OrderId, _DAY, OrderDetail.ProductId, OrderDetail.Quantity)\
+    .join(Order, Order.Id == OrderDetail.OrderId)\
+    .where(_DAY >= bindparam('start'))
+
+# Orders without lines are kept (with a NULL product) so their date still moves the clock
+_ORDER_LINES = select(Order.Id, _DAY, OrderDetail.ProductId, OrderDetail.Quantity)\
+    .outerjoin(OrderDetail, Order.Id == OrderDetail.OrderId)\
+    .where(Order.Id.in_(bindparam('order_ids', expanding=True)))
+
+_PRODUCT_STOCK = select(
+    Product.Id, Product.ProductName, Product.UnitsInStock, Product.UnitsOnOrder,
+    Product.ReorderLevel, Product.Discontinued, Product.UnitsShipped
+).order_by(Product.Id)
+
+class InventoryAnalysis(NamedTuple):
+    """Per-product arrays from one vectorized pass, aligned with ``products``"""
+    as_of: Optional[str]
+    windows: Tuple[int, ...]
+    products: List[Tuple[int, str, Optional[int]]]
+    units_sold: 'np.ndarray'
+    velocity: 'np.ndarray'
+    in_stock: 'np.ndarray'
+    on_order: 'np.ndarray'
+    reorder_level: 'np.ndarray'
+    discontinued: 'np.ndarray'
+
+def _day_numbers(days: Sequence[str]) -> 'np.ndarray':
+    """Days since 1970-01-01 of 'YYYY-MM-DD' strings"""
+    import numpy as np
+
+    return np.array(days, dtype='datetime64[D]').astype(np.int64)
+
+def _day_string(day: int) -> str:
+    import numpy as np
+
+    return str(np.datetime64(int(day), 'D'))
+
+class InventoryState:
+    """Daily units sold per product over the longest window, kept current from the change log"""
+
+    def __init__(self, engine: Engine, windows: Sequence[int] = WINDOWS):
+        """
+        Args:
+            engine: Engine of the application database
+            windows: Rolling window lengths in days
+        """
+        import numpy as np
+
+        self.Session = sessionmaker(bind=engine)
+        self.windows = tuple(sorted(windows))
+        self.span = self.windows[-1]
+        self.seq: Optional[int] = None
+        self.order_versions: Optional[Sequence[int]] = None
+        self.product_version: Optional[Sequence[int]] = None
+        # Day number of the latest order; column span - 1 of the matrix
+        self.as_of: Optional[int] = None
+        self.rows: Dict[int, int] = {}
+        self.daily = np.zeros((0, self.span), dtype=np.int64)
+        # (order ID, day, matrix row, quantity) of every line inside the span, to subtract on change
+        self.lines = np.zeros((0, 4), dtype=np.int64)
+        self.products: List[Tuple] = []
+        self._analysis: Optional[InventoryAnalysis] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """
+        Bring the sales matrix and stock levels up to date
+
+        Returns:
+            True if anything changed since the last refresh
+        """
+        # The shared state outlives the request that happens to refresh it, so its budget does not apply
+        with self._lock, query_budget(None):
+            session = self.Session()
+            try:
+                change_service = ChangeService(session)
+                versions = get_table_versions()
+                changed = False
+
+                product_version = versions.versions(['Product'])
+                if product_version != self.product_version:
+                    self.product_version = product_version
+                    self._load_products(session)
+                    changed = True
+
+                if change_service.ensure_log():
+                    if self.seq is None or change_service.missed_changes(self.seq):
+                        # Take the position first: orders changed during the load are re-applied next time
+                        self.seq = change_service.latest_seq()
+                        self._load_sales(session)
+                        changed = True
+                    else:
+                        order_ids = set()
+                        while True:
+                            ids, self.seq, count = change_service.changed_orders(self.seq, CHANGE_BATCH)
+                            order_ids |= ids
+                            if count < CHANGE_BATCH:
+                                break
+                        if order_ids:
+                            self._apply_orders(session, order_ids)
+                            changed = True
+                else:
+                    order_versions = versions.versions(ORDER_TABLES)
+                    if order_versions != self.order_versions:
+                        self.order_versions = order_versions
+                        self._load_sales(session)
+                        changed = True
+
+                if changed:
+                    self._analysis = None
+                return changed
+            finally:
+                session.close()
+
+    def analysis(self) -> InventoryAnalysis:
+        """Velocity and stock arrays for every product, recomputed only after changes"""
+        import numpy as np
+
+        self.refresh()
+        with self._lock:
+            if self._analysis is not None:
+                return self._analysis
+
+            product_ids = [row[0] for row in self.products]
+            rows = self._product_rows(product_ids)
+            # Window totals are suffix sums of each product's days, newest first
+            newest_first = np.cumsum(self.daily[rows, ::-1], axis=1)
+            units_sold = newest_first[:, [window - 1 for window in self.windows]]
+            stock = np.array([[row[2] or 0, row[3] or 0, row[4] or 0, row[5] or 0] for row in self.products],
+                             dtype=np.int64).reshape(-1, 4)
+
+            self._analysis = InventoryAnalysis(
+                as_of=_day_string(self.as_of) if self.as_of is not None else None,
+                windows=self.windows,
+                products=[(row[0], row[1], row[6]) for row in self.products],
+                units_sold=units_sold,
+                velocity=units_sold / np.array(self.windows, dtype=np.float64),
+                in_stock=stock[:, 0],
+                on_order=stock[:, 1],
+                reorder_level=stock[:, 2],
+                discontinued=stock[:, 3] != 0
+            )
+            return self._analysis
+
+    def velocity(self, window: int = REORDER_WINDOW) -> Dict[str, Any]:
+        """
+        Units sold and units per day for every product over each window
+
+        Args:
+            window: Window whose velocity orders the products, fastest first
+
+        Returns:
+            Dictionary with the as-of date, the windows and one entry per product
+
+        Raises:
+            ValueError: If window is not one of the configured windows
+        """
+        analysis = self.analysis()
+        column = self._window_column(window)
+        order = sorted(range(len(analysis.products)),
+                       key=lambda i: (-analysis.units_sold[i, column], analysis.products[i][0]))
+
+        return {
+            'as_of': analysis.as_of,
+            'windows': list(analysis.windows),
+            'sort_window': window,
+            'products': [{
+                'product_id': analysis.products[i][0],
+                'product_name': analysis.products[i][1],
+                'units_sold': {str(w): int(units) for w, units in zip(analysis.windows, analysis.units_sold[i])},
+                'units_per_day': {str(w): round(float(rate), 3) for w, rate in zip(analysis.windows, analysis.velocity[i])},
+                'units_in_stock': int(analysis.in_stock[i]),
+                'units_shipped': analysis.products[i][2],
+                'discontinued': bool(analysis.discontinued[i])
+            } for i in order]
+        }
+
+    def reorder(self, window: int = REORDER_WINDOW, lead_time_days: int = LEAD_TIME_DAYS,
+                target_cover_days: int = TARGET_COVER_DAYS) -> Dict[str, Any]:
+        """
+        Products that should be reordered now
+
+        A product that is not discontinued is a candidate when its stock plus
+        units on order is at or below its reorder level, or would run out
+        within the lead time at the window's sales rate. The suggested quantity
+        restores the reorder level plus the demand over the lead time and the
+        target cover.
+
+        Args:
+            window: Window whose sales rate is used
+            lead_time_days: Days until a reorder arrives
+            target_cover_days: Days of demand a reorder should cover after it arrives
+
+        Returns:
+            Dictionary with the parameters used and the candidates, least cover first
+
+        Raises:
+            ValueError: If window is not a configured window or a day count is negative
+        """
+        import numpy as np
+
+        if lead_time_days < 0 or target_cover_days < 0:
+            raise ValueError("Lead time and target cover must not be negative")
+        analysis = self.analysis()
+        rate = analysis.velocity[:, self._window_column(window)]
+        available = analysis.in_stock + analysis.on_order
+
+        selling = rate > 0
+        safe_rate = np.where(selling, rate, 1.0)
+        days_of_cover = np.where(selling, analysis.in_stock / safe_rate, np.inf)
+        available_cover = np.where(selling, available / safe_rate, np.inf)
+        below_level = available <= analysis.reorder_level
+        candidates = ~analysis.discontinued & (below_level | (available_cover < lead_time_days))
+        suggested = np.maximum(
+            np.ceil(rate * (lead_time_days + target_cover_days)).astype(np.int64) + analysis.reorder_level - available, 0
+        )
+
+        indexes = np.flatnonzero(candidates)
+        indexes = indexes[np.lexsort((indexes, available_cover[indexes]))]
+        return {
+            'as_of': analysis.as_of,
+            'window': window,
+            'lead_time_days': lead_time_days,
+            'target_cover_days': target_cover_days,
+            'candidates': [{
+                'product_id': analysis.products[i][0],
+                'product_name': analysis.products[i][1],
+                'units_in_stock': int(analysis.in_stock[i]),
+                'units_on_order': int(analysis.on_order[i]),
+                'reorder_level': int(analysis.reorder_level[i]),
+                'units_per_day': round(float(rate[i]), 3),
+                'days_of_cover': round(float(days_of_cover[i]), 1) if selling[i] else None,
+                'below_reorder_level': bool(below_level[i]),
+                'suggested_quantity': int(suggested[i])
+            } for i in indexes]
+        }
+
+    def _window_column(self, window: int) -> int:
+        if window not in self.windows:
+            raise ValueError(f"Window must be one of {', '.join(str(w) for w in self.windows)} days")
+        return self.windows.index(window)
+
+    def _load_products(self, session):
+        self.products = execute_read(session, _PRODUCT_STOCK).all()
+
+    def _load_sales(self, session):
+        """Read every line inside the span ending at the latest order date"""
+        import numpy as np
+
+        self.daily = np.zeros_like(self.daily)
+        self.lines = np.zeros((0, 4), dtype=np.int64)
+        self.as_of = None
+        latest = execute_read(session, _LATEST_ORDER_DAY).scalar()
+        if latest is None:
+            return
+        self.as_of = int(_day_numbers([latest])[0])
+        self._add_lines(execute_read(session, _LINES_SINCE, {'start': _day_string(self.as_of - self.span + 1)}).all())
+
+    def _apply_orders(self, session, order_ids: Iterable[int]):
+        """Replace the lines of changed orders with their current lines"""
+        import numpy as np
+
+        rows = execute_read(session, _ORDER_LINES, {'order_ids': sorted(order_ids)}).all()
+        days = [row[1] for row in rows if row[1] is not None]
+        if days:
+            latest = int(_day_numbers(days).max())
+            if self.as_of is None or latest > self.as_of:
+                self._advance(latest)
+
+        stale = np.isin(self.lines[:, 0], np.fromiter(order_ids, dtype=np.int64))
+        if stale.any():
+            old = self.lines[stale]
+            np.subtract.at(self.daily, (old[:, 2], old[:, 1] - (self.as_of - self.span + 1)), old[:, 3])
+            self.lines = self.lines[~stale]
+        self._add_lines(rows)
+
+    def _advance(self, day: int):
+        """Move the clock forward to day, dropping the days that leave the span"""
+        import numpy as np
+
+        if self.as_of is not None:
+            shift = min(day - self.as_of, self.span)
+            self.daily = np.concatenate(
+                (self.daily[:, shift:], np.zeros((self.daily.shape[0], shift), dtype=np.int64)), axis=1
+            )
+        self.as_of = day
+        self.lines = self.lines[self.lines[:, 1] > day - self.span]
+
+    def _add_lines(self, rows: Sequence[Tuple]):
+        """Add (order ID, day, product ID, quantity) rows that fall inside the span"""
+        import numpy as np
+
+        rows = [row for row in rows if row[1] is not None and row[2] is not None]
+        if not rows or self.as_of is None:
+            return
+        order_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        days = _day_numbers([row[1] for row in rows])
+        product_rows = self._product_rows([row[2] for row in rows])
+        quantities = np.fromiter((row[3] or 0 for row in rows), dtype=np.int64, count=len(rows))
+
+        columns = days - (self.as_of - self.span + 1)
+        inside = (columns >= 0) & (columns < self.span)
+        np.add.at(self.daily, (product_rows[inside], columns[inside]), quantities[inside])
+        self.lines = np.concatenate(
+            (self.lines, np.column_stack((order_ids, days, product_rows, quantities))[inside])
+        )
+
+    def _product_rows(self, product_ids: Sequence[int]) -> 'np.ndarray':
+        """Matrix rows of products, adding empty rows for products not seen before"""
+        import numpy as np
+
+        for product_id in set(product_ids) - self.rows.keys():
+            self.rows[product_id] = len(self.rows)
+        if len(self.rows) > self.daily.shape[0]:
+            self.daily = np.concatenate(
+                (self.daily, np.zeros((len(self.rows) - self.daily.shape[0], self.span), dtype=np.int64))
+            )
+        return np.fromiter((self.rows[product_id] for product_id in product_ids), dtype=np.int64,
+                           count=len(product_ids))
+
+_state: Optional[InventoryState] = None
+_state_lock = threading.Lock()
+
+def get_inventory_state() -> InventoryState:
+    """Get the process-wide inventory state for the application database"""
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = InventoryState(get_engine(DATABASE_URL))
+        return _state
@@ -0,0 +1,400 @@
+"""
+In-process background jobs
+
+Long-running maintenance (order recalculation, rollup backfill, index
+rebuilds) runs on a small thread pool instead of inside the request. Jobs
+are persisted in the ``Job`` table and processed in chunks; each chunk's
+writes and the job's progress commit in one short transaction, so API
+requests are never locked out for long and an interrupted job resumes
+from its last committed chunk. A chunk that overruns its time budget is
+cancelled and retried at half the size.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from src.models.jobs import Job
+from src.models.northwind import Customer, Order
+from src.services.change_service import ChangeService
+from src.services.credit_service import CreditService
+from src.services.data_service import DATABASE_URL, get_engine
+from src.services.search_service import SearchService, CUSTOMER_INDEX, PRODUCT_INDEX
+from src.utils.db import QueryTimeoutError, query_budget
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat is older than this is considered abandoned
+# (e.g. its worker process died) and may be resumed by another runner
+STALE_AFTER = timedelta(seconds=60)
+
+# Seconds a chunk's statements may take before the chunk is cancelled and retried at half the size
+CHUNK_BUDGET = float(os.environ.get('JOB_CHUNK_BUDGET', 2.0))
+
+# Largest chunk_size a job may be submitted with
+MAX_CHUNK_SIZE = 50_000
+
+def _now() -> str:
+    return datetime.utcnow().isoformat(timespec='seconds')
+
+def _is_int(value: Any) -> bool:
+    # JSON true/false arrive as bool, which is an int subclass
+    return isinstance(value, int) and not isinstance(value, bool)
+
+class JobHandler:
+    """Base class for chunked, resumable jobs"""
+
+    chunk_size = 200
+    # Time budget of one chunk, or None for chunks that cannot be split
+    chunk_budget: Optional[float] = CHUNK_BUDGET
+
+    def validate(self, params: Dict[str, Any]):
+        """
+        Check handler-specific parameters before the job is queued
+
+        Raises:
+            ValueError: If a parameter is invalid
+        """
+
+    def count(self, session: Session, params: Dict[str, Any]) -> Optional[int]:
+        """Number of items the job will process, for progress reporting"""
+        return None
+
+    def run_chunk(self, session: Session, params: Dict[str, Any], cursor: Any) -> Tuple[Any, int, Dict[str, int]]:
+        """
+        Process one chunk without committing
+
+        Args:
+            session: Session whose transaction the runner commits after the chunk
+            params: Job parameters
+            cursor: Position returned by the previous chunk, or None to start
+
+        Returns:
+            Tuple of (next cursor or None when finished, items processed, result counters to add)
+        """
+        raise NotImplementedError
+
+class RecalculateOrdersJob(JobHandler):
+    """Recalculate Order.AmountTotal for all orders"""
+
+    def count(self, session, params):
+        return session.query(func.count(Order.Id)).scalar()
+
+    def run_chunk(self, session, params, cursor):
+        result = CreditService(session).update_order_amounts_chunk(cursor or 0, params.get('chunk_size', self.chunk_size))
+        return result['last_order_id'], result['total_orders_processed'], {'updated_orders': result['updated_orders']}
+
+class BackfillCustomerRollupsJob(JobHandler):
+    """Backfill Customer.Balance, OrderCount and UnpaidOrderCount from orders"""
+
+    def count(self, session, params):
+        return session.query(func.count(Customer.Id)).scalar()
+
+    def run_chunk(self, session, params, cursor):
+        result = CreditService(session).update_customer_rollups_chunk(cursor or '', params.get('chunk_size', self.chunk_size))
+        return result['last_customer_id'], result['updated_customers'], {'updated_customers': result['updated_customers']}
+
+class SyncCustomerRollupsJob(JobHandler):
+    """Update rollups only for customers whose orders changed since a change log sequence number"""
+
+    chunk_size = 1000
+
+    def validate(self, params):
+        since = params.get('since', 0)
+        if not _is_int(since) or since < 0:
+            raise ValueError("since must be a non-negative integer")
+
+    def run_chunk(self, session, params, cursor):
+        since = cursor if cursor is not None else params.get('since', self._last_synced(session))
+        change_service = ChangeService(session)
+        if change_service.missed_changes(since):
+            raise ValueError(f"Changes after {since} were pruned; run backfill_customer_rollups instead")
+        customer_ids, last_seq, changes = change_service.changed_customers(
+            since, params.get('chunk_size', self.chunk_size))
+        if not changes:
+            return None, 0, {}
+        updated = CreditService(session).update_customer_rollups(sorted(customer_ids))
+        return last_seq, changes, {'updated_customers': updated}
+
+    @staticmethod
+    def _last_synced(session: Session) -> int:
+        """Sequence number reached by the last successful sync, so each sync picks up where it left off"""
+        cursor = session.execute(
+            select(Job.Cursor)
+            .where(Job.Kind == 'sync_customer_rollups', Job.Status == 'succeeded', Job.Cursor.isnot(None))
+            .order_by(Job.Id.desc())
+            .limit(1)
+        ).scalar()
+        return json.loads(cursor) if cursor else 0
+
+class RebuildSearchIndexJob(JobHandler):
+    """Build or refill the customer and product full-text indexes, one index per chunk"""
+
+    indexes = [CUSTOMER_INDEX, PRODUCT_INDEX]
+    chunk_budget = None
+
+    def count(self, session, params):
+        return len(self.indexes)
+
+    def run_chunk(self, session, params, cursor):
+        position = cursor or 0
+        rebuilt = SearchService(session).rebuild_index(self.indexes[position])
+        next_position = position + 1 if position + 1 < len(self.indexes) else None
+        return next_position, 1, {'rebuilt_indexes': int(rebuilt)}
+
+class PruneChangeLogJob(JobHandler):
+    """Delete change log entries older than the retention period (params: retention_hours)"""
+
+    chunk_size = 5000
+
+    def validate(self, params):
+        hours = params.get('retention_hours', 0)
+        if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not (math.isfinite(hours) and hours >= 0):
+            raise ValueError("retention_hours must be a non-negative number")
+
+    def run_chunk(self, session, params, cursor):
+        deleted, more = ChangeService(session).prune_expired(params.get('retention_hours'),
+                                                             params.get('chunk_size', self.chunk_size))
+        return ((cursor or 0) + deleted if more else None), deleted, {'deleted_changes': deleted}
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    'recalculate_orders': RecalculateOrdersJob(),
+    'backfill_customer_rollups': BackfillCustomerRollupsJob(),
+    'sync_customer_rollups': SyncCustomerRollupsJob(),
+    'rebuild_search_index': RebuildSearchIndexJob(),
+    'prune_change_log': PruneChangeLogJob(),
+}
+
+class JobRunner:
+    """Runs persisted jobs on a thread pool"""
+
+    def __init__(self, engine: Engine, max_workers: int = 2, chunk_pause: float = 0.01):
+        """
+        Args:
+            engine: Engine of the database holding both the data and the Job table
+            max_workers: Jobs that may run at the same time
+            chunk_pause: Seconds to sleep between chunks, giving other writers the lock
+        """
+        Job.__table__.create(engine, checkfirst=True)
+        self.Session = sessionmaker(bind=engine)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.chunk_pause = chunk_pause
+        self._stopped = threading.Event()
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Queue a job
+
+        Args:
+            kind: Key of JOB_HANDLERS
+            params: Handler parameters (e.g. chunk_size)
+
+        Returns:
+            ID of the new job
+
+        Raises:
+            ValueError: For unknown kinds, params that are not an object, or invalid parameter values
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = {} if params is None else params
+        if not isinstance(params, dict):
+            raise ValueError("Job params must be an object")
+        chunk_size = params.get('chunk_size', 1)
+        if not (_is_int(chunk_size) and 1 <= chunk_size <= MAX_CHUNK_SIZE):
+            raise ValueError(f"chunk_size must be an integer from 1 to {MAX_CHUNK_SIZE}")
+        JOB_HANDLERS[kind].validate(params)
+
+        session = self.Session()
+        try:
+            job = Job(Kind=kind, Status='queued', Params=json.dumps(params), Processed=0, CreatedAt=_now())
+            session.add(job)
+            session.commit()
+            job_id = job.Id
+        finally:
+            session.close()
+
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def schedule(self, kind: str, interval: float, params: Optional[Dict[str, Any]] = None) -> threading.Thread:
+        """
+        Submit a job every ``interval`` seconds, skipping runs while one of its kind is unfinished
+
+        Args:
+            kind: Key of JOB_HANDLERS
+            interval: Seconds between submissions; the first is one interval from now
+            params: Handler parameters
+
+        Returns:
+            The daemon thread submitting the jobs, which stops with the runner
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        def submit_periodically():
+            while not self._stopped.wait(interval):
+                try:
+                    if not self._unfinished(kind):
+                        self.submit(kind, params)
+                except Exception:
+                    logger.exception("Could not submit scheduled %s job", kind)
+
+        thread = threading.Thread(target=submit_periodically, name=f'schedule-{kind}', daemon=True)
+        thread.start()
+        return thread
+
+    def _unfinished(self, kind: str) -> bool:
+        """Whether a job of a kind is queued or running, in this process or another"""
+        session = self.Session()
+        try:
+            return session.execute(
+                select(Job.Id).where(Job.Kind == kind, Job.Status.in_(('queued', 'running'))).limit(1)
+            ).first() is not None
+        finally:
+            session.close()
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Get a job's status and progress"""
+        session = self.Session()
+        try:
+            job = session.get(Job, job_id)
+            return job.to_dict() if job else None
+        finally:
+            session.close()
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the most recent jobs"""
+        session = self.Session()
+        try:
+            return [job.to_dict() for job in session.query(Job).order_by(Job.Id.desc()).limit(limit)]
+        finally:
+            session.close()
+
+    def resume_interrupted(self) -> List[int]:
+        """
+        Queue jobs left unfinished by a previous process
+
+        Returns:
+            IDs of the jobs queued for resumption
+        """
+        stale_before = (datetime.utcnow() - STALE_AFTER).isoformat(timespec='seconds')
+        session = self.Session()
+        try:
+            job_ids = session.execute(select(Job.Id).where(or_(
+                Job.Status == 'queued',
+                (Job.Status == 'running') & (Job.UpdatedAt < stale_before)
+            ))).scalars().all()
+        finally:
+            session.close()
+
+        for job_id in job_ids:
+            self.executor.submit(self.run, job_id)
+        return job_ids
+
+    def _claim(self, session: Session, job_id: int) -> bool:
+        """Atomically mark a job as running, so only one runner processes it"""
+        stale_before = (datetime.utcnow() - STALE_AFTER).isoformat(timespec='seconds')
+        now = _now()
+        claimed = session.execute(
+            update(Job)
+            .where(Job.Id == job_id)
+            .where(or_(Job.Status == 'queued', (Job.Status == 'running') & (Job.UpdatedAt < stale_before)))
+            .values(Status='running', StartedAt=func.coalesce(Job.StartedAt, now), UpdatedAt=now)
+        ).rowcount
+        session.commit()
+        return claimed == 1
+
+    def run(self, job_id: int):
+        """Process a job chunk by chunk until it finishes, fails or is claimed elsewhere"""
+        session = self.Session()
+        try:
+            if not self._claim(session, job_id):
+                return
+
+            job = session.get(Job, job_id)
+            handler = JOB_HANDLERS[job.Kind]
+            params = json.loads(job.Params or '{}')
+            if job.Total is None:
+                job.Total = handler.count(session, params)
+                session.commit()
+
+            cursor = json.loads(job.Cursor) if job.Cursor else None
+            result = json.loads(job.Result) if job.Result else {}
+            while True:
+                cursor, processed, counters, params = self._run_chunk(session, handler, params, cursor)
+                for key, value in counters.items():
+                    result[key] = result.get(key, 0) + value
+
+                # Progress commits with the chunk's writes, so a resumed job never redoes or skips a chunk.
+                # A finished job keeps its last position, for jobs that continue from their predecessor.
+                if cursor is not None:
+                    job.Cursor = json.dumps(cursor)
+                job.Processed += processed
+                job.Result = json.dumps(result)
+                job.UpdatedAt = _now()
+                if cursor is None:
+                    job.Status = 'succeeded'
+                    job.FinishedAt = job.UpdatedAt
+                session.commit()
+
+                if cursor is None:
+                    logger.info("Job %s (%s) finished: %s", job_id, job.Kind, result)
+                    return
+                time.sleep(self.chunk_pause)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            session.rollback()
+            session.execute(update(Job).where(Job.Id == job_id)
+                            .values(Status='failed', Error=str(e), UpdatedAt=_now(), FinishedAt=_now()))
+            session.commit()
+        finally:
+            session.close()
+
+    def _run_chunk(self, session: Session, handler: JobHandler, params: Dict[str, Any],
+                   cursor: Any) -> Tuple[Any, int, Dict[str, int], Dict[str, Any]]:
+        """
+        Run one chunk under the handler's budget, halving the chunk size while it overruns
+
+        Returns:
+            The handler's (cursor, processed, counters), and the params to run
+            later chunks with (carrying the reduced chunk size)
+
+        Raises:
+            QueryTimeoutError: If even a single-item chunk overruns the budget
+        """
+        while True:
+            try:
+                with query_budget(handler.chunk_budget):
+                    return handler.run_chunk(session, params, cursor) + (params,)
+            except QueryTimeoutError:
+                session.rollback()
+                size = params.get('chunk_size', handler.chunk_size)
+                if size <= 1:
+                    raise
+                params = dict(params, chunk_size=size // 2)
+                logger.warning("Job chunk overran its %ss budget; retrying with chunk_size=%s",
+                               handler.chunk_budget, params['chunk_size'])
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs and scheduling them; running jobs can be resumed by the next runner"""
+        self._stopped.set()
+        self.executor.shutdown(wait=wait)
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+def get_job_runner() -> JobRunner:
+    """Get the process-wide job runner for the application database"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(get_engine(DATABASE_URL))
+        return _runner
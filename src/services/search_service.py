@@ -0,0 +1,281 @@
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from src.models.northwind import Customer, Product
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+class SearchIndex(NamedTuple):
+    """An FTS5 index over text columns of a source table"""
+    name: str
+    source: str
+    # Source column identifying a row
+    rowid: str
+    columns: Tuple[str, ...]
+    # bm25 weight per column, so e.g. company name matches outrank country matches
+    weights: Tuple[float, ...]
+    # For sources without an INTEGER PRIMARY KEY: table assigning each row key a stable integer,
+    # since VACUUM may renumber the implicit rowids an index would otherwise point at
+    key_table: Optional[str] = None
+
+    @property
+    def content(self) -> str:
+        """Table or view the index reads its rows from"""
+        return f'{self.name}Source' if self.key_table else self.source
+
+    def index_rowid(self, row: str) -> str:
+        """SQL expression for the index rowid of a trigger's new or old row"""
+        if self.key_table:
+            return f"(SELECT Key FROM {self.key_table} WHERE RowKey = {row}.{self.rowid})"
+        return f"{row}.{self.rowid}"
+
+CUSTOMER_INDEX = SearchIndex('CustomerSearch', 'Customer', 'Id',
+                             ('CompanyName', 'ContactName', 'City', 'Country'), (10.0, 5.0, 2.0, 1.0),
+                             key_table='CustomerSearchKey')
+
+PRODUCT_INDEX = SearchIndex('ProductSearch', 'Product', 'Id', ('ProductName',), (1.0,))
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Shortest word a search starts from. Every match is ranked, and one or two
+# letter prefixes match a large share of the table, so a query needs at
+# least one word this long before it is run at all.
+MIN_PREFIX_LENGTH = 3
+
+class SearchService:
+    """Service class for full-text customer and product search"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def _has_index(self, index: SearchIndex) -> bool:
+        """
+        Whether an index has been built, in its current layout
+
+        Searches never build an index, since filling one reads the whole
+        source table; until ``rebuild_index`` has run (``flask init-db`` or
+        the ``rebuild_search_index`` job) they fall back to LIKE.
+        """
+        if self.session.get_bind().dialect.name != 'sqlite':
+            return False
+        definition = self.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': index.name}
+        ).scalar()
+        return definition is not None and f"content='{index.content}'" in definition
+
+    def _create_index(self, index: SearchIndex):
+        """Create an FTS5 index with its sync triggers if missing, replacing one in an older layout"""
+        columns = ', '.join(index.columns)
+        new_values = ', '.join(f'new.{column}' for column in index.columns)
+        old_values = ', '.join(f'old.{column}' for column in index.columns)
+        content_rowid = 'Key' if index.key_table else index.rowid
+        definition = self.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': index.name}
+        ).scalar()
+        if definition is not None and f"content='{index.content}'" in definition:
+            return
+        if definition is not None:
+            # Created over another content table by an earlier version; replace it
+            self._drop(index)
+        if index.key_table:
+            self.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {index.key_table} "
+                f"(Key INTEGER PRIMARY KEY, RowKey NOT NULL UNIQUE)"
+            ))
+            self.session.execute(text(
+                f"CREATE VIEW IF NOT EXISTS {index.content} AS SELECT k.Key AS Key, "
+                f"{', '.join(f's.{column} AS {column}' for column in index.columns)} "
+                f"FROM {index.key_table} AS k JOIN \"{index.source}\" AS s ON s.{index.rowid} = k.RowKey"
+            ))
+        self.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {index.name} USING fts5("
+            f"{columns}, content='{index.content}', content_rowid='{content_rowid}', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+        ))
+        # External content tables are kept in sync with triggers on the source table
+        insert_entry = (f"INSERT INTO {index.name}(rowid, {columns}) "
+                        f"VALUES ({index.index_rowid('new')}, {new_values}); ")
+        delete_entry = self._delete_entry(index, old_values)
+        if index.key_table:
+            add_key = f"INSERT OR IGNORE INTO {index.key_table}(RowKey) VALUES (new.{index.rowid}); "
+            drop_key = f"DELETE FROM {index.key_table} WHERE RowKey = old.{index.rowid}; "
+            move_key = f"UPDATE {index.key_table} SET RowKey = new.{index.rowid} WHERE RowKey = old.{index.rowid}; "
+        else:
+            add_key = drop_key = move_key = ""
+        self.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {index.name}_ai AFTER INSERT ON \"{index.source}\" BEGIN "
+            f"{add_key}{insert_entry}END"
+        ))
+        self.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {index.name}_ad AFTER DELETE ON \"{index.source}\" BEGIN "
+            f"{delete_entry}{drop_key}END"
+        ))
+        self.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {index.name}_au "
+            f"AFTER UPDATE OF {columns}, {index.rowid} ON \"{index.source}\" BEGIN "
+            f"{delete_entry}{move_key}{insert_entry}END"
+        ))
+
+    @staticmethod
+    def _delete_entry(index: SearchIndex, old_values: str) -> str:
+        """Trigger statement removing the old row's terms from an index"""
+        columns = ', '.join(index.columns)
+        if index.key_table:
+            # A row without a key was never indexed, so there is nothing to delete
+            return (f"INSERT INTO {index.name}({index.name}, rowid, {columns}) "
+                    f"SELECT 'delete', Key, {old_values} FROM {index.key_table} WHERE RowKey = old.{index.rowid}; ")
+        return (f"INSERT INTO {index.name}({index.name}, rowid, {columns}) "
+                f"VALUES ('delete', old.{index.rowid}, {old_values}); ")
+
+    def _drop(self, index: SearchIndex):
+        for trigger in ('ai', 'ad', 'au'):
+            self.session.execute(text(f"DROP TRIGGER IF EXISTS {index.name}_{trigger}"))
+        self.session.execute(text(f"DROP TABLE IF EXISTS {index.name}"))
+
+    def rebuild_index(self, index: SearchIndex = CUSTOMER_INDEX) -> bool:
+        """
+        Build an index with its sync triggers, or refill an existing one from
+        its source table, e.g. after bulk loads that bypassed the triggers
+
+        Args:
+            index: Index to build
+
+        Returns:
+            True if the index was built, False without SQLite FTS5
+        """
+        if self.session.get_bind().dialect.name != 'sqlite':
+            return False
+        try:
+            self._create_index(index)
+            self._rebuild(index)
+        except OperationalError as e:
+            # SQLite built without FTS5
+            logger.warning("Full-text index %s unavailable, using LIKE search: %s", index.name, e)
+            self.session.rollback()
+            return False
+        return True
+
+    def _rebuild(self, index: SearchIndex):
+        """Refill an index from its source table and merge it into a single segment"""
+        if index.key_table:
+            self.session.execute(text(
+                f"DELETE FROM {index.key_table} WHERE RowKey NOT IN (SELECT {index.rowid} FROM \"{index.source}\")"
+            ))
+            self.session.execute(text(
+                f"INSERT OR IGNORE INTO {index.key_table}(RowKey) SELECT {index.rowid} FROM \"{index.source}\""
+            ))
+        self.session.execute(text(f"INSERT INTO {index.name}({index.name}) VALUES ('rebuild')"))
+        self.session.execute(text(f"INSERT INTO {index.name}({index.name}) VALUES ('optimize')"))
+        self.session.commit()
+
+    @staticmethod
+    def _searchable(tokens: List[str]) -> bool:
+        """Whether a query's words are selective enough to rank all of their matches"""
+        return any(len(token) >= MIN_PREFIX_LENGTH for token in tokens)
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        """
+        Build an FTS5 query matching every word of the input as a prefix
+
+        Args:
+            query: Free-text user input
+
+        Returns:
+            FTS5 MATCH expression, or an empty string if the input has no words
+        """
+        return ' '.join(f'"{token}"*' for token in _TOKEN.findall(query))
+
+    def _search(self, index: SearchIndex, query: str, select_columns: str, limit: int) -> List[Dict[str, Any]]:
+        """Run a prefix search against an FTS5 index, ranking every match"""
+        match = self._match_expression(query)
+        if not match:
+            return []
+
+        weights = ', '.join(str(weight) for weight in index.weights)
+        rows = self.session.execute(text(
+            f"SELECT {select_columns}, -bm25({index.name}, {weights}) AS score "
+            f"FROM {index.name} {self._join_source(index)} "
+            f"WHERE {index.name} MATCH :match "
+            f"ORDER BY bm25({index.name}, {weights}) "
+            f"LIMIT :limit"
+        ), {'match': match, 'limit': limit}).mappings()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _join_source(index: SearchIndex) -> str:
+        """JOIN clauses from the index to its source rows, aliased s"""
+        if index.key_table:
+            return (f"JOIN {index.key_table} AS k ON k.Key = {index.name}.rowid "
+                    f"JOIN \"{index.source}\" AS s ON s.{index.rowid} = k.RowKey")
+        return f"JOIN \"{index.source}\" AS s ON s.{index.rowid} = {index.name}.rowid"
+
+    def search_customers(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search customers by company, contact, city and country, best matches first
+
+        Every word in the query must match the start of a word in one of the
+        columns, so partial input works for typeahead. Queries without a word
+        of at least MIN_PREFIX_LENGTH characters return nothing.
+
+        Args:
+            query: Free-text user input
+            limit: Maximum number of results
+
+        Returns:
+            List of matching customers with a relevance score
+        """
+        tokens = _TOKEN.findall(query)
+        if not self._searchable(tokens):
+            return []
+        if self._has_index(CUSTOMER_INDEX):
+            return self._search(CUSTOMER_INDEX, query,
+                                's.Id, s.CompanyName, s.ContactName, s.City, s.Country', limit)
+
+        customers = self.session.query(Customer)
+        for token in tokens:
+            pattern = f'%{token}%'
+            customers = customers.filter(or_(*(getattr(Customer, column).ilike(pattern)
+                                               for column in CUSTOMER_INDEX.columns)))
+        return [
+            {
+                'Id': customer.Id,
+                'CompanyName': customer.CompanyName,
+                'ContactName': customer.ContactName,
+                'City': customer.City,
+                'Country': customer.Country,
+                'score': None
+            }
+            for customer in customers.order_by(Customer.CompanyName).limit(limit)
+        ]
+
+    def search_products(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search products by name, best matches first
+
+        Queries without a word of at least MIN_PREFIX_LENGTH characters return nothing.
+
+        Args:
+            query: Free-text user input
+            limit: Maximum number of results
+
+        Returns:
+            List of matching products with a relevance score
+        """
+        tokens = _TOKEN.findall(query)
+        if not self._searchable(tokens):
+            return []
+        if self._has_index(PRODUCT_INDEX):
+            return self._search(PRODUCT_INDEX, query, 's.Id, s.ProductName', limit)
+
+        products = self.session.query(Product)
+        for token in tokens:
+            products = products.filter(Product.ProductName.ilike(f'%{token}%'))
+        return [
+            {'Id': product.Id, 'ProductName': product.ProductName, 'score': None}
+            for product in products.order_by(Product.ProductName).limit(limit)
+        ]
@@ -0,0 +1,114 @@
+"""
+Per-table version counters for HTTP validators
+
+Every table has a version counter that ORM session events bump when a
+write to it commits, so a response built from some tables can be
+identified by their versions alone: the ETag changes exactly when one of
+the tables does, without hashing the body or querying the database.
+
+Counters live in the same kind of store as the credit check versions (see
+``src.services.credit_cache``): shared between the worker processes of a
+host through a memory-mapped SQLite file by default, or in process memory
+with ``CREDIT_CACHE_STORE=memory``. Writes that bypass the ORM session (raw SQL, Core
+statements on a bare connection, other applications) are not seen.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_mapper
+from src.services.credit_cache import MemoryVersionStore, configured_version_store
+from typing import Iterable, Optional, Sequence, Set
+import secrets
+import threading
+import weakref
+
+# Store key bumped whenever a process starts tracking a shared store
+EPOCH = 'epoch'
+
+def _table_key(table: str) -> str:
+    return f'table:{table}'
+
+# Stores bumped by the session events below
+_tracked_stores: 'weakref.WeakSet' = weakref.WeakSet()
+_events_lock = threading.Lock()
+
+def _pending(session: Session) -> Set[str]:
+    return session.info.setdefault('table_versions', set())
+
+def _after_flush(session: Session, flush_context):
+    """Record the tables of flushed instances"""
+    pending = _pending(session)
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending.add(object_mapper(instance).local_table.name)
+
+def _do_orm_execute(state):
+    """Record the tables written by bulk ORM insert, update and delete statements"""
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _pending(state.session).add(state.bind_mapper.local_table.name)
+
+def _after_commit(session: Session):
+    """Bump the versions of the tables written in the committed transaction"""
+    pending = session.info.pop('table_versions', None)
+    if pending:
+        keys = [_table_key(table) for table in pending]
+        for store in list(_tracked_stores):
+            store.bump(keys)
+
+def _after_rollback(session: Session):
+    session.info.pop('table_versions', None)
+
+class TableVersions:
+    """Version counters of tables, bumped by committed ORM writes"""
+
+    def __init__(self, store=None):
+        """
+        Args:
+            store: Version store, a new MemoryVersionStore by default
+        """
+        self.store = store if store is not None else MemoryVersionStore()
+        if isinstance(self.store, MemoryVersionStore):
+            # Counters restart at zero with the process, so validators issued before a restart must not match
+            self.token = secrets.token_hex(4)
+        else:
+            self.token = None
+            self.store.bump([EPOCH])
+        with _events_lock:
+            if not event.contains(Session, 'after_flush', _after_flush):
+                event.listen(Session, 'after_flush', _after_flush)
+                event.listen(Session, 'do_orm_execute', _do_orm_execute)
+                event.listen(Session, 'after_commit', _after_commit)
+                event.listen(Session, 'after_rollback', _after_rollback)
+            _tracked_stores.add(self.store)
+
+    def versions(self, tables: Sequence[str]) -> Sequence[int]:
+        """Current versions of tables"""
+        return self.store.read([_table_key(table) for table in tables])
+
+    def validator(self, tables: Sequence[str]) -> str:
+        """
+        Opaque token that changes whenever one of the tables changes
+
+        Args:
+            tables: Names of the tables a response is built from
+
+        Returns:
+            Token usable as (part of) a strong ETag
+        """
+        if self.token is not None:
+            epoch, versions = self.token, self.versions(tables)
+        else:
+            epoch, *versions = self.store.read([EPOCH] + [_table_key(table) for table in tables])
+        return f"{epoch}-{'.'.join(str(version) for version in versions)}"
+
+    def bump(self, tables: Iterable[str]):
+        """Mark tables as changed, e.g. after writes the session events cannot see"""
+        self.store.bump([_table_key(table) for table in tables])
+
+_versions: Optional[TableVersions] = None
+_versions_lock = threading.Lock()
+
+def get_table_versions() -> TableVersions:
+    """Get the process-wide table versions"""
+    global _versions
+    with _versions_lock:
+        if _versions is None:
+            _versions = TableVersions(configured_version_store())
+        return _versions
@@ -0,0 +1,214 @@
+"""
+Database helpers shared by the service classes
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, Result
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+
+T = TypeVar('T')
+
+# Attempts and backoff (seconds) for write transactions that find the database locked
+WRITE_ATTEMPTS = 8
+WRITE_BACKOFF = 0.01
+WRITE_BACKOFF_MAX = 0.5
+
+
+# SQLite virtual machine instructions between checks of the query budget
+BUDGET_CHECK_INSTRUCTIONS = int(os.environ.get('QUERY_BUDGET_CHECK_INSTRUCTIONS', 10_000))
+
+
+class DatabaseBusyError(Exception):
+    """A write transaction still found the database locked after every retry"""
+
+
+class QueryTimeoutError(Exception):
+    """A statement ran past the time budget of its request or job and was cancelled"""
+
+
+class QueryBudget:
+    """Wall-clock deadline shared by every statement run while it is active"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        # Set once a statement was cancelled, even if the caller swallowed the error
+        self.interrupted = False
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+
+_budget: ContextVar[Optional[QueryBudget]] = ContextVar('query_budget', default=None)
+
+
+@contextmanager
+def query_budget(seconds: Optional[float]) -> Iterator[Optional[QueryBudget]]:
+    """
+    Cancel statements still running ``seconds`` after entering
+
+    Budgets follow the context (thread or task) that entered them, so
+    statements of other requests and background jobs are unaffected.
+
+    Args:
+        seconds: Time allowed for all statements together, or None to lift
+            any enclosing budget (for work whose result outlives the request)
+
+    Yields:
+        The active budget, or None
+    """
+    budget = QueryBudget(seconds) if seconds is not None else None
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def _timeout_error(budget: QueryBudget) -> QueryTimeoutError:
+    budget.interrupted = True
+    return QueryTimeoutError(f"Query cancelled after exceeding its {budget.seconds:g}s time budget")
+
+
+def _progress_handler() -> int:
+    """SQLite progress callback: a non-zero return interrupts the running statement"""
+    budget = _budget.get()
+    if budget is not None and budget.expired():
+        budget.interrupted = True
+        return 1
+    return 0
+
+
+# Budgets are enforced on every engine and connection in the process; with
+# no budget active the listeners return at once. SQLite connections get a
+# progress handler that interrupts a statement once the budget runs out,
+# which rolls the statement back and releases the write lock with the
+# transaction. PostgreSQL statements run under a ``statement_timeout`` set
+# to the remaining budget. On every backend no new statement starts after
+# the budget is spent, and a cancelled statement raises QueryTimeoutError
+# instead of a driver error.
+@event.listens_for(Pool, 'connect')
+def _set_progress_handler(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(_progress_handler, BUDGET_CHECK_INSTRUCTIONS)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _check_budget(connection, cursor, statement, parameters, context, executemany):
+    budget = _budget.get()
+    if budget is None:
+        return
+    remaining = budget.remaining()
+    if remaining <= 0:
+        raise _timeout_error(budget)
+    if connection.dialect.name == 'postgresql':
+        cursor.execute(f"SET LOCAL statement_timeout = {max(1, int(remaining * 1000))}")
+
+
+@event.listens_for(Engine, 'handle_error')
+def _convert_cancellation(context):
+    budget = _budget.get()
+    if budget is not None and (budget.interrupted or budget.expired()):
+        return _timeout_error(budget)
+
+
+def execute_read(session: Session, statement, params: Optional[Dict[str, Any]] = None) -> Result:
+    """
+    Execute a prebuilt read-only statement at the Core level
+
+    Rows come back as plain tuples without ORM entity hydration, and the
+    statement's compiled form is reused from the engine's compiled cache.
+    Pending ORM changes are flushed first, as a session query would.
+
+    Args:
+        session: Session whose connection and transaction to use
+        statement: Prebuilt ``select()`` with bound parameters
+        params: Values for the bound parameters
+
+    Returns:
+        Core result
+    """
+    if session.autoflush:
+        session.flush()
+    return session.connection().execute(statement, params or {})
+
+
+def is_locked_error(error: Exception) -> bool:
+    """Whether a database error means another writer holds the lock"""
+    message = str(getattr(error, 'orig', error)).lower()
+    return isinstance(error, OperationalError) and ('database is locked' in message or 'database is busy' in message
+                                                    or 'table is locked' in message)
+
+
+def run_write_transaction(session: Session, work: Callable[[], T], attempts: int = WRITE_ATTEMPTS,
+                          backoff: float = WRITE_BACKOFF, backoff_max: float = WRITE_BACKOFF_MAX) -> T:
+    """
+    Run a read-check-write sequence in one transaction that holds the write lock from its first statement
+
+    On SQLite the transaction starts with ``BEGIN IMMEDIATE``, so the reads
+    the work makes cannot be invalidated by another writer before it
+    commits; other databases should take row locks (``with_for_update``)
+    in the work itself. If the database stays locked, the transaction is
+    rolled back and retried with jittered exponential backoff, for as long
+    as the active query budget allows. A transaction already open on the
+    session is committed first.
+
+    Args:
+        session: Session to run the work in
+        work: Callable doing the reads and writes, without committing
+        attempts: Tries before giving up
+        backoff: Delay before the first retry, doubled per retry
+        backoff_max: Longest delay between retries
+
+    Returns:
+        The work's return value, after commit
+
+    Raises:
+        DatabaseBusyError: If the database was still locked on the last attempt
+    """
+    if session.in_transaction():
+        session.commit()
+    for attempt in range(attempts):
+        try:
+            connection = session.connection()
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+            result = work()
+            session.commit()
+            return result
+        except OperationalError as e:
+            session.rollback()
+            if not is_locked_error(e):
+                raise
+            delay = random.uniform(0.5, 1.0) * min(backoff_max, backoff * 2 ** attempt)
+            budget = _budget.get()
+            if attempt == attempts - 1 or (budget is not None and budget.remaining() <= delay):
+                raise DatabaseBusyError(f"Database still locked after {attempt + 1} attempts") from e
+            time.sleep(delay)
+        except BaseException:
+            session.rollback()
+            raise
+
+
+class LockStripes:
+    """A fixed set of locks shared out by key hash, so each key has one lock without a lock per key"""
+
+    def __init__(self, count: int = 64):
+        self.locks = [threading.Lock() for _ in range(count)]
+
+    def lock_for(self, key: Any) -> threading.Lock:
+        """The lock guarding a key; different keys may share one"""
+        return self.locks[hash(key) % len(self.locks)]
@@ -0,0 +1,188 @@
+"""
+Backend-specific SQL behind portable helpers
+
+Prebuilt statements are constructed at import, before any engine exists,
+so backend differences are resolved when a statement is compiled for a
+dialect rather than when it is built:
+
+- ``year_bucket``/``month_bucket``/``day_bucket`` group ISO date strings:
+  ``strftime`` on SQLite, ``to_char(date_trunc(...))`` on PostgreSQL and a
+  prefix of the ISO string elsewhere
+- ``upsert`` uses ``INSERT ... ON CONFLICT DO UPDATE`` where the backend
+  has it and update-then-insert otherwise
+- ``bulk_insert`` streams rows through ``COPY`` on PostgreSQL and falls
+  back to a multi-row ``INSERT`` (SQLAlchemy's insertmanyvalues) elsewhere
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import csv
+import io
+
+from sqlalchemy import String, Table, and_, bindparam, insert, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class date_bucket(FunctionElement):
+    """Truncate an ISO date string to a bucket, returned as text (e.g. ``2024-03`` for a month)"""
+    type = String()
+    inherit_cache = True
+    unit = 'month'
+    sqlite_format = '%Y-%m'
+    postgresql_format = 'YYYY-MM'
+    width = 7
+
+
+class year_bucket(date_bucket):
+    inherit_cache = True
+    unit = 'year'
+    sqlite_format = '%Y'
+    postgresql_format = 'YYYY'
+    width = 4
+
+
+class month_bucket(date_bucket):
+    inherit_cache = True
+
+
+class day_bucket(date_bucket):
+    inherit_cache = True
+    unit = 'day'
+    sqlite_format = '%Y-%m-%d'
+    postgresql_format = 'YYYY-MM-DD'
+    width = 10
+
+
+@compiles(date_bucket)
+def _date_bucket_default(element, compiler, **kw):
+    # ISO-8601 strings sort and truncate as text
+    return f"substr({compiler.process(element.clauses, **kw)}, 1, {element.width})"
+
+
+@compiles(date_bucket, 'sqlite')
+def _date_bucket_sqlite(element, compiler, **kw):
+    return f"strftime('{element.sqlite_format}', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(date_bucket, 'postgresql')
+def _date_bucket_postgresql(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return f"to_char(date_trunc('{element.unit}', CAST({column} AS timestamp)), '{element.postgresql_format}')"
+
+
+def _dialect_insert(dialect_name: str):
+    """The dialect's INSERT construct with ON CONFLICT support, or None"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def upsert(connection: Connection, table: Table, rows: List[Dict[str, Any]], key_columns: Sequence[str],
+           update_columns: Optional[Sequence[str]] = None) -> int:
+    """
+    Insert rows, updating the rows whose key already exists
+
+    Args:
+        connection: Connection (or session connection) to write with
+        table: Target table
+        rows: Rows to write, all with the same keys
+        key_columns: Columns of a primary key or unique constraint identifying a row
+        update_columns: Columns overwritten on conflict, by default every non-key column given
+
+    Returns:
+        Number of rows written
+    """
+    if not rows:
+        return 0
+    if update_columns is None:
+        update_columns = [column for column in rows[0] if column not in key_columns]
+
+    dialect_insert = _dialect_insert(connection.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        if update_columns:
+            statement = statement.on_conflict_do_update(
+                index_elements=list(key_columns),
+                set_={column: statement.excluded[column] for column in update_columns}
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=list(key_columns))
+        connection.execute(statement, rows)
+        return len(rows)
+
+    # Portable fallback: update by key, then insert the rows no update matched
+    key = and_(*(table.c[column] == bindparam(f'key_{column}') for column in key_columns))
+    missing = []
+    for row in rows:
+        values = {column: row[column] for column in update_columns}
+        params = {f'key_{column}': row[column] for column in key_columns}
+        if not update_columns or connection.execute(update(table).where(key).values(values), params).rowcount == 0:
+            missing.append(row)
+    if missing:
+        connection.execute(insert(table), missing)
+    return len(rows)
+
+
+def bulk_insert(connection: Connection, table: Table, rows: Iterable[Dict[str, Any]],
+                batch_size: int = 50_000) -> int:
+    """
+    Load many rows as fast as the backend allows
+
+    On PostgreSQL with psycopg2 or psycopg the rows are streamed through
+    ``COPY ... FROM STDIN``; other backends get batched multi-row INSERTs.
+
+    Args:
+        connection: Connection (or session connection) to write with
+        table: Target table
+        rows: Rows to load, all with the same keys
+        batch_size: Rows buffered per COPY or INSERT
+
+    Returns:
+        Number of rows loaded
+    """
+    count = 0
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            count += _load_batch(connection, table, batch)
+            batch = []
+    if batch:
+        count += _load_batch(connection, table, batch)
+    return count
+
+
+# NULL marker for COPY, so empty strings stay empty strings
+_COPY_NULL = r'\N'
+
+
+def _load_batch(connection: Connection, table: Table, rows: List[Dict[str, Any]]) -> int:
+    driver = connection.dialect.driver if connection.dialect.name == 'postgresql' else None
+    if driver not in ('psycopg2', 'psycopg'):
+        connection.execute(insert(table), rows)
+        return len(rows)
+
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_COPY_NULL if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+
+    column_list = ', '.join(connection.dialect.identifier_preparer.quote(column) for column in columns)
+    copy_sql = (f"COPY {connection.dialect.identifier_preparer.format_table(table)} ({column_list}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')")
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        if driver == 'psycopg2':
+            cursor.copy_expert(copy_sql, buffer)
+        else:
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    return len(rows)
@@ -0,0 +1,136 @@
+"""
+Fixed-point money helpers.
+
+Money is carried as Python/NumPy integers so that totals are exact:
+
+- ``cents`` for stored money values (prices, order totals, credit limits)
+- ``micros`` (millionths of a currency unit) for line amounts, the smallest
+  scale at which ``quantity * unit_price * (1 - discount / 100)`` is exact
+  for cent prices and discounts with two decimals
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Tuple, TYPE_CHECKING
+
+from sqlalchemy import Integer, cast, func
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CENTS_PER_UNIT = 100
+MICROS_PER_UNIT = 1_000_000
+MICROS_PER_CENT = MICROS_PER_UNIT // CENTS_PER_UNIT
+
+# Discounts are percentages with two decimals, so the discount factor
+# ``1 - discount / 100`` is a whole number of 1/10000ths
+DISCOUNT_SCALE = 10_000
+
+_CENT = Decimal('0.01')
+
+
+def to_cents(value: Any) -> int:
+    """Convert a money value (Decimal, float, int or None) to integer cents"""
+    if value is None:
+        return 0
+    return int(Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP) * CENTS_PER_UNIT)
+
+
+def discount_units(discount: Any) -> int:
+    """Convert a discount percentage to integer hundredths of a percent"""
+    return to_cents(discount)
+
+
+def line_amount_micros(quantity: int, unit_price_cents: int, discount: int = 0) -> int:
+    """
+    Exact line amount in micros
+
+    Args:
+        quantity: Number of units
+        unit_price_cents: Price per unit in cents
+        discount: Discount in hundredths of a percent (see ``discount_units``)
+
+    Returns:
+        quantity * unit_price * (1 - discount / 100) in micros
+    """
+    return (quantity or 0) * unit_price_cents * (DISCOUNT_SCALE - discount)
+
+
+def micros_to_cents(micros: int) -> int:
+    """Round micros to the nearest cent, halves away from zero"""
+    rounded = (abs(micros) + MICROS_PER_CENT // 2) // MICROS_PER_CENT
+    return rounded if micros >= 0 else -rounded
+
+
+def micros_to_decimal(micros: int) -> Decimal:
+    """Exact Decimal value of an amount in micros"""
+    return Decimal(int(micros)).scaleb(-6)
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    """Exact Decimal value of an amount in cents"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+# SQL expressions: evaluated by the database in 64-bit integer arithmetic
+
+def sql_cents(column):
+    """SQL expression converting a money column to integer cents"""
+    return cast(func.round(column * CENTS_PER_UNIT), Integer)
+
+
+def sql_line_micros(quantity, unit_price, discount):
+    """SQL expression for the exact line amount in micros"""
+    return func.coalesce(quantity, 0) \
+        * sql_cents(unit_price) \
+        * (DISCOUNT_SCALE - sql_cents(func.coalesce(discount, 0)))
+
+
+# Vectorized bulk paths (NumPy is imported on first use to keep startup fast)
+
+def line_amounts_micros(quantities, unit_price_cents, discounts) -> 'np.ndarray':
+    """
+    Vectorized ``line_amount_micros`` over int64 arrays
+
+    Args:
+        quantities: Units per line
+        unit_price_cents: Price per unit in cents
+        discounts: Discount per line in hundredths of a percent
+
+    Returns:
+        int64 array of line amounts in micros
+    """
+    import numpy as np
+
+    quantities = np.asarray(quantities, dtype=np.int64)
+    unit_price_cents = np.asarray(unit_price_cents, dtype=np.int64)
+    discounts = np.asarray(discounts, dtype=np.int64)
+    return quantities * unit_price_cents * (DISCOUNT_SCALE - discounts)
+
+
+def sum_by_key(keys, values) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Sum int64 values per key
+
+    Args:
+        keys: Group keys, sorted ascending
+        values: Values to sum, aligned with keys
+
+    Returns:
+        Tuple of (unique keys, int64 sums)
+    """
+    import numpy as np
+
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=np.int64)
+    if keys.size == 0:
+        return keys, values
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return keys[starts], np.add.reduceat(values, starts)
+
+
+def micros_to_cents_array(micros) -> 'np.ndarray':
+    """Vectorized ``micros_to_cents``"""
+    import numpy as np
+
+    micros = np.asarray(micros, dtype=np.int64)
+    rounded = (np.abs(micros) + MICROS_PER_CENT // 2) // MICROS_PER_CENT
+    return np.where(micros >= 0, rounded, -rounded)
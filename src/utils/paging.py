@@ -0,0 +1,111 @@
+"""
+Keyset (seek) pagination for the listing pages
+
+OFFSET paging reads and throws away every row before the page, so deep
+pages cost as much as the table. Keyset paging continues from the sort key
+of the last row shown instead::
+
+    WHERE (sort_key, id) > (:last_sort_key, :last_id) ORDER BY sort_key, id LIMIT :n
+
+which an index on the sort key answers in O(page size) at any depth, and
+which stays stable while rows are inserted ahead of the reader. Cursors are
+opaque URL-safe tokens carrying that key; sort keys must be non-NULL (wrap
+nullable columns in ``coalesce``) so the row comparison is total.
+"""
+from sqlalchemy import literal, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement, Select
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+import base64
+import binascii
+import decimal
+import json
+
+from src.utils.db import execute_read
+
+
+class Page(NamedTuple):
+    """One page of rows with the cursors of its neighbours"""
+    rows: List[Tuple]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode a row's sort key as an opaque URL-safe cursor"""
+    values = [float(value) if isinstance(value, decimal.Decimal) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, arity: int) -> List[Any]:
+    """
+    Decode a cursor made by encode_cursor
+
+    Args:
+        cursor: Cursor from a page link
+        arity: Number of sort key columns expected
+
+    Returns:
+        Sort key values
+
+    Raises:
+        ValueError: If the cursor is malformed or made for another sort
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Invalid page cursor')
+    if (not isinstance(values, list) or len(values) != arity
+            or not all(isinstance(value, (str, int, float)) for value in values)):
+        raise ValueError('Invalid page cursor')
+    return values
+
+
+def keyset_page(session: Session, statement: Select, keys: Sequence[ColumnElement], descending: bool,
+                per_page: int, after: Optional[str] = None, before: Optional[str] = None) -> Page:
+    """
+    Fetch one page of a statement in keyset order
+
+    Args:
+        session: Session to read with
+        statement: Filtered select of the columns to show, without ORDER BY or LIMIT
+        keys: Non-NULL sort expressions, ending with a unique column
+        descending: Whether to sort all keys descending
+        per_page: Rows per page
+        after: Cursor of the row to continue after, for the next page
+        before: Cursor of the row to stop before, for the previous page
+
+    Returns:
+        Page of rows (the statement's columns) in display order, with
+        cursors for the next and previous pages (None at either end)
+
+    Raises:
+        ValueError: If a cursor is invalid
+    """
+    backwards = before is not None
+    cursor = before if backwards else after
+    # Walking back reads the previous rows in reverse order, then flips them
+    reverse = descending != backwards
+    width = len(statement.selected_columns)
+    statement = statement.add_columns(*[key.label(f'keyset_{i}') for i, key in enumerate(keys)])
+    if cursor is not None:
+        values = decode_cursor(cursor, len(keys))
+        row_key = tuple_(*keys)
+        bound = tuple_(*[literal(value, key.type) for key, value in zip(keys, values)])
+        statement = statement.where(row_key < bound if reverse else row_key > bound)
+    statement = statement.order_by(*[key.desc() if reverse else key.asc() for key in keys]).limit(per_page + 1)
+
+    rows = execute_read(session, statement).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return Page([], None, None)
+
+    first_key, last_key = rows[0][width:], rows[-1][width:]
+    has_next = more if not backwards else True
+    has_prev = more if backwards else cursor is not None
+    return Page([row[:width] for row in rows],
+                encode_cursor(last_key) if has_next else None,
+                encode_cursor(first_key) if has_prev else None)
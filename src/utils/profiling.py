@@ -0,0 +1,239 @@
+"""
+Per-request profiling: tagged spans, stack samples and cProfile
+
+A ``RequestProfile`` is active for the context (thread) of one request.
+While it is, ``span`` blocks and the methods of ``traced`` classes record
+their wall time, and a shared sampler thread records the request thread's
+Python stack every ``interval`` seconds. The samples are written in the
+collapsed-stack format that flamegraph.pl, speedscope and inferno read::
+
+    GET /analytics;[DataService.get_sales_by_month];[sql];module.function 12
+
+with the open spans (bracketed) inserted above the Python frames, so time
+is split into SQL, service methods and template rendering at a glance. With
+no profile active a span costs one context variable lookup.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import cProfile
+import sys
+import threading
+import time
+import types
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile:
+    """Spans, stack samples and an optional cProfile of one request"""
+
+    def __init__(self, label: str, interval: float, deterministic: bool = False):
+        """
+        Args:
+            label: Root frame of every sample, e.g. ``GET /analytics``
+            interval: Seconds between stack samples
+            deterministic: Also run cProfile over the request
+        """
+        self.label = label
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        # (name, start, seconds, depth) of finished spans, in finishing order
+        self.spans: List[Tuple[str, float, float, int]] = []
+        # (name, start) of the spans entered and not yet left, outermost first
+        self.open_spans: List[Tuple[str, float]] = []
+        self.profiler = cProfile.Profile() if deterministic else None
+        self.started = self.finished = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler owns the interpreter (Python 3.12+ allows one); keep the samples
+                self.profiler = None
+        get_sampler().add(self)
+
+    def stop(self):
+        if self.finished is not None:
+            return
+        get_sampler().remove(self)
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.finished = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def collapsed(self) -> str:
+        """Samples as ``frame;frame;... count`` lines, heaviest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def span_totals(self) -> Dict[str, Tuple[int, float]]:
+        """Calls and total seconds per span name"""
+        totals: Dict[str, Tuple[int, float]] = {}
+        for name, _, seconds, _ in self.spans:
+            calls, total = totals.get(name, (0, 0.0))
+            totals[name] = (calls + 1, total + seconds)
+        return totals
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'request': self.label,
+            'duration_ms': round(self.seconds * 1000, 2),
+            'sample_interval_ms': self.interval * 1000,
+            'samples': sum(self.samples.values()),
+            'spans': [{'name': name, 'start_ms': round((start - self.started) * 1000, 2),
+                       'duration_ms': round(seconds * 1000, 2), 'depth': depth}
+                      for name, start, seconds, depth in sorted(self.spans, key=lambda span: span[1])]
+        }
+
+
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+
+def active_profile() -> Optional[RequestProfile]:
+    return _profile.get()
+
+
+@contextmanager
+def profiling(profile: RequestProfile) -> Iterator[RequestProfile]:
+    """Make a profile active for the current context and run it until the block exits"""
+    token = _profile.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _profile.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the time of a block in the active profile, if any"""
+    begin_span(name)
+    try:
+        yield
+    finally:
+        end_span(name)
+
+
+def begin_span(name: str):
+    """Open a span closed by end_span, for hooks that come in pairs instead of wrapping a block"""
+    profile = _profile.get()
+    if profile is not None:
+        profile.open_spans.append((name, time.perf_counter()))
+
+
+def end_span(name: str):
+    """Close the innermost open span called ``name``, and any left open inside it"""
+    profile = _profile.get()
+    if profile is None or all(open_name != name for open_name, _ in profile.open_spans):
+        return
+    ended = time.perf_counter()
+    while True:
+        open_name, started = profile.open_spans.pop()
+        profile.spans.append((open_name, started, ended - started, len(profile.open_spans)))
+        if open_name == name:
+            return
+
+
+# Statements of every engine are spans of their own, so SQL time stands apart from ORM and Python work
+@event.listens_for(Engine, 'before_cursor_execute')
+def _begin_statement(connection, cursor, statement, parameters, context, executemany):
+    begin_span('sql')
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_statement(connection, cursor, statement, parameters, context, executemany):
+    end_span('sql')
+
+
+@event.listens_for(Engine, 'handle_error')
+def _end_failed_statement(context):
+    end_span('sql')
+
+
+def traced(cls):
+    """Class decorator: record a span named ``Class.method`` around each public method"""
+    for attribute, value in list(vars(cls).items()):
+        if isinstance(value, types.FunctionType) and not attribute.startswith('_'):
+            setattr(cls, attribute, _traced_method(f"{cls.__name__}.{attribute}", value))
+    return cls
+
+
+def _traced_method(name: str, method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if _profile.get() is None:
+            return method(*args, **kwargs)
+        with span(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """One daemon thread sampling the stacks of every active profile's thread"""
+
+    def __init__(self):
+        self.profiles: Dict[int, RequestProfile] = {}
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self.condition:
+            self.profiles[id(profile)] = profile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def remove(self, profile: RequestProfile):
+        with self.condition:
+            self.profiles.pop(id(profile), None)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.profiles)
+                profiles = list(self.profiles.values())
+            frames = sys._current_frames()
+            for profile in profiles:
+                self._sample(profile, frames.get(profile.thread_id))
+            time.sleep(min(profile.interval for profile in profiles))
+
+    @staticmethod
+    def _sample(profile: RequestProfile, frame):
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if not stack:
+            return
+        stack.reverse()
+        spans = [f"[{name}]" for name, _ in list(profile.open_spans)]
+        profile.samples[';'.join([profile.label] + spans + stack)] += 1
+
+
+_sampler: Optional[StackSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler() -> StackSampler:
+    """Get the process-wide stack sampler"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = StackSampler()
+        return _sampler
@@ -0,0 +1,217 @@
+"""
+Streaming sketches for approximate analytics
+
+All three structures take batches as NumPy arrays and have fixed memory,
+whatever the number of rows fed to them:
+
+- ``CountMinSketch`` estimates per-key sums; estimates never fall below
+  the true sum and exceed it by at most ``epsilon * total`` with
+  probability ``1 - delta``
+- ``HyperLogLog`` estimates distinct counts with a relative standard
+  error of ``1.04 / sqrt(2 ** precision)``
+- ``Reservoir`` keeps a uniform random sample of the rows seen
+  (Algorithm R); ``estimate_group_sums`` turns it into estimates of
+  arbitrary group sums with confidence intervals
+
+NumPy is imported on first use to keep startup fast.
+"""
+from typing import Dict, Iterable, Optional, Tuple, TYPE_CHECKING
+import hashlib
+import math
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Mersenne prime for the Count-Min hash family; keys are reduced below it so products fit in int64
+_PRIME = (1 << 31) - 1
+
+# z-score of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+
+class CountMinSketch:
+    """Count-Min sketch of non-negative int64 weights per integer key"""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01, seed: int = 0):
+        """
+        Args:
+            epsilon: Error bound as a fraction of the total weight
+            delta: Probability that an estimate exceeds the bound
+            seed: Seed of the hash functions; sketches with the same seed and shape can be merged
+        """
+        import numpy as np
+
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(self.depth, 1), dtype=np.int64)
+        self.b = rng.integers(0, _PRIME, size=(self.depth, 1), dtype=np.int64)
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, keys) -> 'np.ndarray':
+        import numpy as np
+
+        keys = np.asarray(keys, dtype=np.int64) % _PRIME
+        return (self.a * keys + self.b) % _PRIME % self.width
+
+    def add(self, keys, weights):
+        """Add weights to keys; repeated keys in one batch are summed"""
+        import numpy as np
+
+        weights = np.asarray(weights, dtype=np.int64)
+        columns = self._columns(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], weights)
+        self.total += int(weights.sum())
+
+    def estimate(self, keys) -> 'np.ndarray':
+        """Estimated sums of keys, never below the true sums"""
+        import numpy as np
+
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def error_bound(self) -> float:
+        """Amount an estimate exceeds the true sum by at most, with probability 1 - delta"""
+        return self.epsilon * self.total
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes"""
+
+    def __init__(self, precision: int = 12):
+        """
+        Args:
+            precision: log2 of the register count, 4 to 16
+        """
+        import numpy as np
+
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def hash_values(values: Iterable[str]) -> 'np.ndarray':
+        """Stable 64-bit hashes of strings"""
+        import numpy as np
+
+        return np.fromiter((int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+                            for value in values), dtype=np.uint64)
+
+    def add_hashes(self, hashes):
+        """Add 64-bit hashes of the values to count"""
+        import numpy as np
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if hashes.size == 0:
+            return
+        rest_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Rank is the position of the first set bit in the remaining bits, counted from the top
+        bit_length = np.zeros(rest.shape, dtype=np.int64)
+        value = rest.copy()
+        for shift in (32, 16, 8, 4, 2, 1):
+            high = value >= np.uint64(1 << shift)
+            bit_length[high] += shift
+            value[high] >>= np.uint64(shift)
+        bit_length += (value > 0)
+        np.maximum.at(self.registers, indexes, (rest_bits - bit_length + 1).astype(np.uint8))
+
+    def merge(self, other: 'HyperLogLog'):
+        """Add every value counted by another sketch of the same precision"""
+        import numpy as np
+
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        """Estimated number of distinct values"""
+        import numpy as np
+
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            return m * math.log(m / zeros)
+        return raw
+
+    def relative_error(self) -> float:
+        """Relative standard error of the estimate"""
+        return 1.04 / math.sqrt(self.registers.size)
+
+
+class Reservoir:
+    """Uniform random sample of fixed size over int64 rows (Algorithm R)"""
+
+    def __init__(self, size: int, columns: int, seed: Optional[int] = None):
+        """
+        Args:
+            size: Rows kept
+            columns: Values per row
+            seed: Seed of the sampling
+        """
+        import numpy as np
+
+        self.size = size
+        self.sample = np.zeros((size, columns), dtype=np.int64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, rows):
+        """Offer a batch of rows; each row seen so far is kept with equal probability"""
+        import numpy as np
+
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, self.sample.shape[1])
+        fill = min(max(self.size - self.seen, 0), len(rows))
+        self.sample[self.seen:self.seen + fill] = rows[:fill]
+        rest = rows[fill:]
+        if len(rest):
+            # Row number t (0-based) replaces a random slot with probability size / (t + 1)
+            slots = self.rng.integers(0, np.arange(self.seen + fill, self.seen + len(rows)) + 1)
+            chosen = np.flatnonzero(slots < self.size)
+            # Only the last of several rows drawn for one slot survives, as in the sequential algorithm
+            unique_slots, last = np.unique(slots[chosen][::-1], return_index=True)
+            self.sample[unique_slots] = rest[chosen[::-1][last]]
+        self.seen += len(rows)
+
+    @property
+    def rows(self) -> 'np.ndarray':
+        """The sampled rows"""
+        return self.sample[:min(self.seen, self.size)]
+
+
+def estimate_group_sums(groups, values, population: int) -> Dict[int, Tuple[float, float]]:
+    """
+    Estimate per-group sums over a population from a uniform sample of it
+
+    Args:
+        groups: Group key of each sampled row
+        values: Value of each sampled row
+        population: Number of rows the sample was drawn from
+
+    Returns:
+        Mapping of group to (estimated sum, half-width of its 95% confidence interval)
+    """
+    import numpy as np
+
+    groups = np.asarray(groups)
+    values = np.asarray(values, dtype=np.float64)
+    k = len(values)
+    if k == 0:
+        return {}
+    scale = population / k
+    # Finite population correction: a sample holding every row has no error
+    correction = max(1 - k / population, 0.0)
+    estimates = {}
+    for group in np.unique(groups):
+        in_group = np.where(groups == group, values, 0.0)
+        variance = in_group.var(ddof=1) if k > 1 else 0.0
+        error = Z_95 * population * math.sqrt(variance / k * correction)
+        estimates[group.item()] = (float(in_group.sum() * scale), error)
+    return estimates
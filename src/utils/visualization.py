@@ -1,10 +1,9 @@
 """
 Utility functions for data visualization and analysis
+
+Plotly and pandas are imported inside the functions that render charts, so
+importing this module does not slow down application startup.
 """
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
 from typing import List, Dict, Any
 
 def create_sales_chart(data: List[Dict], title: str = "Sales Chart") -> str:
@@ -21,6 +20,9 @@ def create_sales_chart(data: List[Dict], title: str = "Sales Chart") -> str:
     if not data:
         return "<p>No data available for chart</p>"
     
+    import pandas as pd
+    import plotly.express as px
+    
     df = pd.DataFrame(data)
     
     if 'month' in df.columns and 'revenue' in df.columns:
@@ -0,0 +1,42 @@
+"""
+Fixtures shared by the service tests
+"""
+import os
+import tempfile
+import unittest
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from src.models.northwind import Base, Product
+
+
+def northwind_engine(test: unittest.TestCase, file_name: Optional[str] = None, **options) -> Engine:
+    """
+    Engine over an empty Northwind schema, disposed when the test ends
+
+    Args:
+        test: Test case whose cleanups dispose the engine and remove its file
+        file_name: Database file in a temporary directory, for tests whose threads
+            must share one database; in memory when None
+        options: Further create_engine arguments, e.g. poolclass
+
+    Returns:
+        The engine
+    """
+    if file_name is None:
+        url = 'sqlite://'
+    else:
+        directory = tempfile.TemporaryDirectory()
+        test.addCleanup(directory.cleanup)
+        url = f'sqlite:///{os.path.join(directory.name, file_name)}'
+    engine = create_engine(url, **options)
+    test.addCleanup(engine.dispose)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def chai(unit_price: float = 10) -> Product:
+    """The product the tests' order lines refer to"""
+    return Product(Id=1, ProductName='Chai', SupplierId=1, CategoryId=1, UnitPrice=unit_price,
+                   UnitsInStock=0, UnitsOnOrder=0, ReorderLevel=0, Discontinued=0)
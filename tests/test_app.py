@@ -0,0 +1,54 @@
+import unittest
+import sys
+import os
+import hashlib
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestAppStartup(unittest.TestCase):
+    """Test cases for what importing and setting up the app does to its database"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, 'nw.sqlite')
+        shutil.copy(os.path.join(ROOT, 'data', 'nw.sqlite'), self.database)
+        self.env = dict(os.environ, DATABASE_URL=f'sqlite:///{self.database}',
+                        CREDIT_CACHE_STORE=os.path.join(directory.name, 'versions.sqlite'))
+
+    def run_python(self, code):
+        return subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=self.env,
+                              capture_output=True, text=True, check=True).stdout
+
+    def digest(self):
+        with open(self.database, 'rb') as database:
+            return hashlib.md5(database.read()).hexdigest()
+
+    def schema(self):
+        with sqlite3.connect(self.database) as connection:
+            return {name for name, in connection.execute("SELECT name FROM sqlite_master")}
+
+    def test_import_leaves_the_database_alone(self):
+        """Importing the app changes no schema and starts no threads"""
+        before = self.digest()
+        output = self.run_python("import threading\nimport app\nprint(threading.active_count())")
+        self.assertEqual(output.strip(), '1')
+        self.assertEqual(self.digest(), before)
+
+    def test_init_db_creates_the_schema(self):
+        """init-db creates the change log, job table and search indexes"""
+        self.run_python("import app\nresult = app.app.test_cli_runner().invoke(args=['init-db'])\n"
+                        "assert result.exit_code == 0, result.output")
+        self.assertTrue({'ChangeLog', 'Job', 'CustomerSearch', 'ProductSearch',
+                         'ChangeLog_Order_insert'} <= self.schema())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Category, Order, OrderDetail, Product
+from src.routes import api_routes
+from src.services import approx_service
+from src.services.approx_service import ApproxAnalytics, SketchesNotReadyError
+from src.services.change_service import ChangeService
+from src.services.credit_cache import MemoryVersionStore
+from src.services.data_service import DataService
+from src.services.table_versions import TableVersions
+from src.utils.sketches import CountMinSketch, HyperLogLog, Reservoir, estimate_group_sums
+
+
+class TestSketches(unittest.TestCase):
+    """Test cases for the streaming sketch structures"""
+
+    def test_count_min_bounds(self):
+        """Estimates never fall below the true sums and stay within the error bound"""
+        rng = np.random.default_rng(7)
+        keys = rng.zipf(1.5, 50000) % 5000
+        weights = rng.integers(1, 100, keys.size)
+        sketch = CountMinSketch(epsilon=0.001, delta=0.01)
+        for part in range(5):
+            sketch.add(keys[part::5], weights[part::5])
+
+        true = np.bincount(keys, weights=weights)
+        distinct = np.unique(keys)
+        errors = sketch.estimate(distinct) - true[distinct]
+        self.assertEqual(sketch.total, int(weights.sum()))
+        self.assertGreaterEqual(errors.min(), 0)
+        self.assertLessEqual(errors.max(), sketch.error_bound())
+
+    def test_hyperloglog_accuracy(self):
+        """Distinct counts are exact while small and within a few standard errors when large"""
+        small = HyperLogLog(12)
+        small.add_hashes(HyperLogLog.hash_values(['a', 'b', 'a', 'c']))
+        self.assertEqual(round(small.estimate()), 3)
+
+        large = HyperLogLog(12)
+        values = [f'customer-{i}' for i in range(200000)]
+        large.add_hashes(HyperLogLog.hash_values(values))
+        large.add_hashes(HyperLogLog.hash_values(values[:1000]))
+        self.assertLess(abs(large.estimate() / 200000 - 1), 4 * large.relative_error())
+
+        other = HyperLogLog(12)
+        other.add_hashes(HyperLogLog.hash_values(['a', 'd']))
+        small.merge(other)
+        self.assertEqual(round(small.estimate()), 4)
+
+    def test_reservoir_is_uniform(self):
+        """Every row is equally likely to be kept, however the rows are batched"""
+        counts = np.zeros(1000)
+        for seed in range(200):
+            reservoir = Reservoir(100, 1, seed=seed)
+            for batch in np.array_split(np.arange(1000), 7):
+                reservoir.add(batch[:, None])
+            self.assertEqual(reservoir.seen, 1000)
+            self.assertEqual(len(np.unique(reservoir.rows)), 100)
+            counts[reservoir.rows[:, 0]] += 1
+        # Each row is kept 20 times on average; halves of the stream are kept equally often
+        self.assertAlmostEqual(counts[:500].sum() / counts.sum(), 0.5, delta=0.03)
+
+    def test_group_sums(self):
+        """A sample of the whole population gives exact sums with no error"""
+        estimates = estimate_group_sums([1, 1, 2], [10, 20, 5], population=3)
+        self.assertEqual(estimates, {1: (30.0, 0.0), 2: (5.0, 0.0)})
+        revenue, error = estimate_group_sums([1, 2, 1, 2], [10, 0, 10, 0], population=400)[1]
+        self.assertEqual(revenue, 2000.0)
+        self.assertGreater(error, 0)
+
+
+class TestApproxAnalytics(unittest.TestCase):
+    """Test cases for sketch-backed analytics kept current from the change log"""
+
+    def setUp(self):
+        # Rebuilds run on their own thread, so use a file database shared by all connections
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        engine = create_engine(f'sqlite:///{os.path.join(directory.name, "approx.sqlite")}')
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+        self.assertTrue(ChangeService(self.session).ensure_log())
+
+        for target, value in (('src.services.approx_service.get_table_versions', TableVersions(MemoryVersionStore())),
+                              ('src.services.data_service.get_engine', engine)):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.session.add_all([Category(Id=1, CategoryName_ColumnName='Beverages'),
+                              Category(Id=2, CategoryName_ColumnName='Condiments')])
+        self.session.add_all([Product(Id=i, ProductName=f'Product {i}', SupplierId=1, CategoryId=i % 2 + 1,
+                                      UnitPrice=10, UnitsInStock=0, UnitsOnOrder=0, ReorderLevel=0, Discontinued=0)
+                              for i in range(1, 6)])
+        for order_id in range(1, 41):
+            self.add_order(order_id, f'ALF{order_id % 7}', f'2014-0{order_id % 3 + 1}-15',
+                           [(order_id % 5 + 1, order_id % 4 + 1, 10 * (order_id % 5 + 1))])
+        self.session.commit()
+        self.analytics = ApproxAnalytics(engine)
+        self.analytics.start()
+        self.analytics._rebuild.join()
+        self.engine = engine
+
+    def add_order(self, order_id, customer_id, order_date, lines):
+        self.session.add(Order(Id=order_id, CustomerId=customer_id, EmployeeId=1, OrderDate=order_date))
+        self.session.add_all([OrderDetail(Id=order_id * 10 + i, OrderId=order_id, ProductId=product_id,
+                                          Quantity=quantity, UnitPrice=amount / quantity, Discount=0, Amount=amount)
+                              for i, (product_id, quantity, amount) in enumerate(lines)])
+
+    def assert_matches_exact(self):
+        data_service = DataService()
+        approx_top = self.analytics.top_products(5)
+        self.assertEqual(approx_top['results'], data_service.get_top_products(5))
+        approx_months = self.analytics.sales_by_month()['results']
+        self.assertEqual([{'month': row['month'], 'revenue': row['revenue']} for row in approx_months],
+                         data_service.get_sales_by_month())
+        approx_categories = self.analytics.sales_by_category()['results']
+        self.assertEqual([{'category_name': row['category_name'], 'revenue': row['revenue']}
+                          for row in approx_categories], data_service.get_sales_by_category())
+
+    def test_small_data_is_exact(self):
+        """With fewer lines than the sample and no collisions the estimates equal the exact results"""
+        self.assert_matches_exact()
+        top = self.analytics.top_products(2)
+        self.assertTrue(top['approximate'])
+        self.assertEqual(top['lines_counted'], 40)
+        self.assertEqual(top['confidence'], 0.99)
+        self.assertGreater(top['revenue_error'], 0)
+        self.assertTrue(all(row['revenue_ci95'] == 0 for row in self.analytics.sales_by_category()['results']))
+
+    def test_distinct_customers_per_month(self):
+        """Each month reports its distinct customers"""
+        self.add_order(41, 'NEWCO', '2014-03-20', [])
+        self.add_order(42, 'NEWCO', '2014-03-21', [])
+        self.session.commit()
+        months = {row['month']: row['distinct_customers'] for row in self.analytics.sales_by_month()['results']}
+        self.assertEqual(months, {'2014-01': 7, '2014-02': 7, '2014-03': 8})
+
+    def test_inserts_are_applied_incrementally(self):
+        """New orders and lines are added without rebuilding"""
+        self.analytics.refresh()
+        self.add_order(41, 'NEWCO', '2014-04-01', [(1, 100, 5000)])
+        self.session.commit()
+
+        with patch.object(ApproxAnalytics, '_build') as build:
+            self.assert_matches_exact()
+            months = {row['month']: row['distinct_customers'] for row in self.analytics.sales_by_month()['results']}
+        build.assert_not_called()
+        self.assertEqual(months['2014-04'], 1)
+        self.assertEqual(self.analytics.top_products(1)['results'][0]['product_name'], 'Product 1')
+        self.assertEqual(self.analytics.top_products(1)['stale_changes'], 0)
+
+    def test_updates_trigger_a_rebuild(self):
+        """Changes the sketches cannot take back are counted and rebuilt in the background"""
+        self.analytics.refresh()
+        self.session.execute(update(OrderDetail).where(OrderDetail.Id == 10).values(Amount=9999))
+        self.session.commit()
+
+        with patch.object(approx_service, 'REBUILD_FRACTION', 1.0):
+            self.assertEqual(self.analytics.top_products(5)['stale_changes'], 1)
+        self.analytics.refresh()
+        self.analytics._rebuild.join()
+        self.assertEqual(self.analytics.top_products(5)['stale_changes'], 0)
+        self.assert_matches_exact()
+
+    def test_first_build_runs_in_the_background(self):
+        """Requests before the first build finishes are answered 503 instead of waiting for the scan"""
+        analytics = ApproxAnalytics(self.engine)
+        release = threading.Event()
+        build = ApproxAnalytics._build
+
+        def slow_build(analytics, session):
+            release.wait(5)
+            return build(analytics, session)
+
+        app = Flask(__name__)
+        app.register_blueprint(api_routes.bp, url_prefix='/api')
+        with patch.object(ApproxAnalytics, '_build', slow_build), \
+                patch('src.routes.api_routes.get_approx_analytics', return_value=analytics):
+            response = app.test_client().get('/api/analytics/top-products?approx=true&limit=5')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '5')
+            with self.assertRaises(SketchesNotReadyError):
+                analytics.sales_by_month()
+            self.assertTrue(analytics._rebuild.is_alive())
+            release.set()
+            analytics._rebuild.join()
+            response = app.test_client().get('/api/analytics/top-products?approx=true&limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['results'], self.analytics.top_products(5)['results'])
+
+    def test_limit_is_bounded_by_heavy_hitters(self):
+        """Top products beyond the tracked heavy hitters are refused"""
+        with self.assertRaises(ValueError):
+            self.analytics.top_products(approx_service.HEAVY_HITTERS + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from src.models.changes import ChangeLog
+from src.models.northwind import Base, Customer, Order, OrderDetail
+from src.routes import api_routes
+from src.services.change_service import ChangeService
+
+
+class TestChangeService(unittest.TestCase):
+    """Test cases for the change log and change feed"""
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.change_service = ChangeService(self.session)
+        self.assertTrue(self.change_service.ensure_log())
+
+        self.session.add(Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste'))
+        self.session.add(Order(Id=1, CustomerId='ALFKI', EmployeeId=1))
+        self.session.add(OrderDetail(Id=10, OrderId=1, ProductId=1, Quantity=2, UnitPrice=5))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_inserts_are_logged_in_order(self):
+        """Each inserted row is logged with its order and customer"""
+        feed = self.change_service.get_changes()
+
+        self.assertEqual([(c['TableName'], c['Operation'], c['RowKey']) for c in feed['changes']],
+                         [('Customer', 'insert', 'ALFKI'), ('Order', 'insert', '1'), ('OrderDetail', 'insert', '10')])
+        self.assertEqual(feed['changes'][2]['OrderId'], 1)
+        self.assertEqual(feed['changes'][2]['CustomerId'], 'ALFKI')
+        self.assertEqual((feed['last_seq'], feed['latest_seq'], feed['has_more']), (3, 3, False))
+
+    def test_bulk_updates_are_logged(self):
+        """Core bulk updates bypass the ORM but are still captured"""
+        self.session.execute(update(Order).where(Order.Id == 1).values(ShippedDate='2024-01-01'))
+        self.session.commit()
+
+        feed = self.change_service.get_changes(since=3)
+        self.assertEqual([(c['TableName'], c['Operation']) for c in feed['changes']], [('Order', 'update')])
+
+    def test_paging_with_since(self):
+        """Consumers page through the log with last_seq"""
+        first = self.change_service.get_changes(limit=2)
+        self.assertEqual((len(first['changes']), first['has_more']), (2, True))
+
+        rest = self.change_service.get_changes(since=first['last_seq'])
+        self.assertEqual([c['Seq'] for c in rest['changes']], [3])
+
+    def test_rolled_back_changes_are_not_logged(self):
+        """Log entries commit or roll back with the change"""
+        self.session.add(Order(Id=2, CustomerId='ALFKI', EmployeeId=1))
+        self.session.flush()
+        self.session.rollback()
+
+        self.assertEqual(self.change_service.get_changes(since=3)['changes'], [])
+
+    def test_pruned_entries_require_resync(self):
+        """A consumer behind the pruned range is told to re-read"""
+        self.assertEqual(self.change_service.prune(2), 2)
+
+        self.assertTrue(self.change_service.get_changes(since=0)['resync'])
+        self.assertFalse(self.change_service.get_changes(since=2)['resync'])
+
+    def test_expired_entries_are_pruned(self):
+        """Only entries older than the retention period are pruned, oldest first"""
+        self.session.execute(update(ChangeLog).where(ChangeLog.Seq <= 2).values(ChangedAt='2000-01-01T00:00:00.000'))
+        self.session.commit()
+
+        self.assertEqual(self.change_service.prune_expired(retention_hours=1, limit=1), (1, True))
+        self.assertEqual(self.change_service.prune_expired(retention_hours=1), (1, False))
+        self.assertEqual(self.change_service.prune_expired(retention_hours=1), (0, False))
+        self.session.commit()
+
+        self.assertEqual([c['Seq'] for c in self.change_service.get_changes(since=2)['changes']], [3])
+        self.assertTrue(self.change_service.missed_changes(0))
+        self.assertFalse(self.change_service.missed_changes(2))
+        self.assertFalse(self.change_service.missed_changes(3))
+
+    def test_changed_customers_ignores_customer_rows(self):
+        """Rollups written to Customer do not mark the customer as changed again"""
+        self.session.execute(update(Customer).values(OrderCount=1))
+        self.session.commit()
+
+        self.assertEqual(self.change_service.changed_customers(since=3), (set(), 3, 0))
+        self.assertEqual(self.change_service.changed_customers(since=0), ({'ALFKI'}, 3, 2))
+
+    def test_wait_returns_empty_after_timeout(self):
+        """A long-poll with nothing new returns an empty result"""
+        feed = self.change_service.wait_for_changes(since=3, timeout=0.05)
+        self.assertEqual((feed['changes'], feed['last_seq']), ([], 3))
+
+
+class TestChangeFeedRoute(unittest.TestCase):
+    """Test cases for the change feed endpoint's limits"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(api_routes.bp, url_prefix='/api')
+        self.client = self.app.test_client()
+
+    def test_limit_is_clamped(self):
+        """Negative and oversized limits are brought into range"""
+        with patch.object(api_routes, 'DataService') as data_service:
+            data_service.return_value.get_changes.return_value = {}
+            self.client.get('/api/changes?limit=-5')
+            self.client.get('/api/changes?limit=5000')
+        self.assertEqual([call.kwargs['limit'] for call in data_service.return_value.get_changes.call_args_list],
+                         [1, 1000])
+
+    def test_event_streams_are_capped(self):
+        """Streams beyond the cap are refused until one closes"""
+        headers = {'Accept': 'text/event-stream'}
+        with patch.object(api_routes, '_change_streams', api_routes.threading.BoundedSemaphore(1)), \
+                patch.object(api_routes, '_change_events', return_value=iter(())):
+            first = self.client.get('/api/changes', headers=headers, buffered=False)
+            refused = self.client.get('/api/changes', headers=headers)
+            self.assertEqual((first.status_code, refused.status_code), (200, 503))
+            self.assertEqual(refused.headers['Retry-After'], '30')
+            first.close()
+            self.assertEqual(self.client.get('/api/changes', headers=headers).status_code, 200)
+
+    def test_event_stream_ends_at_its_deadline(self):
+        """A stream past its lifetime ends, so the client reconnects with Last-Event-ID"""
+        with patch.object(api_routes, 'DataService') as data_service:
+            data_service.return_value.get_changes.return_value = {
+                'changes': [], 'last_seq': 0, 'latest_seq': 0, 'has_more': False, 'resync': False}
+            events = list(api_routes._change_events(0, 10, api_routes.time.monotonic() + 0.05))
+        self.assertIn(': keep-alive\n\n', events)
+        data_service.return_value.session.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Customer, Order, OrderDetail
+from src.services import credit_cache
+from src.services.credit_cache import CreditCheckCache, MemoryVersionStore, SQLiteVersionStore
+from src.services.credit_service import CreditService
+from tests.helpers import chai, northwind_engine
+
+CUSTOMERS = ['ALFKI', 'ANATR', 'ANTON', 'AROUT']
+
+
+class TestCreditCheckCache(unittest.TestCase):
+    """Test cases for memoized credit checks"""
+
+    def setUp(self):
+        self.session = sessionmaker(bind=northwind_engine(self))()
+        self.session.add(chai())
+        for customer_id in CUSTOMERS:
+            self.session.add(Customer(Id=customer_id, CompanyName=customer_id.title(), CreditLimit=1000))
+        self.session.add(Order(Id=1, CustomerId='ALFKI', EmployeeId=1, AmountTotal=100))
+        self.session.commit()
+        self.credit_service = CreditService(self.session)
+        self.cache = CreditCheckCache(MemoryVersionStore(), max_entries=3)
+
+    def tearDown(self):
+        self.session.close()
+
+    def check(self, customer_id):
+        return self.cache.check(customer_id, self.credit_service.check_credit_limit)
+
+    def assert_fresh(self, customer_id):
+        """A cached result always equals a fresh computation"""
+        self.assertEqual(self.check(customer_id), self.credit_service.check_credit_limit(customer_id))
+
+    def test_repeated_checks_hit(self):
+        """Unchanged customers are served from the cache"""
+        for _ in range(10):
+            self.check('ALFKI')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (9, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 0.9)
+
+    def test_new_order_invalidates_its_customer_only(self):
+        """Committing an order bumps only its customer's version"""
+        self.check('ALFKI')
+        self.check('ANATR')
+        self.session.add(Order(Id=2, CustomerId='ALFKI', EmployeeId=1, AmountTotal=50))
+        self.session.commit()
+
+        self.assertEqual(self.check('ALFKI')['current_balance_cents'], 15000)
+        self.check('ANATR')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_order_line_and_limit_changes_invalidate(self):
+        """Order line and credit limit changes reach the cached result"""
+        self.check('ALFKI')
+        self.session.add(OrderDetail(Id=1, OrderId=1, ProductId=1, Quantity=1, UnitPrice=10))
+        self.session.commit()
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.check('ALFKI')
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+        self.session.get(Customer, 'ALFKI').CreditLimit = 50
+        self.session.commit()
+        self.assertFalse(self.check('ALFKI')['within_credit_limit'])
+
+    def test_moving_an_order_invalidates_both_customers(self):
+        """Changing an order's customer bumps the old and the new customer"""
+        self.check('ALFKI')
+        self.check('ANATR')
+        self.session.get(Order, 1).CustomerId = 'ANATR'
+        self.session.commit()
+
+        self.assertEqual(self.check('ALFKI')['current_balance_cents'], 0)
+        self.assertEqual(self.check('ANATR')['current_balance_cents'], 10000)
+
+    def test_bulk_updates_invalidate(self):
+        """Bulk ORM updates invalidate the affected customers, or everyone if unknown"""
+        self.check('ALFKI')
+        self.session.execute(update(Order).where(Order.Id == 1).values(ShippedDate='2024-01-01'))
+        self.session.commit()
+        self.assertEqual(self.check('ALFKI')['current_balance_cents'], 0)
+
+        self.session.execute(update(Customer), [{'Id': 'ALFKI', 'CreditLimit': 10}])
+        self.session.commit()
+        self.assertEqual(self.check('ALFKI')['credit_limit_cents'], 1000)
+
+    def test_rolled_back_writes_keep_entries(self):
+        """Writes that are rolled back do not invalidate"""
+        self.check('ALFKI')
+        self.session.add(Order(Id=2, CustomerId='ALFKI', EmployeeId=1, AmountTotal=50))
+        self.session.flush()
+        self.session.rollback()
+
+        self.check('ALFKI')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_lru_bound(self):
+        """The least recently used entry is evicted beyond max_entries"""
+        for customer_id in ['ALFKI', 'ANATR', 'ANTON', 'ALFKI', 'AROUT']:
+            self.check(customer_id)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (3, 1))
+        self.assertNotIn('ANATR', self.cache.entries)
+
+    def test_callers_cannot_corrupt_entries(self):
+        """Results are copies, so callers may add fields"""
+        self.check('ALFKI')['unshipped_orders'] = []
+        self.assertNotIn('unshipped_orders', self.check('ALFKI'))
+
+    def test_never_stale_under_random_writes(self):
+        """Across random writes, every cached result equals a fresh computation"""
+        rng = random.Random(7)
+        next_order = 100
+        for _ in range(300):
+            customer_id = rng.choice(CUSTOMERS)
+            action = rng.random()
+            if action < 0.1:
+                self.session.add(Order(Id=next_order, CustomerId=customer_id, EmployeeId=1,
+                                       AmountTotal=rng.randint(1, 500)))
+                next_order += 1
+                self.session.commit()
+            elif action < 0.15:
+                self.session.get(Customer, customer_id).CreditLimit = rng.randint(0, 2000)
+                self.session.commit()
+            elif action < 0.2:
+                self.session.execute(update(Order).where(Order.CustomerId == customer_id)
+                                     .values(ShippedDate='2024-01-01'))
+                self.session.commit()
+            self.assert_fresh(customer_id)
+
+        self.assertGreater(self.cache.stats()['hit_ratio'], 0.5)
+
+    def test_shared_store_invalidates_other_workers(self):
+        """With a shared store, a write committed by one worker invalidates every worker's entry"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'versions.sqlite')
+            worker_a = CreditCheckCache(SQLiteVersionStore(path))
+            worker_b = CreditCheckCache(SQLiteVersionStore(path))
+            # Worker B's sessions live in another process: only worker A sees this session's commits
+            credit_cache._tracked_stores.discard(worker_b.store)
+            compute = self.credit_service.check_credit_limit
+
+            worker_b.check('ALFKI', compute)
+            self.session.add(Order(Id=2, CustomerId='ALFKI', EmployeeId=1, AmountTotal=50))
+            self.session.commit()
+            self.assertEqual(worker_b.check('ALFKI', compute)['current_balance_cents'], 15000)
+            worker_b.check('ALFKI', compute)
+            self.assertEqual(worker_b.stats()['hits'], 1)
+            worker_a.store.local.connection.close()
+            worker_b.store.local.connection.close()
+
+    def test_configured_store_is_shared_by_default(self):
+        """Workers of one database share a store file unless a per-process store is asked for"""
+        with tempfile.TemporaryDirectory() as directory, patch('tempfile.tempdir', directory):
+            with patch.dict(os.environ, {'CREDIT_CACHE_STORE': ''}):
+                first, second = credit_cache.configured_version_store(), credit_cache.configured_version_store()
+            self.assertIsInstance(first, SQLiteVersionStore)
+            self.assertEqual(first.path, second.path)
+            self.assertEqual(os.path.dirname(first.path), directory)
+            first.local.connection.close()
+            second.local.connection.close()
+
+        with patch.dict(os.environ, {'CREDIT_CACHE_STORE': 'memory'}), \
+                patch.object(credit_cache, '_memory_warned', False), self.assertLogs(credit_cache.logger, 'WARNING'):
+            self.assertIsInstance(credit_cache.configured_version_store(), MemoryVersionStore)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from src.models.northwind import Customer, Order, OrderDetail
+from src.services.credit_service import CreditService
+from src.utils.db import DatabaseBusyError, LockStripes, run_write_transaction
+from tests.helpers import chai, northwind_engine
+
+CUSTOMERS = ['ALFKI', 'ANATR', 'ANTON', 'AROUT']
+
+# Each customer can afford exactly this many one-unit orders
+ORDERS_PER_LIMIT = 10
+
+
+class TestCreditEnforcement(unittest.TestCase):
+    """Test cases for credit limits enforced under concurrent writers"""
+
+    def setUp(self):
+        self.engine = northwind_engine(self, 'orders.sqlite', poolclass=NullPool)
+        self.Session = sessionmaker(bind=self.engine)
+        session = self.Session()
+        session.add(chai())
+        for customer_id in CUSTOMERS:
+            session.add(Customer(Id=customer_id, CompanyName=customer_id.title(), CreditLimit=10 * ORDERS_PER_LIMIT))
+        session.commit()
+        session.close()
+
+    def place_concurrently(self, writers, orders_per_writer):
+        """Have writer threads place one-unit orders round-robin across customers"""
+        outcomes, errors = [], []
+        start = threading.Barrier(writers)
+
+        def writer(offset):
+            session = self.Session()
+            credit_service = CreditService(session)
+            try:
+                start.wait()
+                for i in range(orders_per_writer):
+                    customer_id = CUSTOMERS[(offset + i) % len(CUSTOMERS)]
+                    result = credit_service.place_order(customer_id, 1, [{'product_id': 1, 'quantity': 1}])
+                    outcomes.append((customer_id, result['accepted']))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=writer, args=(offset,)) for offset in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return outcomes
+
+    def assert_never_over_limit(self, outcomes):
+        session = self.Session()
+        try:
+            for customer_id in CUSTOMERS:
+                accepted = sum(1 for outcome in outcomes if outcome == (customer_id, True))
+                self.assertEqual(accepted, ORDERS_PER_LIMIT, customer_id)
+                balance = session.scalar(select(func.sum(Order.AmountTotal)).where(Order.CustomerId == customer_id))
+                self.assertEqual(balance, 10 * ORDERS_PER_LIMIT)
+                credit = CreditService(session).check_credit_limit(customer_id)
+                self.assertTrue(credit['within_credit_limit'])
+        finally:
+            session.close()
+
+    def test_single_writer(self):
+        """Orders are accepted until the limit and rejected after"""
+        outcomes = self.place_concurrently(1, ORDERS_PER_LIMIT * len(CUSTOMERS) + 8)
+        self.assert_never_over_limit(outcomes)
+        self.assertEqual(sum(1 for _, accepted in outcomes if not accepted), 8)
+
+    def test_concurrent_writers_never_exceed_limits(self):
+        """However many writers race, each customer gets exactly the orders its limit allows"""
+        for writers in (2, 8, 32):
+            with self.subTest(writers=writers):
+                self.setUp()
+                outcomes = self.place_concurrently(writers, 3 * ORDERS_PER_LIMIT * len(CUSTOMERS) // writers + 1)
+                self.assert_never_over_limit(outcomes)
+
+    def test_order_rows(self):
+        """Accepted orders store their lines and total; rejected orders store nothing"""
+        session = self.Session()
+        credit_service = CreditService(session)
+        result = credit_service.place_order('ALFKI', 1, [{'product_id': 1, 'quantity': 3, 'discount': 10}])
+        self.assertTrue(result['accepted'])
+        self.assertEqual(result['total_cents'], 2700)
+        self.assertEqual(result['credit']['current_balance_cents'], 2700)
+
+        order = session.get(Order, result['order_id'])
+        self.assertEqual(order.AmountTotal, 27)
+        self.assertEqual(order.OrderDetailCount, 1)
+
+        result = credit_service.place_order('ALFKI', 1, [{'product_id': 1, 'quantity': 8}])
+        self.assertFalse(result['accepted'])
+        self.assertEqual(session.scalar(select(func.count(OrderDetail.Id))), 1)
+        session.close()
+
+    def test_invalid_orders(self):
+        """Unknown customers are reported; bad lines and unknown products raise ValueError"""
+        session = self.Session()
+        credit_service = CreditService(session)
+        self.assertFalse(credit_service.place_order('NOONE', 1, [{'product_id': 1, 'quantity': 1}])['success'])
+        for employee_id, lines in ((1, []), (None, [{'product_id': 1, 'quantity': 1}]),
+                                   (1, [{'product_id': 99, 'quantity': 1}])):
+            with self.assertRaises(ValueError):
+                credit_service.place_order('ALFKI', employee_id, lines)
+        self.assertEqual(session.scalar(select(func.count(Order.Id))), 0)
+        session.close()
+
+
+class TestWriteTransaction(unittest.TestCase):
+    """Test cases for retried write transactions"""
+
+    def setUp(self):
+        self.session = sessionmaker(bind=create_engine('sqlite://'))()
+        self.addCleanup(self.session.close)
+
+    def test_retries_while_locked(self):
+        """Locked errors are retried with backoff until the work succeeds"""
+        calls = []
+
+        def work():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('INSERT', {}, Exception('database is locked'))
+            return 'done'
+
+        self.assertEqual(run_write_transaction(self.session, work, backoff=0.001), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_attempts(self):
+        """A database that stays locked raises DatabaseBusyError"""
+        def work():
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+        with self.assertRaises(DatabaseBusyError):
+            run_write_transaction(self.session, work, attempts=3, backoff=0.001)
+
+    def test_other_errors_are_not_retried(self):
+        """Errors other than lock contention propagate at once"""
+        calls = []
+
+        def work():
+            calls.append(1)
+            raise OperationalError('SELECT', {}, Exception('no such table: Missing'))
+
+        with self.assertRaises(OperationalError):
+            run_write_transaction(self.session, work)
+        self.assertEqual(len(calls), 1)
+
+    def test_lock_stripes(self):
+        """A key always maps to the same lock"""
+        stripes = LockStripes(8)
+        self.assertIs(stripes.lock_for('ALFKI'), stripes.lock_for('ALFKI'))
+        self.assertEqual(len({id(stripes.lock_for(str(i))) for i in range(100)}), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
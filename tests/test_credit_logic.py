@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Order
 from src.services.credit_service import CreditService
 from decimal import Decimal
 
@@ -54,6 +55,4 @@ def test_credit_logic():
     print("\nCredit logic tests completed!")
 
 if __name__ == "__main__":
-    # Import the Order model
-    from src.models.northwind import Order
     test_credit_logic()
@@ -0,0 +1,153 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer, Order, OrderDetail, Product
+from src.services.credit_cache import CreditCheckCache, MemoryVersionStore
+from src.services.credit_service import CreditService
+
+
+class TestCreditSimulation(unittest.TestCase):
+    """Test cases for proposed order credit decisions"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        for product_id, price in [(1, '18.00'), (2, '19.00'), (3, '10.50')]:
+            self.session.add(Product(Id=product_id, ProductName=f'Product {product_id}', SupplierId=1,
+                                     CategoryId=1, UnitPrice=price, UnitsInStock=0, UnitsOnOrder=0,
+                                     ReorderLevel=0, Discontinued=int(product_id == 3)))
+        self.session.add(Customer(Id='ALFKI', CompanyName='Alfreds', CreditLimit=1000))
+        self.session.add(Order(Id=1, CustomerId='ALFKI', EmployeeId=1, AmountTotal=900))
+        self.session.add(Order(Id=2, CustomerId='ALFKI', EmployeeId=1, AmountTotal=500, ShippedDate='2024-01-01'))
+        self.session.commit()
+        self.credit_service = CreditService(self.session)
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.count_statement)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self.count_statement)
+        self.session.close()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_single_proposal(self):
+        """Lines are priced at current product prices and added to the unshipped balance"""
+        result = self.credit_service.simulate_orders('ALFKI', [[
+            {'product_id': 1, 'quantity': 3},
+            {'product_id': 2, 'quantity': 2, 'discount': 10}
+        ]])
+
+        self.assertEqual(result['source'], 'query')
+        self.assertEqual(result['credit']['current_balance_cents'], 90000)
+        decision = result['proposals'][0]
+        # 3 * 18.00 + 2 * 19.00 * 0.9 = 88.20
+        self.assertEqual(decision['total_cents'], 8820)
+        self.assertEqual(decision['new_balance_cents'], 98820)
+        self.assertEqual(decision['credit_available_after_cents'], 1180)
+        self.assertTrue(decision['approved'])
+        self.assertEqual([line['amount'] for line in decision['lines']], [54.0, 34.2])
+
+    def test_batch_takes_two_queries(self):
+        """A cold decision reads the balance and all prices in two queries, however many proposals"""
+        proposals = [[{'product_id': 1, 'quantity': 1}], [{'product_id': 2, 'quantity': 2}],
+                     [{'product_id': 3, 'quantity': 1}, {'product_id': 1, 'quantity': 4}]]
+        result = self.credit_service.simulate_orders('ALFKI', proposals)
+
+        self.assertEqual(len(result['proposals']), 3)
+        self.assertEqual(len(self.statements), 2)
+
+    def test_cached_balance_takes_one_query(self):
+        """With a current credit check from the cache only the prices are read"""
+        cache = CreditCheckCache(MemoryVersionStore())
+        cache.check('ALFKI', self.credit_service.check_credit_limit)
+        current = cache.peek('ALFKI')
+        self.statements.clear()
+
+        result = self.credit_service.simulate_orders('ALFKI', [[{'product_id': 1, 'quantity': 1}]], current)
+
+        self.assertEqual(result['source'], 'cache')
+        self.assertEqual(result['proposals'][0]['new_balance_cents'], 91800)
+        self.assertEqual(len(self.statements), 1)
+
+    def test_peek_does_not_compute(self):
+        """Peeking at a cold or stale entry returns None"""
+        cache = CreditCheckCache(MemoryVersionStore())
+        self.assertIsNone(cache.peek('ALFKI'))
+        cache.check('ALFKI', self.credit_service.check_credit_limit)
+        self.session.add(Order(Id=3, CustomerId='ALFKI', EmployeeId=1, AmountTotal=10))
+        self.session.commit()
+        self.assertIsNone(cache.peek('ALFKI'))
+
+    def test_independent_and_cumulative_decisions(self):
+        """Each proposal fits alone; cumulatively the second no longer fits and the third still does"""
+        proposals = [[{'product_id': 1, 'quantity': 4}], [{'product_id': 2, 'quantity': 5}],
+                     [{'product_id': 1, 'quantity': 1}]]
+        result = self.credit_service.simulate_orders('ALFKI', proposals)
+
+        self.assertEqual([decision['approved'] for decision in result['proposals']], [True, True, True])
+        self.assertEqual([decision['approved_cumulative'] for decision in result['proposals']],
+                         [True, False, True])
+        self.assertEqual(result['approved_count'], 2)
+        self.assertEqual(result['balance_after_approved_cents'], 90000 + 7200 + 1800)
+
+    def test_over_limit_is_declined(self):
+        """A proposal pushing the balance over the limit is declined"""
+        result = self.credit_service.simulate_orders('ALFKI', [[{'product_id': 1, 'quantity': 6}]])
+        self.assertFalse(result['proposals'][0]['approved'])
+        self.assertEqual(result['proposals'][0]['credit_available_after_cents'], -800)
+
+    def test_unknown_product_fails_its_proposal_only(self):
+        """Unknown products decline their own proposal without failing the batch"""
+        result = self.credit_service.simulate_orders('ALFKI', [[{'product_id': 99, 'quantity': 1}],
+                                                               [{'product_id': 1, 'quantity': 1}]])
+        self.assertIn('99', result['proposals'][0]['error'])
+        self.assertFalse(result['proposals'][0]['approved'])
+        self.assertTrue(result['proposals'][1]['approved_cumulative'])
+
+    def test_missing_order_totals_are_backfilled(self):
+        """Unshipped orders without a stored total are recalculated before deciding"""
+        self.session.add(Order(Id=3, CustomerId='ALFKI', EmployeeId=1))
+        self.session.add(OrderDetail(Id=1, OrderId=3, ProductId=1, Quantity=2, UnitPrice=18))
+        self.session.commit()
+
+        result = self.credit_service.simulate_orders('ALFKI', [[{'product_id': 1, 'quantity': 1}]])
+
+        self.assertEqual(result['source'], 'recalculated')
+        self.assertEqual(result['credit']['current_balance_cents'], 93600)
+        self.assertEqual(result['proposals'][0]['new_balance_cents'], 95400)
+
+    def test_unknown_customer(self):
+        """Unknown customers are reported, not decided"""
+        result = self.credit_service.simulate_orders('NOONE', [[{'product_id': 1, 'quantity': 1}]])
+        self.assertFalse(result['success'])
+
+    def test_unknown_customer_after_cached_check(self):
+        """A memoized 'not found' check is not taken for a balance"""
+        cache = CreditCheckCache(MemoryVersionStore())
+        self.assertFalse(cache.check('NOONE', self.credit_service.check_credit_limit)['success'])
+
+        result = self.credit_service.simulate_orders('NOONE', [[{'product_id': 1, 'quantity': 1}]],
+                                                     cache.peek('NOONE'))
+
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], 'Customer not found')
+
+    def test_invalid_proposals(self):
+        """Malformed proposals raise ValueError"""
+        for proposals in ([], [[]], [[{'product_id': 1, 'quantity': 0}]],
+                          [[{'product_id': '1', 'quantity': 1}]],
+                          [[{'product_id': 1, 'quantity': 1, 'discount': 120}]]):
+            with self.assertRaises(ValueError):
+                self.credit_service.simulate_orders('ALFKI', proposals)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, text, update
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Customer, Order, OrderDetail
+from src.services.change_service import ChangeService
+from src.services.credit_service import CreditService
+from src.services.credit_state import CreditState, CreditSubscriber
+from src.services.table_versions import get_table_versions
+from tests.helpers import chai, northwind_engine
+
+
+class TestCreditState(unittest.TestCase):
+    """Test cases for the shared live credit state"""
+
+    def setUp(self):
+        # The pump runs on its own thread, so use a file database shared by all connections
+        engine = northwind_engine(self, 'credit.sqlite')
+        self.url = engine.url
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+        self.assertTrue(ChangeService(self.session).ensure_log())
+
+        self.session.add_all([
+            Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste', CreditLimit=1000),
+            Customer(Id='ANATR', CompanyName='Ana Trujillo', CreditLimit=500),
+            Customer(Id='NOLIM', CompanyName='No Limit'),
+            chai(),
+            Order(Id=1, CustomerId='ALFKI', EmployeeId=1),
+            OrderDetail(Id=1, OrderId=1, ProductId=1, Quantity=3, UnitPrice=10),
+        ])
+        self.session.commit()
+        self.state = CreditState(engine, max_subscribers=2, poll_timeout=0.1)
+        self.addCleanup(self.stop_pump)
+
+    def stop_pump(self):
+        """Let the pump notice it has no subscribers before the database goes away"""
+        for subscriber in list(self.state.subscribers):
+            self.state.unsubscribe(subscriber)
+        pump = self.state._pump
+        if pump is not None:
+            pump.join(timeout=5)
+
+    def test_bulk_check_matches_single_checks(self):
+        """The grouped credit check returns the same results as per-customer checks"""
+        credit_service = CreditService(self.session)
+        bulk = credit_service.check_credit_limits()
+
+        self.assertEqual(sorted(bulk), ['ALFKI', 'ANATR'])
+        for customer_id, check in bulk.items():
+            self.assertEqual(check, credit_service.check_credit_limit(customer_id))
+        self.assertEqual(bulk['ALFKI']['current_balance_cents'], 3000)
+
+    def test_refresh_returns_only_changed_customers(self):
+        """After the initial load only customers touched by changes are recomputed and reported"""
+        self.assertEqual([c['customer_id'] for c in self.state.snapshot()], ['ALFKI', 'ANATR'])
+
+        self.session.add(Order(Id=2, CustomerId='ANATR', EmployeeId=1, AmountTotal=100))
+        self.session.commit()
+        changes = self.state.refresh()
+
+        self.assertEqual(list(changes), ['ANATR'])
+        self.assertEqual(changes['ANATR']['current_balance_cents'], 10000)
+        self.assertEqual(self.state.refresh(), {})
+
+    def test_unchanged_credit_is_not_reported(self):
+        """Changes that leave balance and limit alone are not pushed"""
+        self.state.refresh()
+        self.session.execute(update(Order).where(Order.Id == 1).values(ShipName='Alfreds'))
+        self.session.commit()
+
+        self.assertEqual(self.state.refresh(), {})
+
+    def test_customer_losing_limit_is_removed(self):
+        """Customers whose credit limit is removed leave the state"""
+        self.state.refresh()
+        self.session.execute(update(Customer).where(Customer.Id == 'ANATR').values(CreditLimit=0))
+        self.session.commit()
+
+        self.assertEqual(self.state.refresh(), {'ANATR': None})
+        self.assertEqual([c['customer_id'] for c in self.state.snapshot()], ['ALFKI'])
+
+    def test_subscribers_receive_pushed_changes(self):
+        """The pump publishes changes to every subscriber"""
+        self.state.snapshot()
+        subscribers = [self.state.subscribe(), self.state.subscribe()]
+        self.assertIsNone(self.state.subscribe())
+
+        self.session.execute(update(Customer).where(Customer.Id == 'ALFKI').values(CreditLimit=2000))
+        self.session.commit()
+
+        for subscriber in subscribers:
+            needs_snapshot, changes = subscriber.next(timeout=5)
+            self.assertFalse(needs_snapshot)
+            self.assertEqual(changes['ALFKI']['credit_limit_cents'], 200000)
+            self.state.unsubscribe(subscriber)
+        subscriber = self.state.subscribe()
+        self.assertIsNotNone(subscriber)
+        self.state.unsubscribe(subscriber)
+
+    def test_pump_survives_a_failed_refresh(self):
+        """After a failure subscribers are sent a snapshot and the pump keeps publishing"""
+        self.state.snapshot()
+        refresh = self.state.refresh
+        failures = [RuntimeError('database went away')]
+
+        def flaky_refresh():
+            if failures:
+                raise failures.pop()
+            return refresh()
+
+        with patch.object(self.state, 'refresh', flaky_refresh), \
+                patch('src.services.credit_state.PUMP_RETRY', 0.01), \
+                self.assertLogs('src.services.credit_state', 'ERROR'):
+            subscriber = self.state.subscribe()
+            self.assertEqual(subscriber.next(timeout=5), (True, {}))
+            # The stream answers a reset with a fresh snapshot
+            self.state.snapshot()
+
+            self.session.execute(update(Customer).where(Customer.Id == 'ALFKI').values(CreditLimit=2000))
+            self.session.commit()
+            needs_snapshot, changes = subscriber.next(timeout=5)
+            self.assertFalse(needs_snapshot)
+            self.assertEqual(changes['ALFKI']['credit_limit_cents'], 200000)
+            self.assertTrue(self.state._pump.is_alive())
+            self.state.unsubscribe(subscriber)
+
+    def test_slow_subscriber_is_coalesced_then_reset(self):
+        """A backlog keeps the latest value per customer and turns into a snapshot when too large"""
+        subscriber = CreditSubscriber(max_pending=2)
+        subscriber.publish({'A': {'v': 1}})
+        subscriber.publish({'A': {'v': 2}, 'B': None})
+        self.assertEqual(subscriber.next(timeout=0), (False, {'A': {'v': 2}, 'B': None}))
+
+        subscriber.publish({'A': {}, 'B': {}, 'C': {}})
+        subscriber.publish({'D': {}})
+        self.assertEqual(subscriber.next(timeout=0), (True, {}))
+
+        started = time.monotonic()
+        self.assertEqual(subscriber.next(timeout=0.05), (False, {}))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_reloads_without_change_capture(self):
+        """With capture off the state reloads when the tables' versions change, and on a timer for unseen writes"""
+        get_table_versions()
+        engine = create_engine(self.url)
+        self.addCleanup(engine.dispose)
+        with patch('src.services.change_service.CHANGE_LOG', False):
+            state = CreditState(engine)
+            self.assertEqual([c['customer_id'] for c in state.snapshot()], ['ALFKI', 'ANATR'])
+            with engine.connect() as connection:
+                triggers = connection.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")).scalar()
+            self.assertEqual(triggers, 0)
+
+            self.session.add(Order(Id=2, CustomerId='ANATR', EmployeeId=1, AmountTotal=100))
+            self.session.commit()
+            self.assertEqual(state.refresh()['ANATR']['current_balance_cents'], 10000)
+            self.assertEqual(state.refresh(), {})
+
+            # Writes outside the ORM leave the versions alone and are picked up by the timed reload
+            with engine.begin() as connection:
+                connection.execute(update(Customer).where(Customer.Id == 'ALFKI').values(CreditLimit=0))
+            self.assertEqual(state.refresh(), {})
+            with patch('src.services.credit_state.RELOAD_AFTER', 0):
+                self.assertEqual(state.refresh(), {'ALFKI': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import event
+from src.models.northwind import Customer, Order, OrderDetail
+from src.routes import main_routes
+from src.services.data_service import DataService
+from tests.helpers import chai, northwind_engine
+
+# Queries the customer detail page may run, however many orders the customer has
+QUERY_CEILING = 2
+
+
+class TestCustomerDetail(unittest.TestCase):
+    """Test cases for the customer detail loader"""
+
+    def setUp(self):
+        self.engine = northwind_engine(self)
+        patcher = patch('src.services.data_service.get_engine', return_value=self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        session = DataService().session
+        session.add(chai(18))
+        session.add(Customer(Id='ALFKI', CompanyName='Alfreds', CreditLimit=500))
+        session.add(Customer(Id='EMPTY', CompanyName='No Orders', CreditLimit=100))
+        for order_id in range(1, 41):
+            session.add(Order(Id=order_id, CustomerId='ALFKI', EmployeeId=1, OrderDate=f'2024-01-{order_id % 28 + 1:02d}',
+                              ShippedDate='2024-02-01' if order_id > 2 else None, AmountTotal=10))
+            session.add(OrderDetail(Id=order_id, OrderId=order_id, ProductId=1, Quantity=1, UnitPrice=10))
+        # An unshipped order whose total has not been stored yet
+        session.add(Order(Id=41, CustomerId='ALFKI', EmployeeId=1, OrderDate='2024-03-01'))
+        session.add(OrderDetail(Id=41, OrderId=41, ProductId=1, Quantity=2, UnitPrice=18))
+        session.commit()
+        session.close()
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.count_statement)
+        self.addCleanup(event.remove, self.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_detail_matches_separate_loads(self):
+        """The loader agrees with the customer, orders and credit check loaded separately"""
+        detail = DataService().get_customer_detail('ALFKI')
+
+        self.assertEqual(detail['customer'].CompanyName, 'Alfreds')
+        self.assertEqual(detail['total_orders'], 41)
+        self.assertEqual(detail['orders'][0].Id, 41)
+        self.assertEqual(detail['order_totals'][41], 36.0)
+        self.assertEqual(detail['total_spent'], 436.0)
+
+        credit_status = detail['credit_status']
+        self.assertEqual(credit_status['unshipped_order_count'], 3)
+        self.assertEqual(credit_status['current_balance_cents'], 5600)
+        self.assertEqual(credit_status, DataService().credit_service.check_credit_limit('ALFKI'))
+
+    def test_query_ceiling(self):
+        """The loader runs one query, plus one for orders without a stored total"""
+        DataService().get_customer_detail('ALFKI')
+        self.assertLessEqual(len(self.statements), QUERY_CEILING)
+
+        self.statements.clear()
+        DataService().get_customer_detail('EMPTY')
+        self.assertEqual(len(self.statements), 1)
+
+    def test_page_renders_within_ceiling(self):
+        """Rendering the page lazy-loads nothing beyond the loader's queries"""
+        app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'))
+        app.register_blueprint(main_routes.bp)
+
+        response = app.test_client().get('/customers/ALFKI')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Alfreds', response.data)
+        self.assertLessEqual(len(self.statements), QUERY_CEILING)
+
+    def test_unknown_customer(self):
+        """Unknown customers load as None"""
+        self.assertIsNone(DataService().get_customer_detail('NOONE'))
+
+
+if __name__ == '__main__':
+    unittest.main()
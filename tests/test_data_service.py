@@ -6,7 +6,9 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+from sqlalchemy import create_engine
 from services.data_service import DataService
+from src.models.northwind import Base, Customer, Order
 
 class TestDataService(unittest.TestCase):
     """Test cases for DataService class"""
@@ -51,5 +53,51 @@ class TestDataService(unittest.TestCase):
         
         self.assertEqual(revenue, 1354458.59)
 
+class TestDataServiceAggregates(unittest.TestCase):
+    """Test cases for aggregates computed by the database"""
+    
+    def setUp(self):
+        """Create an in-memory database with a few customers and orders"""
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        patcher = patch('services.data_service.get_engine', return_value=self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.service = DataService()
+        session = self.service.session
+        session.add_all([
+            Customer(Id='A', Country='Germany', City='Berlin', OrderCount=2),
+            Customer(Id='B', Country='Germany', City='Munich', OrderCount=1),
+            Customer(Id='C', Country=None, City=None, OrderCount=0),
+        ])
+        session.add_all([
+            Order(Id=1, CustomerId='A', EmployeeId=1, OrderDate='2024-01-01', ShipCountry='Germany',
+                  ShippedDate='2024-01-05', AmountTotal=100),
+            Order(Id=2, CustomerId='A', EmployeeId=1, OrderDate='2024-02-01', ShipCountry='Germany', AmountTotal=50),
+            Order(Id=3, CustomerId='B', EmployeeId=1, OrderDate='2024-03-01', ShipCountry='France', AmountTotal=25),
+            Order(Id=4, CustomerId='B', EmployeeId=1, OrderDate=None, ShipCountry='', AmountTotal=None),
+        ])
+        session.commit()
+    
+    def test_customer_countries(self):
+        """Customers are grouped by country with missing countries as Unknown"""
+        self.assertEqual(self.service.get_customer_countries(), {'Germany': 2, 'Unknown': 1})
+        self.assertEqual(self.service.get_customer_countries(limit=1, offset=1), {'Unknown': 1})
+    
+    def test_order_countries(self):
+        """Orders are grouped by ship country, optionally by shipped status"""
+        self.assertEqual(self.service.get_order_countries(), {'Germany': 2, 'France': 1, 'Unknown': 1})
+        self.assertEqual(self.service.get_order_countries(shipped=True), {'Germany': 1})
+        self.assertEqual(self.service.get_order_countries(shipped=False), {'France': 1, 'Germany': 1, 'Unknown': 1})
+    
+    def test_stats(self):
+        """Totals cover the whole table"""
+        self.assertEqual(self.service.get_customer_stats(),
+                         {'total_customers': 3, 'countries': 2, 'cities': 2, 'total_orders': 3})
+        self.assertEqual(self.service.get_order_stats(),
+                         {'total_orders': 4, 'dated_orders': 3, 'shipped_orders': 1,
+                          'pending_orders': 3, 'total_value': 175.0})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from src.models.northwind import Base, Customer, Order
+from src.utils import dialect
+from src.utils.dialect import bulk_insert, day_bucket, month_bucket, upsert, year_bucket
+
+
+class TestDateBuckets(unittest.TestCase):
+    """Test cases for portable date bucketing"""
+
+    def compile(self, expression, sql_dialect):
+        return str(select(expression).compile(dialect=sql_dialect))
+
+    def test_backend_sql(self):
+        """Each backend gets its own date function"""
+        self.assertIn("strftime('%Y-%m', \"Order\".\"OrderDate\")",
+                      self.compile(month_bucket(Order.OrderDate), sqlite.dialect()))
+        self.assertIn("to_char(date_trunc('month', CAST(\"Order\".\"OrderDate\" AS timestamp)), 'YYYY-MM')",
+                      self.compile(month_bucket(Order.OrderDate), postgresql.dialect()))
+        self.assertIn("substr(`Order`.`OrderDate`, 1, 7)", self.compile(month_bucket(Order.OrderDate), mysql.dialect()))
+
+    def test_buckets_on_sqlite(self):
+        """Buckets of one column stay distinct in the compiled statement cache"""
+        engine = create_engine('sqlite://')
+        with engine.connect() as connection:
+            for _ in range(2):
+                self.assertEqual(connection.scalar(select(year_bucket('2024-03-17 10:00:00'))), '2024')
+                self.assertEqual(connection.scalar(select(month_bucket('2024-03-17 10:00:00'))), '2024-03')
+                self.assertEqual(connection.scalar(select(day_bucket('2024-03-17 10:00:00'))), '2024-03-17')
+
+
+class TestWrites(unittest.TestCase):
+    """Test cases for upserts and bulk loads"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.connection = self.engine.connect()
+        self.addCleanup(self.connection.close)
+
+    def names(self):
+        return dict(self.connection.execute(select(Customer.Id, Customer.CompanyName).order_by(Customer.Id)).all())
+
+    def test_upsert(self):
+        """New keys are inserted and existing keys updated"""
+        upsert(self.connection, Customer.__table__, [{'Id': 'A', 'CompanyName': 'Alpha'}], ['Id'])
+        upsert(self.connection, Customer.__table__,
+               [{'Id': 'A', 'CompanyName': 'Alpha 2'}, {'Id': 'B', 'CompanyName': 'Beta'}], ['Id'])
+        self.assertEqual(self.names(), {'A': 'Alpha 2', 'B': 'Beta'})
+
+    def test_upsert_fallback(self):
+        """Backends without ON CONFLICT update then insert"""
+        upsert(self.connection, Customer.__table__, [{'Id': 'A', 'CompanyName': 'Alpha'}], ['Id'])
+        with patch.object(dialect, '_dialect_insert', return_value=None):
+            upsert(self.connection, Customer.__table__,
+                   [{'Id': 'A', 'CompanyName': 'Alpha 2'}, {'Id': 'B', 'CompanyName': 'Beta'}], ['Id'])
+        self.assertEqual(self.names(), {'A': 'Alpha 2', 'B': 'Beta'})
+
+    def test_bulk_insert(self):
+        """Rows are loaded in batches"""
+        rows = ({'Id': f'C{i:03d}', 'CompanyName': None if i % 2 else ''} for i in range(250))
+        self.assertEqual(bulk_insert(self.connection, Customer.__table__, rows, batch_size=100), 250)
+        names = self.names()
+        self.assertEqual(len(names), 250)
+        self.assertEqual((names['C000'], names['C001']), ('', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Employee, Order, OrderDetail
+from src.services import data_service
+from src.services.data_service import DataService
+
+
+class TestEmployeeRollup(unittest.TestCase):
+    """Test cases for employee sales rolled up over the reporting hierarchy"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        patcher = patch('src.services.data_service.get_engine', return_value=self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = sessionmaker(bind=self.engine)()
+        self.addCleanup(self.session.close)
+
+        # 1 manages 2 and 3; 2 manages 4; 4 manages 5
+        self.session.add_all([
+            Employee(Id=1, FirstName='Ada', LastName='Root', Title='VP'),
+            Employee(Id=2, FirstName='Bo', LastName='Mid', ReportsTo=1),
+            Employee(Id=3, FirstName='Cy', LastName='Leaf', ReportsTo=1),
+            Employee(Id=4, FirstName='Di', LastName='Low', ReportsTo=2),
+            Employee(Id=5, FirstName='Ed', LastName='Deep', ReportsTo=4),
+        ])
+        for order_id, employee_id, amounts in ((1, 1, [10.10]), (2, 2, [5, 5]), (3, 3, [7.25]),
+                                               (4, 5, [100]), (5, 5, [0.05])):
+            self.session.add(Order(Id=order_id, CustomerId='ALFKI', EmployeeId=employee_id))
+            self.session.add_all([OrderDetail(Id=order_id * 10 + i, OrderId=order_id, ProductId=1,
+                                              UnitPrice=amount, Quantity=1, Discount=0, Amount=amount)
+                                  for i, amount in enumerate(amounts)])
+        self.session.commit()
+
+    def rollup(self):
+        return {employee['employee_id']: employee for employee in DataService().get_employee_sales_rollup()['employees']}
+
+    def test_team_totals(self):
+        """Each employee's team covers everyone below them at any depth"""
+        rollup = self.rollup()
+
+        self.assertEqual(rollup[1]['team_revenue'], 127.40)
+        self.assertEqual(rollup[1]['team_order_count'], 5)
+        self.assertEqual((rollup[1]['team_size'], rollup[1]['direct_reports'], rollup[1]['team_levels']), (5, 2, 3))
+        self.assertEqual(rollup[2]['team_revenue'], 110.05)
+        self.assertEqual(rollup[2]['revenue'], 10.0)
+        self.assertEqual(rollup[2]['order_count'], 1)
+        self.assertEqual(rollup[4]['team_revenue'], 100.05)
+        self.assertEqual(rollup[4]['revenue'], 0.0)
+        self.assertEqual((rollup[3]['team_size'], rollup[3]['team_revenue']), (1, 7.25))
+
+    def test_largest_team_first(self):
+        """Employees are ordered by team revenue"""
+        employees = DataService().get_employee_sales_rollup()['employees']
+        self.assertEqual([employee['employee_id'] for employee in employees], [1, 2, 4, 5, 3])
+
+    def test_single_query(self):
+        """The rollup is one statement, however deep the tree"""
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, self.engine, 'before_cursor_execute', listener)
+
+        self.rollup()
+        self.assertEqual(len(statements), 1)
+        self.assertIn('WITH RECURSIVE', statements[0])
+
+    def test_cycles_are_cut_off(self):
+        """A ReportsTo cycle stops at the depth limit instead of recursing forever"""
+        self.session.get(Employee, 1).ReportsTo = 5
+        self.session.commit()
+
+        with patch.object(data_service, 'HIERARCHY_MAX_DEPTH', 10):
+            result = DataService().get_employee_sales_rollup()
+        self.assertTrue(result['truncated'])
+        self.assertEqual(max(employee['team_levels'] for employee in result['employees']), 10)
+
+    def test_employee_sales_counts_orders(self):
+        """Order counts count orders, not order lines"""
+        sales = {row['employee_name']: row for row in DataService().get_employee_sales()}
+        # Bo's one order has two lines; counting joined rows reported 2
+        self.assertEqual(sales['Bo Mid']['order_count'], 1)
+        self.assertEqual(sales['Bo Mid']['revenue'], 10.0)
+        self.assertEqual(sales['Ed Deep']['order_count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import sys
+import os
+import csv
+import gzip
+import importlib.util
+import io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Customer, Order, OrderDetail
+from src.services.export_service import ExportService
+from tests.helpers import chai, northwind_engine
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+class TestExportService(unittest.TestCase):
+    """Test cases for streaming table exports"""
+
+    def setUp(self):
+        self.session = sessionmaker(bind=northwind_engine(self))()
+        self.session.add_all([
+            Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste', Country='Germany'),
+            chai(18),
+        ])
+        for order_id in range(1, 6):
+            self.session.add(Order(Id=order_id, CustomerId='ALFKI', EmployeeId=1, OrderDate=f'2013-0{order_id}-15'))
+            for line in range(3):
+                self.session.add(OrderDetail(Id=order_id * 10 + line, OrderId=order_id, ProductId=1,
+                                             Quantity=line + 1, UnitPrice=18, Discount=0.15))
+        self.session.commit()
+        self.export_service = ExportService(self.session)
+
+    def tearDown(self):
+        self.session.close()
+
+    def read_csv(self, chunks):
+        return list(csv.reader(io.StringIO(gzip.decompress(b''.join(chunks)).decode('utf-8'))))
+
+    def test_csv_is_chunked_and_compressed(self):
+        """CSV output is one gzip stream written chunk by chunk"""
+        manifest, chunks = self.export_service.export('OrderDetail', 'csv', chunk_size=4)
+        chunks = list(chunks)
+        rows = self.read_csv(chunks)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(manifest['row_count'], 15)
+        self.assertEqual(rows[0], [column['name'] for column in manifest['columns']])
+        self.assertEqual(len(rows) - 1, 15)
+        self.assertEqual(rows[1][:6], ['10', '1', '1', '18', '1', '0.15'])
+
+    def test_rows_inserted_after_the_count_are_left_out(self):
+        """A line committed between the count and the rows is in neither"""
+        engine = northwind_engine(self, 'export.sqlite')
+        with engine.connect() as connection:
+            connection.execute(OrderDetail.__table__.insert(), [
+                {'Id': i, 'OrderId': 1, 'ProductId': 1, 'Quantity': 1, 'UnitPrice': 18, 'Discount': 0}
+                for i in range(1, 4)])
+            connection.commit()
+
+        session = sessionmaker(bind=engine)()
+        self.addCleanup(session.close)
+        inserted = []
+
+        @event.listens_for(session, 'after_commit')
+        def insert_after_count(session):
+            if not inserted:
+                inserted.append(True)
+                with engine.connect() as writer:
+                    writer.execute(text("INSERT INTO OrderDetail (Id, OrderId, ProductId, Quantity, UnitPrice, "
+                                        "Discount) VALUES (4, 1, 1, 1, 18, 0)"))
+                    writer.commit()
+
+        manifest, chunks = ExportService(session).export('OrderDetail', 'csv')
+        self.assertEqual((manifest['row_count'], len(self.read_csv(chunks)) - 1), (3, 3))
+        self.assertEqual(inserted, [True])
+
+    def test_writers_commit_between_chunks(self):
+        """The export holds no lock while its chunks go out, even without WAL"""
+        engine = northwind_engine(self, 'export.sqlite')
+        with engine.connect() as connection:
+            connection.execute(OrderDetail.__table__.insert(), [
+                {'Id': i, 'OrderId': 1, 'ProductId': 1, 'Quantity': 1, 'UnitPrice': 18, 'Discount': 0}
+                for i in range(1, 6)])
+            connection.commit()
+        # A writer that gives up at once if the export still holds the database
+        writer = create_engine(engine.url, connect_args={'timeout': 0})
+        self.addCleanup(writer.dispose)
+        written = []
+
+        session = sessionmaker(bind=engine)()
+        self.addCleanup(session.close)
+        manifest, chunks = ExportService(session).export('OrderDetail', 'csv', chunk_size=2)
+        for _ in chunks:
+            with writer.connect() as connection:
+                connection.execute(text("INSERT INTO OrderDetail (Id, OrderId, ProductId, Quantity, UnitPrice, "
+                                        "Discount) VALUES (:id, 1, 1, 1, 18, 0)"), {'id': 100 + len(written)})
+                connection.commit()
+            written.append(True)
+
+        self.assertGreater(len(written), 1)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text('SELECT count(*) FROM OrderDetail')).scalar(), 5 + len(written))
+        self.assertEqual(manifest['row_count'], 5)
+
+    def test_joins_and_date_filter(self):
+        """Joined columns are prefixed and dates filter through the order join"""
+        manifest, chunks = self.export_service.export('OrderDetail', 'csv', joins=['product'],
+                                                      date_from='2013-02-01', date_to='2013-03-15')
+        rows = self.read_csv(chunks)
+
+        self.assertEqual(manifest['row_count'], 6)
+        self.assertEqual(rows[0][-2:], ['product_ProductName', 'product_CategoryId'])
+        self.assertNotIn('order_OrderDate', rows[0])
+        self.assertEqual({row[1] for row in rows[1:]}, {'2', '3'})
+
+    def test_invalid_requests(self):
+        """Unknown tables, joins and formats, bad dates and undated filters are rejected"""
+        for kwargs in ({'table': 'Employee'}, {'table': 'Order', 'joins': ['product']},
+                       {'table': 'Order', 'export_format': 'xls'}, {'table': 'Order', 'date_from': '2013-13-01'},
+                       {'table': 'Customer', 'date_to': '2013-01-01'}):
+            with self.assertRaises(ValueError):
+                self.export_service.export(**kwargs)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_parquet_and_arrow(self):
+        """Parquet and Arrow IPC exports round-trip with one row group or batch per chunk"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        manifest, chunks = self.export_service.export('Order', 'parquet', joins=['customer'], chunk_size=2)
+        parquet = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(parquet.metadata.num_rows, manifest['row_count'])
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        self.assertEqual(parquet.read().column('customer_Country').to_pylist(), ['Germany'] * 5)
+
+        manifest, chunks = self.export_service.export('OrderDetail', 'arrow', chunk_size=4)
+        table = pa.ipc.open_stream(io.BytesIO(b''.join(chunks))).read_all()
+        self.assertEqual(table.num_rows, 15)
+        self.assertEqual(table.column('Discount').to_pylist(), [0.15] * 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import gzip
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Category, Customer, Product, Supplier
+from src.routes import api_routes, caching, main_routes
+from src.services.data_service import DataService
+from src.routes.caching import ResponseCache
+from src.services.credit_cache import MemoryVersionStore
+from src.services.table_versions import TableVersions
+
+
+class TestHttpCache(unittest.TestCase):
+    """Test cases for ETag validation and cached compressed responses"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([Product(Id=i, ProductName=f'Product {i}', SupplierId=1, CategoryId=1, UnitPrice=i,
+                                      UnitsInStock=0, UnitsOnOrder=0, ReorderLevel=0, Discontinued=0)
+                              for i in range(1, 31)])
+        self.session.add(Customer(Id='ALFKI', CompanyName='Alfreds'))
+        self.session.commit()
+        self.addCleanup(self.session.close)
+
+        self.versions = TableVersions(MemoryVersionStore())
+        for target, value in (('src.services.data_service.get_engine', self.engine),
+                              ('src.routes.caching.get_table_versions', self.versions)):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(caching, 'response_cache', ResponseCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+        app.register_blueprint(api_routes.bp, url_prefix='/api')
+        self.client = app.test_client()
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.count_statement)
+        self.addCleanup(event.remove, self.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def get(self, url='/api/products', **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_etag_and_cache_control(self):
+        """Responses carry a strong ETag, the route's max-age and Vary"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 30)
+        etag, weak = response.get_etag()
+        self.assertTrue(etag)
+        self.assertFalse(weak)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=300')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_not_modified_without_queries(self):
+        """A matching If-None-Match is answered with 304 without touching the database"""
+        etag = self.get().headers['ETag']
+        self.statements.clear()
+
+        response = self.get(**{'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.statements, [])
+
+    def test_cached_body_without_queries(self):
+        """Repeated requests are served from the cached body"""
+        first = self.get()
+        self.statements.clear()
+        second = self.get()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.statements, [])
+
+    def test_compressed_variant(self):
+        """Large bodies are gzip-compressed once and served from the cached variant"""
+        identity = self.get()
+        response = self.get(**{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), identity.data)
+        self.assertNotEqual(response.headers['ETag'], identity.headers['ETag'])
+
+        self.statements.clear()
+        self.assertEqual(self.get(**{'Accept-Encoding': 'gzip'}).data, response.data)
+        self.assertEqual(self.statements, [])
+
+    def test_small_bodies_are_not_compressed(self):
+        """Bodies under the size threshold are sent as they are"""
+        response = self.get('/api/customers', **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_json()[0]['Id'], 'ALFKI')
+
+    def test_writes_change_the_etag(self):
+        """Committed writes to the table change its ETag; other tables' writes do not"""
+        etag = self.get().headers['ETag']
+
+        self.session.get(Customer, 'ALFKI').CompanyName = 'Renamed'
+        self.session.commit()
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 304)
+
+        self.session.get(Product, 1).ProductName = 'Chai'
+        self.session.commit()
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)[0]['ProductName'], 'Chai')
+
+        etag = response.headers['ETag']
+        self.session.execute(update(Product).where(Product.Id == 2).values(UnitPrice=99))
+        self.session.commit()
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 200)
+
+    def test_rolled_back_writes_keep_the_etag(self):
+        """Writes that are rolled back leave the ETag alone"""
+        etag = self.get().headers['ETag']
+        self.session.get(Product, 1).ProductName = 'Chai'
+        self.session.flush()
+        self.session.rollback()
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 304)
+
+    def test_max_age_override(self):
+        """Per-route max-age can be overridden by endpoint name"""
+        with patch.dict(caching.MAX_AGE_OVERRIDES, {'api.api_products': 0}):
+            self.assertEqual(self.get().headers['Cache-Control'], 'no-cache')
+        self.assertEqual(caching._parse_max_age('api.api_products=5, main.products=60'),
+                         {'api.api_products': 5, 'main.products': 60})
+
+    def test_new_process_invalidates_etags(self):
+        """ETags issued before a restart do not validate against fresh counters"""
+        etag = self.get().headers['ETag']
+        with patch('src.routes.caching.get_table_versions', return_value=TableVersions(MemoryVersionStore())):
+            self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 200)
+
+    def test_failed_page_is_not_cached(self):
+        """A page rendered empty after an error is neither cached nor validated, so the next request re-renders"""
+        app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'))
+        app.register_blueprint(main_routes.bp)
+        client = app.test_client()
+        self.session.add_all([Category(Id=1, CategoryName_ColumnName='Beverages'), Supplier(Id=1, CompanyName='Exotic')])
+        self.session.commit()
+
+        listing = DataService.get_product_listing
+        with patch.object(DataService, 'get_product_listing', side_effect=Exception('database is locked')):
+            failed = client.get('/products')
+        self.assertEqual(failed.status_code, 200)
+        self.assertIsNone(failed.headers.get('ETag'))
+        self.assertEqual(failed.headers['Cache-Control'], 'no-store')
+
+        with patch.object(DataService, 'get_product_listing', autospec=True, side_effect=listing) as fetch:
+            response = client.get('/products')
+        self.assertEqual(fetch.call_count, 1)
+        self.assertIn(b'Product 1', response.data)
+        self.assertNotEqual(response.data, failed.data)
+        self.assertTrue(response.headers['ETag'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, delete, update
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Order, OrderDetail, Product
+from src.services.change_service import ChangeService
+from src.services.credit_cache import MemoryVersionStore
+from src.services.inventory_service import InventoryState
+from src.services.table_versions import TableVersions
+
+
+def product(product_id, in_stock=100, on_order=0, reorder_level=0, discontinued=0):
+    return Product(Id=product_id, ProductName=f'Product {product_id}', SupplierId=1, CategoryId=1, UnitPrice=10,
+                   UnitsInStock=in_stock, UnitsOnOrder=on_order, ReorderLevel=reorder_level,
+                   Discontinued=discontinued)
+
+
+class TestInventoryState(unittest.TestCase):
+    """Test cases for rolling sales velocity and reorder candidates"""
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.addCleanup(self.session.close)
+        self.assertTrue(ChangeService(self.session).ensure_log())
+
+        patcher = patch('src.services.inventory_service.get_table_versions',
+                        return_value=TableVersions(MemoryVersionStore()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.session.add_all([
+            product(1, in_stock=10, reorder_level=5),
+            product(2, in_stock=3, on_order=0, reorder_level=5),
+            product(3, in_stock=0, reorder_level=5, discontinued=1),
+        ])
+        # Product 1 sells 6 units on the latest day, 24 a week earlier and 60 long before the windows
+        self.add_order(1, '2014-05-06', [(1, 6)])
+        self.add_order(2, '2014-04-29', [(1, 24), (2, 1)])
+        self.add_order(3, '2013-01-01', [(1, 60)])
+        self.session.commit()
+        self.engine = engine
+        self.state = InventoryState(engine, windows=(7, 30))
+
+    def add_order(self, order_id, order_date, lines):
+        self.session.add(Order(Id=order_id, CustomerId='ALFKI', EmployeeId=1, OrderDate=order_date))
+        self.session.add_all([OrderDetail(Id=order_id * 100 + i, OrderId=order_id, ProductId=product_id,
+                                          Quantity=quantity, UnitPrice=10, Discount=0)
+                              for i, (product_id, quantity) in enumerate(lines)])
+
+    def units_sold(self, state=None):
+        return {entry['product_id']: entry['units_sold']
+                for entry in (state or self.state).velocity(30)['products']}
+
+    def assert_matches_fresh_load(self):
+        self.assertEqual(self.units_sold(), self.units_sold(InventoryState(self.engine, windows=(7, 30))))
+
+    def test_windows_end_at_latest_order(self):
+        """Windows count units sold on the days up to the latest order date"""
+        result = self.state.velocity(30)
+        self.assertEqual(result['as_of'], '2014-05-06')
+        self.assertEqual([entry['product_id'] for entry in result['products']], [1, 2, 3])
+        self.assertEqual(result['products'][0]['units_sold'], {'7': 6, '30': 30})
+        self.assertEqual(result['products'][0]['units_per_day'], {'7': round(6 / 7, 3), '30': 1.0})
+        self.assertEqual(self.units_sold()[3], {'7': 0, '30': 0})
+
+    def test_new_lines_update_incrementally(self):
+        """Changed orders replace their previous lines without reloading history"""
+        self.state.velocity()
+        self.add_order(4, '2014-05-05', [(2, 4)])
+        self.session.commit()
+        self.session.execute(update(OrderDetail).where(OrderDetail.Id == 200).values(Quantity=20))
+        self.session.execute(delete(OrderDetail).where(OrderDetail.Id == 201))
+        self.session.commit()
+
+        with patch.object(InventoryState, '_load_sales') as load_sales:
+            units = self.units_sold()
+        load_sales.assert_not_called()
+        self.assertEqual(units[1], {'7': 6, '30': 26})
+        self.assertEqual(units[2], {'7': 4, '30': 4})
+        self.assert_matches_fresh_load()
+
+    def test_clock_moves_forward(self):
+        """A newer order moves the windows forward and older days drop out"""
+        self.state.velocity()
+        self.add_order(5, '2014-05-20', [(2, 2)])
+        self.session.commit()
+
+        self.assertEqual(self.state.velocity()['as_of'], '2014-05-20')
+        units = self.units_sold()
+        self.assertEqual(units[1], {'7': 0, '30': 30})
+        self.assertEqual(units[2], {'7': 2, '30': 3})
+        self.assert_matches_fresh_load()
+
+    def test_results_are_cached_until_a_change(self):
+        """Analysis is reused while nothing changed"""
+        first = self.state.analysis()
+        self.assertIs(self.state.analysis(), first)
+        self.add_order(6, '2014-05-06', [(1, 1)])
+        self.session.commit()
+        self.assertIsNot(self.state.analysis(), first)
+
+    def test_reorder_candidates(self):
+        """Products at their reorder level or short of cover over the lead time are suggested"""
+        result = self.state.reorder(window=30, lead_time_days=14, target_cover_days=30)
+        candidates = {entry['product_id']: entry for entry in result['candidates']}
+
+        # Product 1: 10 units at 1 per day covers 10 days, under the 14 day lead time
+        self.assertEqual(list(candidates), [1, 2])
+        self.assertEqual(candidates[1]['days_of_cover'], 10.0)
+        self.assertFalse(candidates[1]['below_reorder_level'])
+        self.assertEqual(candidates[1]['suggested_quantity'], 44 + 5 - 10)
+        # Product 2: 3 units in stock is below its reorder level of 5
+        self.assertTrue(candidates[2]['below_reorder_level'])
+        self.assertEqual(candidates[2]['suggested_quantity'], 2 + 5 - 3)
+
+        self.assertEqual([entry['product_id'] for entry in self.state.reorder(30, 7, 30)['candidates']], [2])
+
+    def test_stock_changes_are_picked_up(self):
+        """Committed stock updates are re-read"""
+        self.state.reorder()
+        self.session.get(Product, 2).UnitsOnOrder = 20
+        self.session.commit()
+        self.assertNotIn(2, [entry['product_id'] for entry in self.state.reorder()['candidates']])
+
+    def test_unknown_window(self):
+        """Only configured windows can be requested"""
+        with self.assertRaises(ValueError):
+            self.state.velocity(90)
+        with self.assertRaises(ValueError):
+            self.state.reorder(lead_time_days=-1)
+
+    def test_reload_without_change_log(self):
+        """Without change capture the matrix is reloaded when order tables change"""
+        with patch.object(ChangeService, 'ensure_log', return_value=False):
+            self.state.velocity()
+            self.add_order(7, '2014-05-06', [(2, 5)])
+            self.session.commit()
+            self.assertEqual(self.units_sold()[2], {'7': 5, '30': 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+from src.models.changes import ChangeLog
+from src.models.jobs import Job
+from src.models.northwind import Customer, Order, OrderDetail
+from src.routes import api_routes
+from src.services.change_service import ChangeService
+from src.services.job_service import JobRunner
+from tests.helpers import chai, northwind_engine
+
+
+class TestJobRunner(unittest.TestCase):
+    """Test cases for chunked, resumable background jobs"""
+
+    def setUp(self):
+        # Jobs run on worker threads, so use a file database shared by all connections
+        self.engine = northwind_engine(self, 'jobs.sqlite')
+        self.Session = sessionmaker(bind=self.engine)
+
+        session = self.Session()
+        session.add(Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste'))
+        session.add(chai())
+        for order_id in range(1, 26):
+            session.add(Order(Id=order_id, CustomerId='ALFKI', EmployeeId=1,
+                              ShippedDate='2024-01-01' if order_id % 2 else None))
+            session.add(OrderDetail(Id=order_id, OrderId=order_id, ProductId=1, Quantity=order_id, UnitPrice=10))
+        session.commit()
+        session.close()
+
+        self.runner = JobRunner(self.engine, chunk_pause=0)
+        self.addCleanup(self.runner.shutdown)
+
+    def wait(self, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.runner.get(job_id)
+            if job['Status'] in ('succeeded', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail(f'Job {job_id} did not finish')
+
+    def test_recalculate_orders_in_chunks(self):
+        """Recalculation processes every order and reports progress"""
+        job = self.wait(self.runner.submit('recalculate_orders', {'chunk_size': 10}))
+
+        self.assertEqual(job['Status'], 'succeeded')
+        self.assertEqual((job['Processed'], job['Total'], job['Progress']), (25, 25, 100.0))
+        self.assertEqual(job['Result'], {'updated_orders': 25})
+        session = self.Session()
+        self.assertEqual(session.get(Order, 7).AmountTotal, Decimal('70.00'))
+        session.close()
+
+    def test_backfill_customer_rollups(self):
+        """Rollups count orders and sum the unshipped balance"""
+        self.wait(self.runner.submit('recalculate_orders'))
+        job = self.wait(self.runner.submit('backfill_customer_rollups'))
+
+        self.assertEqual(job['Status'], 'succeeded')
+        session = self.Session()
+        customer = session.get(Customer, 'ALFKI')
+        self.assertEqual((customer.OrderCount, customer.UnpaidOrderCount), (25, 12))
+        self.assertEqual(customer.Balance, Decimal(sum(order_id * 10 for order_id in range(2, 26, 2))))
+        session.close()
+
+    def test_sync_rollups_from_change_log(self):
+        """Rollup syncs only visit customers whose orders changed since the previous sync"""
+        self.wait(self.runner.submit('recalculate_orders'))
+        self.wait(self.runner.submit('backfill_customer_rollups'))
+        session = self.Session()
+        ChangeService(session).ensure_log()
+        session.execute(update(Order).where(Order.Id == 2).values(ShippedDate='2024-01-02'))
+        session.commit()
+
+        job = self.wait(self.runner.submit('sync_customer_rollups'))
+        self.assertEqual((job['Status'], job['Processed'], job['Cursor']), ('succeeded', 1, 1))
+        self.assertEqual(job['Result'], {'updated_customers': 1})
+        self.assertEqual(session.get(Customer, 'ALFKI').UnpaidOrderCount, 11)
+
+        job = self.wait(self.runner.submit('sync_customer_rollups'))
+        self.assertEqual((job['Processed'], job['Result']), (0, {}))
+        session.close()
+
+    def test_prune_change_log(self):
+        """Expired changes are pruned in chunks, and syncs behind the pruned range fail instead of skipping them"""
+        session = self.Session()
+        ChangeService(session).ensure_log()
+        for order_id in (2, 4, 6):
+            session.execute(update(Order).where(Order.Id == order_id).values(ShippedDate='2024-01-02'))
+        session.commit()
+        session.execute(update(ChangeLog).where(ChangeLog.Seq <= 2).values(ChangedAt='2000-01-01T00:00:00.000'))
+        session.commit()
+
+        job = self.wait(self.runner.submit('prune_change_log', {'chunk_size': 1}))
+        self.assertEqual((job['Status'], job['Processed'], job['Result']), ('succeeded', 2, {'deleted_changes': 2}))
+        self.assertEqual(session.query(ChangeLog.Seq).all(), [(3,)])
+
+        job = self.wait(self.runner.submit('sync_customer_rollups'))
+        self.assertEqual(job['Status'], 'failed')
+        self.assertIn('pruned', job['Error'])
+        session.close()
+
+    def test_scheduled_jobs(self):
+        """Scheduled jobs are submitted every interval until the runner shuts down"""
+        self.runner.schedule('prune_change_log', 0.05)
+        deadline = time.time() + 5
+        while time.time() < deadline and not self.runner.recent():
+            time.sleep(0.05)
+        job = self.wait(self.runner.recent()[0]['Id'])
+        self.assertEqual((job['Kind'], job['Status']), ('prune_change_log', 'succeeded'))
+        with self.assertRaises(ValueError):
+            self.runner.schedule('no_such_job', 1)
+
+    def test_resume_from_cursor(self):
+        """An interrupted job continues after its last committed chunk"""
+        session = self.Session()
+        job = Job(Kind='recalculate_orders', Status='running', Params='{"chunk_size": 10}',
+                  Cursor='20', Processed=20, Total=25, UpdatedAt='2000-01-01T00:00:00')
+        session.add(job)
+        session.commit()
+        job_id = job.Id
+        session.close()
+
+        self.assertEqual(self.runner.resume_interrupted(), [job_id])
+        job = self.wait(job_id)
+
+        self.assertEqual((job['Status'], job['Processed']), ('succeeded', 25))
+        self.assertEqual(job['Result'], {'updated_orders': 5})
+
+    def test_running_job_is_not_claimed_twice(self):
+        """A job with a fresh heartbeat belongs to another runner"""
+        session = self.Session()
+        job = Job(Kind='recalculate_orders', Status='running', Params='{}', Processed=0,
+                  UpdatedAt='2999-01-01T00:00:00')
+        session.add(job)
+        session.commit()
+        job_id = job.Id
+        session.close()
+
+        self.assertEqual(self.runner.resume_interrupted(), [])
+        self.runner.run(job_id)
+        self.assertEqual(self.runner.get(job_id)['Processed'], 0)
+
+    def test_unknown_kind(self):
+        """Unknown job kinds are rejected"""
+        with self.assertRaises(ValueError):
+            self.runner.submit('no_such_job')
+
+    def test_invalid_params(self):
+        """Params are checked before a job is queued, and the API answers 400 for bad ones"""
+        for kind, params in (('recalculate_orders', ['chunk_size']),
+                             ('recalculate_orders', {'chunk_size': 0}),
+                             ('recalculate_orders', {'chunk_size': '10'}),
+                             ('recalculate_orders', {'chunk_size': True}),
+                             ('recalculate_orders', {'chunk_size': 10 ** 9}),
+                             ('sync_customer_rollups', {'since': -1}),
+                             ('prune_change_log', {'retention_hours': 'week'})):
+            with self.subTest(kind=kind, params=params), self.assertRaises(ValueError):
+                self.runner.submit(kind, params)
+        self.assertEqual(self.runner.recent(), [])
+
+        app = Flask(__name__)
+        app.register_blueprint(api_routes.bp, url_prefix='/api')
+        with patch.object(api_routes, 'get_job_runner', return_value=self.runner):
+            response = app.test_client().post('/api/jobs', json={'kind': 'recalculate_orders',
+                                                                 'params': {'chunk_size': -5}})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('chunk_size', response.get_json()['error'])
+            response = app.test_client().post('/api/jobs', json={'kind': 'recalculate_orders',
+                                                                 'params': {'chunk_size': 10}})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.wait(response.get_json()['job_id'])['Status'], 'succeeded')
+
+
+if __name__ == '__main__':
+    unittest.main()
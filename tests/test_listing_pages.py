@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import create_engine, event
+from src.models.northwind import Base, Category, Customer, Order, Product, Supplier
+from src.routes import main_routes
+from src.services.aggregate_cache import AggregateCache
+from src.services.data_service import DataService
+from src.utils.paging import decode_cursor, encode_cursor
+
+
+class TestListingPages(unittest.TestCase):
+    """Test cases for the keyset-paged customer, product and order listings"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.cache = AggregateCache()
+        for target, value in (('src.services.data_service.get_engine', self.engine),
+                              ('src.services.data_service.get_aggregate_cache', self.cache)):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.session = DataService().session
+        self.addCleanup(self.session.close)
+        # Repeated and missing names and countries, so ties and NULLs are exercised
+        self.session.add_all([Customer(Id=f'C{i:03d}', CompanyName=None if i % 10 == 0 else f'Company {i % 7}',
+                                       Country=['Germany', 'France', None, ''][i % 4], OrderCount=i % 5)
+                              for i in range(1, 48)])
+        self.session.add_all([Category(Id=1, CategoryName_ColumnName='Beverages'), Supplier(Id=1, CompanyName='Exotic')])
+        self.session.add_all([Product(Id=i, ProductName=f'Product {i}', SupplierId=1, CategoryId=1, UnitPrice=i % 6,
+                                      UnitsInStock=i, UnitsOnOrder=0, ReorderLevel=0, Discontinued=int(i % 4 == 0))
+                              for i in range(1, 21)])
+        self.session.add_all([Order(Id=i, CustomerId=f'C{i % 47 + 1:03d}', EmployeeId=1,
+                                    OrderDate=None if i % 9 == 0 else f'2024-01-{i % 5 + 1:02d}',
+                                    ShipCountry='France' if i % 2 else 'Germany', AmountTotal=i % 3 or None)
+                              for i in range(1, 61)])
+        self.session.commit()
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.count_statement)
+        self.addCleanup(event.remove, self.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def walk(self, listing, **kwargs):
+        """Follow next cursors to the end, then previous cursors back to the start"""
+        forward, pages = [], []
+        page = listing(per_page=7, **kwargs)
+        while True:
+            pages.append(page)
+            forward.extend(page['rows'])
+            if page['next_cursor'] is None:
+                break
+            page = listing(per_page=7, after=page['next_cursor'], **kwargs)
+        backward = list(page['rows'])
+        while page['prev_cursor'] is not None:
+            page = listing(per_page=7, before=page['prev_cursor'], **kwargs)
+            backward[:0] = page['rows']
+        return forward, backward, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        """Walking forward or back visits every row once, in the order of a full sort"""
+        service = DataService()
+        for sort, key in (('id', lambda row: row['Id']),
+                          ('company', lambda row: (row['CompanyName'] or '', row['Id'])),
+                          ('country', lambda row: (row['Country'] or '', row['Id'])),
+                          ('orders', lambda row: (row['OrderCount'], row['Id']))):
+            for order in ('asc', 'desc'):
+                forward, backward, pages = self.walk(service.get_customer_listing, sort=sort, order=order)
+                expected = sorted(forward, key=key, reverse=order == 'desc')
+                self.assertEqual(len(forward), 47)
+                self.assertEqual(forward, expected, (sort, order))
+                self.assertEqual(backward, forward, (sort, order))
+                self.assertIsNone(pages[0]['prev_cursor'])
+
+    def test_filters_and_defaults(self):
+        """Filters narrow the listing and its total; orders default to newest first"""
+        service = DataService()
+        unknown = service.get_customer_listing(country='Unknown', per_page=100)
+        self.assertEqual(unknown['total'], 24)
+        self.assertTrue(all(not row['Country'] for row in unknown['rows']))
+
+        discontinued = service.get_product_listing(status='discontinued', sort='price', order='desc')
+        self.assertEqual([row['Id'] for row in discontinued['rows']], [16, 4, 20, 8, 12])
+        self.assertEqual(discontinued['rows'][0]['CategoryName'], 'Beverages')
+
+        forward, _, _ = self.walk(service.get_order_listing, country='France')
+        self.assertEqual(len(forward), 27)
+        self.assertEqual(forward, sorted(forward, key=lambda row: (row['OrderDate'], row['Id']), reverse=True))
+
+    def test_invalid_arguments(self):
+        """Unknown sorts, orders, statuses and tampered cursors are rejected"""
+        service = DataService()
+        with self.assertRaises(ValueError):
+            service.get_customer_listing(sort='Phone')
+        with self.assertRaises(ValueError):
+            service.get_customer_listing(order='sideways')
+        with self.assertRaises(ValueError):
+            service.get_product_listing(status='sold')
+        with self.assertRaises(ValueError):
+            service.get_customer_listing(after='not-a-cursor')
+        with self.assertRaises(ValueError):
+            service.get_customer_listing(sort='company', after=encode_cursor(['C001']))
+        self.assertEqual(decode_cursor(encode_cursor(['a', 1, 2.5]), 3), ['a', 1, 2.5])
+
+    def test_pages_seek_instead_of_offset(self):
+        """A deep page is one seek query, and the count is served from the cache"""
+        service = DataService()
+        first = service.get_order_listing(per_page=5)
+        self.statements.clear()
+
+        page = service.get_order_listing(per_page=5, after=first['next_cursor'])
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn('< (?, ?)', self.statements[0])
+        self.assertEqual(page['total'], first['total'])
+
+    def test_counts_follow_writes(self):
+        """Cached counts and aggregates are recomputed once their table changes"""
+        service = DataService()
+        self.assertEqual(service.get_customer_listing()['total'], 47)
+        stats = service.cached_aggregate(('Customer',), service.get_customer_stats)
+        self.assertIs(service.cached_aggregate(('Customer',), service.get_customer_stats), stats)
+
+        self.session.add(Customer(Id='NEW', CompanyName='New', Country='Germany'))
+        self.session.commit()
+        self.assertEqual(service.get_customer_listing()['total'], 48)
+        self.assertEqual(service.cached_aggregate(('Customer',), service.get_customer_stats)['total_customers'], 48)
+
+    def test_pages_render(self):
+        """The listing pages render their page and keep sort and filter in their links"""
+        app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'))
+        app.register_blueprint(main_routes.bp)
+        client = app.test_client()
+
+        response = client.get('/customers?sort=company&country=Germany')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'11 of 47 Customers', response.data)
+        response = client.get('/orders')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'after=', response.data)
+        self.assertEqual(client.get('/products?status=active').status_code, 200)
+        self.assertEqual(client.get('/customers?sort=bogus').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import random
+import sys
+import os
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer, Order, OrderDetail, Product
+from src.services.credit_service import CreditService
+from src.utils import money
+
+
+def decimal_line_amount(quantity, unit_price, discount):
+    """Reference Decimal line amount, as CreditService computed it per row"""
+    amount = Decimal(str(quantity)) * Decimal(str(unit_price))
+    if discount:
+        amount *= Decimal('1.00') - (Decimal(str(discount)) / Decimal('100'))
+    return amount
+
+
+def random_line(rng):
+    """Random (quantity, unit price, discount) with cent prices and two-decimal discounts"""
+    return (
+        rng.randint(0, 1000),
+        rng.randint(0, 10_000_000) / 100,
+        rng.choice([0, rng.randint(0, 10_000) / 100]),
+    )
+
+
+class TestMoneyParity(unittest.TestCase):
+    """Property tests: integer money arithmetic matches the Decimal results exactly"""
+
+    EXAMPLES = 500
+
+    def setUp(self):
+        self.rng = random.Random(20240601)
+
+    def test_line_amount_matches_decimal(self):
+        """Scalar line amounts in micros equal the Decimal amounts"""
+        for _ in range(self.EXAMPLES):
+            quantity, unit_price, discount = random_line(self.rng)
+            micros = money.line_amount_micros(quantity, money.to_cents(unit_price), money.discount_units(discount))
+            self.assertEqual(money.micros_to_decimal(micros), decimal_line_amount(quantity, unit_price, discount))
+
+    def test_vectorized_totals_match_decimal(self):
+        """Grouped NumPy totals equal per-order Decimal sums"""
+        lines = sorted((self.rng.randint(1, 50),) + random_line(self.rng) for _ in range(self.EXAMPLES))
+        order_ids = [line[0] for line in lines]
+        micros = money.line_amounts_micros(
+            [line[1] for line in lines],
+            [money.to_cents(line[2]) for line in lines],
+            [money.discount_units(line[3]) for line in lines],
+        )
+        keys, sums = money.sum_by_key(order_ids, micros)
+
+        expected = {}
+        for order_id, quantity, unit_price, discount in lines:
+            expected[order_id] = expected.get(order_id, Decimal('0')) + decimal_line_amount(quantity, unit_price, discount)
+
+        self.assertEqual(
+            {int(key): money.micros_to_decimal(total) for key, total in zip(keys, sums)},
+            expected
+        )
+
+    def test_cent_rounding(self):
+        """Rounding micros to cents matches Decimal half-up rounding"""
+        for _ in range(self.EXAMPLES):
+            micros = self.rng.randint(-10 ** 12, 10 ** 12)
+            expected = int(money.micros_to_decimal(micros).quantize(Decimal('0.01'), rounding='ROUND_HALF_UP') * 100)
+            self.assertEqual(money.micros_to_cents(micros), expected)
+            self.assertEqual(int(money.micros_to_cents_array([micros])[0]), expected)
+
+
+class TestCreditServiceMoney(unittest.TestCase):
+    """CreditService SQL and bulk paths against the Decimal reference"""
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.credit_service = CreditService(self.session)
+        rng = random.Random(7)
+
+        self.session.add(Customer(Id='TEST', CompanyName='Test Co', CreditLimit=Decimal('50000')))
+        products = [
+            Product(Id=i, ProductName=f'P{i}', SupplierId=1, CategoryId=1, UnitPrice=rng.randint(1, 20000) / 100,
+                    UnitsInStock=0, UnitsOnOrder=0, ReorderLevel=0, Discontinued=0)
+            for i in range(1, 11)
+        ]
+        self.session.add_all(products)
+
+        self.expected = {}
+        line_id = 1
+        for order_id in range(1, 21):
+            self.session.add(Order(Id=order_id, CustomerId='TEST', EmployeeId=1))
+            total = Decimal('0')
+            for _ in range(rng.randint(0, 6)):
+                product = rng.choice(products)
+                quantity, unit_price, discount = random_line(rng)
+                # Some lines carry no price and fall back to the product price
+                unit_price = rng.choice([unit_price, None])
+                self.session.add(OrderDetail(Id=line_id, OrderId=order_id, ProductId=product.Id,
+                                             Quantity=quantity, UnitPrice=unit_price, Discount=discount))
+                total += decimal_line_amount(quantity, unit_price or product.UnitPrice, discount)
+                line_id += 1
+            self.expected[order_id] = total
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_order_total_matches_decimal(self):
+        """SQL-side order totals equal the Decimal totals"""
+        for order_id, total in self.expected.items():
+            self.assertEqual(self.credit_service.calculate_order_amount_total(order_id), total)
+
+    def test_bulk_update_matches_decimal(self):
+        """Bulk recalculation stores the Decimal totals rounded to cents"""
+        result = self.credit_service.update_order_amounts()
+
+        self.assertEqual(result['total_orders_processed'], len(self.expected))
+        self.assertEqual(result['updated_orders'], len(self.expected))
+        for order in self.session.query(Order):
+            self.assertEqual(order.AmountTotal, self.expected[order.Id].quantize(Decimal('0.01'), rounding='ROUND_HALF_UP'))
+        self.assertEqual(self.credit_service.update_order_amounts()['updated_orders'], 0)
+
+    def test_credit_check_in_cents(self):
+        """Credit check balances are exact sums of the stored cent totals"""
+        credit = self.credit_service.check_credit_limit('TEST')
+
+        expected_cents = sum(money.to_cents(total) for total in self.expected.values())
+        self.assertEqual(credit['current_balance_cents'], expected_cents)
+        self.assertEqual(credit['credit_available_cents'], 5_000_000 - expected_cents)
+        self.assertEqual(credit['unshipped_order_count'], len(self.expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
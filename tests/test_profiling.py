@@ -0,0 +1,152 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask, render_template_string
+from sqlalchemy import create_engine, text
+from src.routes import profiling as profiling_routes
+from src.utils.profiling import RequestProfile, begin_span, end_span, profiling, span, traced
+
+
+@traced
+class Ledger:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def total(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text('SELECT 1 + 1')).scalar() + self._bonus()
+
+    def _bonus(self):
+        return 0
+
+    @staticmethod
+    def currency():
+        return 'EUR'
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSpans(unittest.TestCase):
+    """Test cases for spans, traced classes and stack samples"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.addCleanup(self.engine.dispose)
+
+    def test_traced_methods_and_statements_are_spans(self):
+        """Public methods and SQL statements record nested spans only while a profile is active"""
+        ledger = Ledger(self.engine)
+        self.assertEqual(ledger.total(), 2)
+
+        with profiling(RequestProfile('GET /ledger', 0.001)) as profile:
+            with span('outer'):
+                self.assertEqual(ledger.total(), 2)
+            self.assertEqual(Ledger.currency(), 'EUR')
+
+        names = [(entry['name'], entry['depth']) for entry in profile.summary()['spans']]
+        self.assertEqual(names, [('outer', 0), ('Ledger.total', 1), ('sql', 2)])
+        self.assertEqual(profile.span_totals()['sql'][0], 1)
+        self.assertEqual(Ledger.total.__name__, 'total')
+
+    def test_unclosed_spans_are_closed_with_their_parent(self):
+        """A span left open (a statement that failed before running) ends with the span around it"""
+        with profiling(RequestProfile('job', 0.001)) as profile:
+            begin_span('method')
+            begin_span('sql')
+            end_span('method')
+            end_span('unknown')
+        self.assertEqual(sorted(name for name, *_ in profile.spans), ['method', 'sql'])
+        self.assertEqual(profile.open_spans, [])
+
+    def test_samples_carry_open_spans_and_frames(self):
+        """Stack samples are collapsed stacks rooted at the request, with spans above the frames"""
+        with profiling(RequestProfile('GET /busy', 0.001)) as profile:
+            with span('DataService.busy'):
+                busy(0.1)
+
+        self.assertGreater(sum(profile.samples.values()), 10)
+        lines = profile.collapsed().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('GET /busy;[DataService.busy];'))
+        self.assertIn('test_profiling.busy', stack)
+        self.assertGreater(int(count), 0)
+
+
+class TestProfilingRoutes(unittest.TestCase):
+    """Test cases for on-demand request profiling"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for name, value in (('PROFILE_TOKEN', 'secret'), ('PROFILE_DIR', self.directory),
+                            ('PROFILE_INTERVAL_MS', 1.0), ('PROFILE_SAMPLE_RATE', 0.0)):
+            patcher = patch.object(profiling_routes, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+
+        @app.route('/report')
+        def report():
+            busy(0.02)
+            return render_template_string('{{ value }}', value='done')
+
+        profiling_routes.install_profiling(app)
+        self.client = app.test_client()
+
+    def test_profiling_needs_the_token(self):
+        """Profiles are refused without the admin token or with an unknown mode"""
+        self.assertEqual(self.client.get('/report', headers={'X-Profile': 'sample'}).status_code, 403)
+        self.assertEqual(self.client.get('/report?profile=sample&profile_token=wrong').status_code, 403)
+        self.assertEqual(self.client.get('/report?profile=trace&profile_token=secret').status_code, 400)
+        response = self.client.get('/report')
+        self.assertEqual(response.data, b'done')
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_profiled_request_writes_flamegraph_and_spans(self):
+        """A cProfile request writes collapsed stacks, a span summary and pstats"""
+        response = self.client.get('/report', headers={'X-Profile': 'cprofile', 'X-Profile-Token': 'secret'})
+        self.assertEqual(response.data, b'done')
+        profile_id = response.headers['X-Profile-Id']
+        self.assertIn('render <string>', response.headers['Server-Timing'])
+        self.assertTrue(response.headers['Server-Timing'].startswith('total;dur='))
+
+        base = os.path.join(self.directory, profile_id)
+        with open(f'{base}.collapsed') as collapsed:
+            self.assertTrue(collapsed.readline().startswith('GET /report;'))
+        with open(f'{base}.json') as summary:
+            summary = json.load(summary)
+        self.assertEqual((summary['request'], summary['status']), ('GET /report', 200))
+        self.assertEqual([entry['name'] for entry in summary['spans']], ['render <string>'])
+        self.assertTrue(os.path.exists(f'{base}.prof'))
+
+    def test_sampled_requests_and_pruning(self):
+        """Sampled requests are profiled to disk only, and only the newest profiles are kept"""
+        with patch.object(profiling_routes, 'PROFILE_SAMPLE_RATE', 1.0), patch.object(profiling_routes, 'PROFILE_KEEP', 2):
+            responses = [self.client.get('/report') for _ in range(3)]
+            admin = self.client.get('/report?profile_token=secret')
+        for response in responses:
+            self.assertEqual(response.data, b'done')
+            self.assertNotIn('X-Profile-Id', response.headers)
+            self.assertNotIn('Server-Timing', response.headers)
+        kept = sorted(name.rsplit('.', 1)[0] for name in os.listdir(self.directory) if name.endswith('.json'))
+        self.assertEqual(len(kept), 2)
+        self.assertEqual(kept[-1], admin.headers['X-Profile-Id'])
+        self.assertFalse(any(name.endswith('.prof') for name in os.listdir(self.directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
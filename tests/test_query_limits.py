@@ -0,0 +1,227 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer
+from src.routes import limits
+from src.routes.limits import PoolSettings, RoutePool, limited
+from src.services import job_service
+from src.services.job_service import JobHandler, JobRunner
+from src.utils.db import QueryTimeoutError, query_budget
+
+# Counts forever; only a cancellation ends it
+ENDLESS = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+               "SELECT count(*) FROM (SELECT x FROM c LIMIT -1)")
+
+
+class TestQueryBudgets(unittest.TestCase):
+    """Test cases for cancelling statements that overrun their time budget"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = create_engine(f'sqlite:///{os.path.join(directory.name, "budget.sqlite")}',
+                                    connect_args={'timeout': 0})
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+
+    def test_overrunning_statement_is_cancelled(self):
+        """A statement is interrupted at the deadline and its connection stays usable"""
+        with self.engine.connect() as connection:
+            started = time.monotonic()
+            with self.assertRaises(QueryTimeoutError):
+                with query_budget(0.2) as budget:
+                    connection.execute(ENDLESS)
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertTrue(budget.interrupted)
+            self.assertEqual(connection.execute(text('SELECT 1')).scalar(), 1)
+
+            # Nothing starts once the budget is spent, and lifting it restores unbounded statements
+            with query_budget(0.2):
+                time.sleep(0.25)
+                with self.assertRaises(QueryTimeoutError):
+                    connection.execute(text('SELECT 1'))
+                with query_budget(None):
+                    self.assertEqual(connection.execute(text('SELECT 2')).scalar(), 2)
+
+    def test_cancelled_transaction_releases_write_lock(self):
+        """Rolling back after a cancellation lets other writers in at once"""
+        session = sessionmaker(bind=self.engine)()
+        self.addCleanup(session.close)
+        session.add(Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste'))
+        session.flush()
+        with self.assertRaises(QueryTimeoutError):
+            with query_budget(0.1):
+                session.execute(ENDLESS)
+        session.rollback()
+
+        with self.engine.begin() as connection:
+            connection.execute(Customer.__table__.insert(), {'Id': 'BONAP', 'CompanyName': 'Bon app'})
+        self.assertEqual(session.query(Customer.Id).all(), [('BONAP',)])
+
+
+class TestRouteLimits(unittest.TestCase):
+    """Test cases for per-route concurrency limits and budgets"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = create_engine(f'sqlite:///{os.path.join(directory.name, "limits.sqlite")}')
+        self.addCleanup(self.engine.dispose)
+        for patcher in (patch.dict(limits.POOLS, {'slow': PoolSettings(0.2, 1, 0), 'closed': PoolSettings(1.0, 0, 0)}),
+                        patch.object(limits, 'pools', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def client(self):
+        app = Flask(__name__)
+
+        @app.route('/endless')
+        @limited('slow')
+        def endless():
+            with self.engine.connect() as connection:
+                return jsonify({'count': connection.execute(ENDLESS).scalar()})
+
+        @app.route('/page')
+        @limited('slow')
+        def page():
+            # Like the HTML pages, which render an empty page on any error
+            try:
+                with self.engine.connect() as connection:
+                    connection.execute(ENDLESS)
+            except Exception:
+                pass
+            return 'empty page'
+
+        @app.route('/quick')
+        @limited('slow')
+        def quick():
+            return 'ok'
+
+        @app.route('/closed')
+        @limited('closed')
+        def closed():
+            return 'ok'
+
+        return app.test_client()
+
+    def test_overrunning_views_answer_503(self):
+        """Cancelled requests answer 503 with Retry-After even when the view swallows the error"""
+        client = self.client()
+        for path in ('/endless', '/page'):
+            response = client.get(path)
+            self.assertEqual(response.status_code, 503, path)
+            self.assertIn('time budget', response.get_json()['error'])
+            self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual(client.get('/quick').data, b'ok')
+
+        stats = limits.limits_stats()['slow']
+        self.assertEqual((stats['admitted'], stats['cancelled'], stats['active']), (3, 2, 0))
+
+    def test_saturated_pool_answers_503(self):
+        """A pool without free slots or queue room turns requests away"""
+        response = self.client().get('/closed')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(limits.limits_stats()['closed']['rejected_full'], 1)
+
+    def test_pool_queues_then_admits_or_times_out(self):
+        """Queued requests get the next free slot, or are turned away after the queue timeout"""
+        pool = RoutePool('test', PoolSettings(1.0, 1, 1), queue_timeout=0.1)
+        self.assertTrue(pool.acquire())
+        self.assertFalse(pool.acquire())
+        self.assertEqual(pool.stats()['rejected_timeout'], 1)
+
+        pool.queue_timeout = 5
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(pool.acquire()))
+        waiter.start()
+        while pool.stats()['queue_depth'] == 0:
+            time.sleep(0.01)
+        self.assertFalse(pool.acquire())
+        pool.release(0.01, False)
+        waiter.join()
+
+        self.assertEqual(admitted, [True])
+        stats = pool.stats()
+        self.assertEqual((stats['active'], stats['admitted'], stats['rejected_full'], stats['max_queue_depth']),
+                         (1, 2, 1, 1))
+
+    def test_parse_limits(self):
+        """ROUTE_LIMITS overrides parse with an optional queue"""
+        self.assertEqual(limits._parse_limits('analytics=10:2:4, credit-check=0.5:8'),
+                         {'analytics': PoolSettings(10.0, 2, 4), 'credit-check': PoolSettings(0.5, 8, 0)})
+        self.assertEqual(limits._parse_limits(''), {})
+        with self.assertRaises(ValueError):
+            limited('nonexistent')
+
+
+class SplittingJob(JobHandler):
+    """Processes ten items, but any chunk of more than two never finishes"""
+
+    chunk_size = 8
+    chunk_budget = 0.1
+
+    def count(self, session, params):
+        return 10
+
+    def run_chunk(self, session, params, cursor):
+        size = params.get('chunk_size', self.chunk_size)
+        if size > 2:
+            session.execute(ENDLESS)
+        position = min((cursor or 0) + size, 10)
+        return (position if position < 10 else None), position - (cursor or 0), {'chunks': 1}
+
+
+class EndlessJob(SplittingJob):
+    def run_chunk(self, session, params, cursor):
+        session.execute(ENDLESS)
+
+
+class TestJobChunkBudget(unittest.TestCase):
+    """Test cases for halving job chunks that overrun their budget"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        engine = create_engine(f'sqlite:///{os.path.join(directory.name, "jobs.sqlite")}')
+        self.addCleanup(engine.dispose)
+        patcher = patch.dict(job_service.JOB_HANDLERS, {'splitting': SplittingJob(), 'endless': EndlessJob()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runner = JobRunner(engine, chunk_pause=0)
+        self.addCleanup(self.runner.shutdown)
+
+    def wait(self, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.runner.get(job_id)
+            if job['Status'] in ('succeeded', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail(f'Job {job_id} did not finish')
+
+    def test_overrunning_chunks_are_halved(self):
+        """Chunks shrink until they fit the budget, and later chunks keep the smaller size"""
+        job = self.wait(self.runner.submit('splitting'))
+        self.assertEqual(job['Status'], 'succeeded')
+        self.assertEqual((job['Processed'], job['Result']), (10, {'chunks': 5}))
+
+    def test_job_fails_when_single_items_overrun(self):
+        """A job whose smallest chunk still overruns fails with the timeout"""
+        job = self.wait(self.runner.submit('endless'))
+        self.assertEqual(job['Status'], 'failed')
+        self.assertIn('time budget', job['Error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.models.northwind import Base, Customer
+from src.routes import api_routes
+from src.services.search_service import CUSTOMER_INDEX, SearchService
+
+
+class TestSearchService(unittest.TestCase):
+    """Test cases for full-text customer search"""
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([
+            Customer(Id='ALFKI', CompanyName='Alfreds Futterkiste', ContactName='Maria Anders',
+                     City='Berlin', Country='Germany'),
+            Customer(Id='BERGS', CompanyName='Berglunds snabbköp', ContactName='Christina Berglund',
+                     City='Luleå', Country='Sweden'),
+            Customer(Id='BLAUS', CompanyName='Blauer See Delikatessen', ContactName='Hanna Moos',
+                     City='Mannheim', Country='Germany'),
+        ])
+        self.session.commit()
+        self.search_service = SearchService(self.session)
+        self.assertTrue(self.search_service.rebuild_index(CUSTOMER_INDEX))
+
+    def tearDown(self):
+        self.session.close()
+
+    def search_ids(self, query):
+        return [customer['Id'] for customer in self.search_service.search_customers(query)]
+
+    def test_prefix_match_across_columns(self):
+        """Partial words match company, contact, city and country"""
+        self.assertEqual(self.search_ids('futt'), ['ALFKI'])
+        self.assertEqual(self.search_ids('mann'), ['BLAUS'])
+        self.assertEqual(sorted(self.search_ids('germ')), ['ALFKI', 'BLAUS'])
+
+    def test_all_words_must_match(self):
+        """Multi-word queries narrow the results"""
+        self.assertEqual(self.search_ids('germ maria'), ['ALFKI'])
+        self.assertEqual(self.search_ids('sweden maria'), [])
+
+    def test_ranking_prefers_company_name(self):
+        """A company name match outranks a city match"""
+        self.assertEqual(self.search_ids('ber')[0], 'BERGS')
+
+    def test_every_match_is_ranked(self):
+        """The best match wins however many weaker matches have lower keys"""
+        self.session.add_all([Customer(Id=f'C{i:04d}', CompanyName=f'Shop {i}', City='Bergen', Country='Norway')
+                              for i in range(600)])
+        self.session.add(Customer(Id='ZBERG', CompanyName='Bergkvist', ContactName='Anna Berg', City='Bergen'))
+        self.session.commit()
+
+        self.assertEqual(self.search_ids('berg')[0], 'ZBERG')
+
+    def test_short_queries_return_nothing(self):
+        """A query needs one word of MIN_PREFIX_LENGTH characters"""
+        self.assertEqual(self.search_ids('a'), [])
+        self.assertEqual(self.search_ids('al fu'), [])
+        self.assertEqual(self.search_ids('al futt'), ['ALFKI'])
+
+    def test_search_without_index_uses_like(self):
+        """Searches never build the index; without one they fall back to LIKE"""
+        session = sessionmaker(bind=self.session.get_bind())()
+        self.addCleanup(session.close)
+        session.execute(text("DROP TABLE CustomerSearch"))
+        session.commit()
+
+        results = SearchService(session).search_customers('futt')
+        self.assertEqual([(customer['Id'], customer['score']) for customer in results], [('ALFKI', None)])
+        self.assertIsNone(session.execute(text("SELECT name FROM sqlite_master WHERE name = 'CustomerSearch'")).scalar())
+
+    def test_diacritics_and_punctuation(self):
+        """Accents are folded and query punctuation is ignored"""
+        self.assertEqual(self.search_ids('lulea'), ['BERGS'])
+        self.assertEqual(self.search_ids('"blauer" (see'), ['BLAUS'])
+        self.assertEqual(self.search_ids('"*'), [])
+
+    def test_index_follows_customer_changes(self):
+        """Inserts, updates and deletes are reflected through the sync triggers"""
+        self.session.add(Customer(Id='WOLZA', CompanyName='Wolski Zajazd', City='Warszawa', Country='Poland'))
+        customer = self.session.get(Customer, 'BLAUS')
+        customer.City = 'Stuttgart'
+        self.session.delete(self.session.get(Customer, 'ALFKI'))
+        self.session.commit()
+
+        self.assertEqual(self.search_ids('wars'), ['WOLZA'])
+        self.assertEqual(self.search_ids('stutt'), ['BLAUS'])
+        self.assertEqual(self.search_ids('mann'), [])
+        self.assertEqual(self.search_ids('futt'), [])
+
+    def test_index_survives_renumbered_rowids(self):
+        """Customers are indexed by a stable key, so maintenance that renumbers rowids (VACUUM) is harmless"""
+        self.session.execute(text("UPDATE Customer SET rowid = rowid + 100"))
+        self.session.commit()
+
+        self.assertEqual(self.search_ids('futt'), ['ALFKI'])
+        self.session.delete(self.session.get(Customer, 'BLAUS'))
+        self.session.commit()
+        self.assertEqual(self.search_ids('mann'), [])
+        self.assertEqual(sorted(self.search_ids('germ')), ['ALFKI'])
+
+    def test_rowid_keyed_index_is_replaced(self):
+        """An index created over the implicit rowid by an earlier version is ignored until rebuilt on the key table"""
+        for trigger in ('ai', 'ad', 'au'):
+            self.session.execute(text(f"DROP TRIGGER CustomerSearch_{trigger}"))
+        self.session.execute(text("DROP TABLE CustomerSearch"))
+        self.session.execute(text(
+            "CREATE VIRTUAL TABLE CustomerSearch USING fts5(CompanyName, ContactName, City, Country, "
+            "content='Customer', content_rowid='rowid')"
+        ))
+        self.session.commit()
+        self.assertEqual(self.search_service.search_customers('futt')[0]['score'], None)
+
+        self.assertTrue(self.search_service.rebuild_index(CUSTOMER_INDEX))
+        self.assertEqual(self.search_ids('futt'), ['ALFKI'])
+        definition = self.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'CustomerSearch'")).scalar()
+        self.assertIn("content='CustomerSearchSource'", definition)
+
+
+class TestSearchRoutes(unittest.TestCase):
+    """Test cases for the typeahead endpoints"""
+
+    def test_limit_is_clamped(self):
+        """Negative and oversized limits are brought into range"""
+        app = Flask(__name__)
+        app.register_blueprint(api_routes.bp, url_prefix='/api')
+        client = app.test_client()
+        with patch.object(api_routes, 'DataService') as data_service:
+            data_service.return_value.search_customers.return_value = []
+            data_service.return_value.search_products.return_value = []
+            for path in ('/api/customers/search', '/api/products/search'):
+                client.get(f'{path}?q=a&limit=-1')
+                client.get(f'{path}?q=a&limit=500')
+        for search in (data_service.return_value.search_customers, data_service.return_value.search_products):
+            self.assertEqual([call.kwargs['limit'] for call in search.call_args_list], [1, 50])
+
+
+if __name__ == '__main__':
+    unittest.main()